@@ -0,0 +1,132 @@
+"""
+動画処理ジョブの受け付け制御
+入力動画のフレーム数×解像度から処理コスト（1ワーカーでの処理秒数）を見積もり、
+待ち行列の長さと、新しいジョブが処理を始めるまでの見積もり待ち時間が上限を超える場合は
+ジョブを受け付けずに 429 で再試行を促す。混雑時もすべてのジョブが遅くなるのではなく、
+受け付けたジョブの待ち時間が上限内に収まるようにする
+"""
+
+import math
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+import cv2
+
+from media_probe import probe_media
+
+# 待ち行列（処理を始めていないジョブ）の最大数
+MAX_QUEUED_JOBS = int(os.environ.get("MOSAIC_MAX_QUEUED_JOBS", 16))
+# 新しいジョブが処理を始めるまでの見積もり待ち時間の上限（秒）
+MAX_QUEUE_WAIT_SEC = float(os.environ.get("MOSAIC_MAX_QUEUE_WAIT_SEC", 600))
+# 1ワーカーの処理速度の見積もり（メガピクセル/秒。1080p で約 30fps 相当）
+WORKER_MPIX_PER_SEC = float(os.environ.get("MOSAIC_WORKER_MPIX_PER_SEC", 60))
+
+
+@dataclass
+class Workload:
+    """終了していないジョブ1件の状態"""
+    cost_sec: float
+    running: bool
+    # 処理済みの割合（0〜1、不明なら0）
+    done_ratio: float = 0.0
+
+    @property
+    def remaining_sec(self) -> float:
+        return self.cost_sec * (1 - min(1.0, max(0.0, self.done_ratio)))
+
+
+class AdmissionRejected(Exception):
+    """混雑のためジョブを受け付けない"""
+
+    def __init__(self, reason: str, retry_after_sec: int, queue_position: int, estimated_wait_sec: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after_sec = retry_after_sec
+        self.queue_position = queue_position
+        self.estimated_wait_sec = estimated_wait_sec
+
+
+def estimate_video_cost(video_path: str, file_hash: Optional[str] = None, segments: int = 1) -> float:
+    """
+    動画の処理コストを見積もる
+
+    Args:
+        file_hash: ファイルの内容のハッシュ（計算済みの場合。media_probe のキャッシュのキー）
+        segments: 分割して並列処理するセグメント数（セグメントはジョブのワーカーで処理するため、
+            分割しても合計の処理量は減らない。各セグメントのウォームアップ分を加える）
+
+    Returns:
+        1ワーカーで処理した場合の見積もり秒数（フレーム数・解像度が取れない場合は0）
+    """
+    from segments import SEGMENT_OVERLAP_FRAMES, effective_segments
+
+    try:
+        info = probe_media(video_path, file_hash)
+        width, height, frames = info["width"], info["height"], info["total_frames"]
+    except Exception:
+        width = height = frames = 0
+    if frames <= 0:
+        # フレーム数がコンテナに無い形式（MKV など）は OpenCV の推定値を使う
+        cap = cv2.VideoCapture(video_path)
+        try:
+            width = cap.get(cv2.CAP_PROP_FRAME_WIDTH)
+            height = cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
+            frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        finally:
+            cap.release()
+    if width <= 0 or height <= 0 or frames <= 0:
+        return 0.0
+    parallel = effective_segments(int(frames), segments) if segments > 1 else 1
+    frames += SEGMENT_OVERLAP_FRAMES * (parallel - 1)
+    return frames * width * height / 1e6 / WORKER_MPIX_PER_SEC
+
+
+class AdmissionController:
+    """
+    待ち行列の長さと見積もり待ち時間でジョブの受け付けを判断する
+
+    同時に処理するジョブ数はワーカー数で決まるため、ここでは待ち行列の側を制限する。
+    待ち時間は、終了していないジョブの残りコストの合計をワーカー数で割って見積もる。
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        max_queued: int = MAX_QUEUED_JOBS,
+        max_wait_sec: float = MAX_QUEUE_WAIT_SEC
+    ):
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self.max_wait_sec = max_wait_sec
+
+    def estimated_wait(self, workload: list) -> float:
+        """新しいジョブが処理を始めるまでの見積もり待ち時間（秒）"""
+        queued = sum(1 for w in workload if not w.running)
+        if queued == 0 and len(workload) < self.workers:
+            # 空いているワーカーがある
+            return 0.0
+        return sum(w.remaining_sec for w in workload) / self.workers
+
+    def check(self, workload: list, queue_only: bool = False) -> None:
+        """
+        ジョブを受け付けられるか確認（受け付けられない場合は AdmissionRejected を送出）
+
+        Args:
+            workload: 終了していないジョブの Workload のリスト
+            queue_only: 待ち行列の長さだけを見る（アップロードを受信する前の確認用）
+        """
+        queued = sum(1 for w in workload if not w.running)
+        wait = self.estimated_wait(workload)
+        running = [w.remaining_sec for w in workload if w.running]
+
+        if queued >= self.max_queued:
+            # 待ち行列の先頭が処理を始める（実行中のジョブが1つ終わる）頃に再試行
+            retry_after = min(running) if running else wait / max(1, queued)
+            self._reject("queue_full", retry_after, queued + 1, wait)
+        if not queue_only and wait > self.max_wait_sec:
+            # 空いているワーカーがあれば待ち時間は0のため、大きな動画も永久に拒否されることはない
+            self._reject("overloaded", wait - self.max_wait_sec, queued + 1, wait)
+
+    def _reject(self, reason: str, retry_after: float, position: int, wait: float) -> None:
+        raise AdmissionRejected(reason, max(1, math.ceil(retry_after)), position, round(wait, 1))
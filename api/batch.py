@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+動画・画像の一括処理
+
+ディレクトリやワイルドカードで指定した動画・画像を、HTTP API を経由せずに
+process_video / process_frame で直接処理する（アーカイブの一括処理向け）。
+ファイル単位でワーカープロセスに振り分けて並行に処理し、ファイルごとの結果を
+マニフェスト（JSON Lines）に1行ずつ追記する。中断後に同じコマンドを再実行すると、
+マニフェストに完了済みとして記録されたファイルは処理せずに飛ばす。
+
+使い方:
+    python batch.py videos/ -o out/                       # videos/ 以下を再帰的に処理
+    python batch.py "archive/2024-*/*.mp4" -o out/ --workers 4
+    python batch.py photos/ -o out/ --image-format jpeg --tile-size 640
+"""
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+from compositor import DEFAULT_PADDING
+from detectors import BACKENDS, DETECTOR_BACKEND
+from ingest import IMAGE_FORMATS
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".webm", ".avi")
+# 画像の拡張子 -> 形式
+IMAGE_EXTENSIONS = {".jpg": "jpeg", ".jpeg": "jpeg", ".png": "png", ".webp": "webp"}
+# 処理待ちとしてワーカーに渡しておくファイル数（ワーカー数に対する倍率）
+SUBMIT_AHEAD = 2
+
+
+def image_format_for(input_path: str, image_format: Optional[str]) -> str:
+    """画像の出力形式（指定が無ければ入力と同じ形式）"""
+    return image_format or IMAGE_EXTENSIONS[Path(input_path).suffix.lower()]
+
+
+def glob_root(pattern: str) -> Path:
+    """ワイルドカードを含まない先頭のディレクトリ（"archive/2024-*/*.mp4" なら "archive"）"""
+    parts = Path(pattern).parts
+    for i, part in enumerate(parts):
+        if glob.has_magic(part):
+            return Path(*parts[:i]) if i else Path(".")
+    # ワイルドカードを含まないファイルのパス
+    return Path(pattern).parent
+
+
+def find_media(inputs: list, output_dir: Path, image_format: Optional[str] = None) -> list:
+    """
+    入力（ディレクトリ・ファイル・ワイルドカード）から処理対象のファイルを集める
+
+    ディレクトリは再帰的にたどり、出力先では入力のディレクトリからの相対パスを保つ。
+    ワイルドカードはワイルドカードを含まない先頭のディレクトリからの相対パスを保ち、
+    ファイルで指定したものは出力先の直下に置く。
+    動画の出力は mp4、画像の出力は image_format（指定が無ければ入力と同じ形式）の拡張子にする。
+
+    Returns:
+        (入力パス, 出力パス, "video" / "image") のリスト（入力ファイルの大きい順）
+
+    Raises:
+        ValueError: 別々の入力ファイルの出力先が同じになる場合（別の入力で指定した同名のファイルなど）
+    """
+    found = {}
+    for pattern in inputs:
+        path = Path(pattern)
+        if path.is_dir():
+            pairs = [(p, p.relative_to(path)) for p in sorted(path.rglob("*")) if p.is_file()]
+        else:
+            root = glob_root(pattern)
+            pairs = [(Path(p), Path(p).relative_to(root)) for p in sorted(glob.glob(pattern, recursive=True))]
+        for source, relative in pairs:
+            ext = source.suffix.lower()
+            if ext in VIDEO_EXTENSIONS:
+                kind, output = "video", output_dir / relative.with_suffix(".mp4")
+            elif ext in IMAGE_EXTENSIONS:
+                kind, output = "image", output_dir / relative
+                if image_format and image_format != IMAGE_EXTENSIONS[ext]:
+                    output = output.with_suffix(IMAGE_FORMATS[image_format])
+            else:
+                continue
+            source = source.resolve()
+            if source.is_relative_to(output_dir.resolve()):
+                # 前回の出力を入力として拾わない
+                continue
+            found.setdefault(str(source), (str(source), str(output), kind))
+
+    # 出力先が重なると後から終わったファイルで上書きされるため、処理を始める前に止める
+    outputs = {}
+    for source, output, _ in found.values():
+        other = outputs.setdefault(output, source)
+        if other != source:
+            raise ValueError(f"出力先が重複しています: {other} と {source} -> {output}")
+
+    # 大きいファイルから処理する（最後に大きなファイルが1つだけ残って他のワーカーが遊ぶのを避ける）
+    return sorted(found.values(), key=lambda item: os.path.getsize(item[0]), reverse=True)
+
+
+def load_manifest(manifest_path: Path) -> dict:
+    """
+    マニフェストから完了済みのファイルを読み込む
+
+    Returns:
+        入力パス -> その行（status が "done" のもの。同じファイルは後の行を優先）
+    """
+    completed = {}
+    if not manifest_path.exists():
+        return completed
+    with open(manifest_path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # 書き込み途中で中断された行
+                continue
+            if entry.get("status") == "done":
+                completed[entry["input"]] = entry
+            else:
+                completed.pop(entry.get("input"), None)
+    return completed
+
+
+def is_completed(entry: dict, input_path: str, options: dict) -> bool:
+    """前回の処理結果がそのまま使えるか（入力が変わっていない・同じパラメータ・出力が残っている）"""
+    stat = os.stat(input_path)
+    return (
+        entry.get("input_size") == stat.st_size
+        and entry.get("input_mtime_ns") == stat.st_mtime_ns
+        and entry.get("options") == options
+        and Path(entry.get("output", "")).exists()
+    )
+
+
+# --- ワーカープロセス側 ---
+
+def _init_worker() -> None:
+    """ワーカー起動時にワーカー専用の Face Detector を生成してウォームアップ"""
+    import main
+
+    main.detectors.clear()
+    try:
+        main.warm_up_detector()
+    except Exception as e:
+        # モデルが無い場合などはファイルの処理時にエラーを記録する
+        print(f"Detector init error in worker: {e}")
+
+
+def _process_image(input_path: str, output_path: str, options: dict) -> dict:
+    """画像1枚を処理（POST /api/mosaic/image と同じ処理）"""
+    import cv2
+    import numpy as np
+    import main
+    from metrics import StageMetrics
+
+    metrics = StageMetrics()
+    start = time.perf_counter()
+    image = cv2.imdecode(np.fromfile(input_path, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("画像を読み込めません")
+    metrics.since("decode", start)
+
+    detections = None
+    if options["tile_size"]:
+        detections = main.detect_faces_tiled(
+            image, options["tile_size"], options["tile_overlap"], options["detect_size"], metrics, options["detector"]
+        )
+    processed, face_count, _ = main.process_frame(
+        image, main.get_detector(options["detector"]), options["mosaic_ratio"], options["padding"], None, detections,
+        detect_size=options["detect_size"], metrics=metrics
+    )
+
+    start = time.perf_counter()
+    image_format = image_format_for(input_path, options["image_format"])
+    buffer = main.encode_image(processed, image_format, options["quality"])
+    metrics.since("encode", start)
+    Path(output_path).write_bytes(buffer)
+
+    height, width = image.shape[:2]
+    return {"width": width, "height": height, "faces_detected": face_count, "timings": metrics.breakdown()}
+
+
+def _process_file(input_path: str, output_path: str, kind: str, options: dict) -> dict:
+    """
+    ワーカープロセスでファイルを1つ処理
+
+    Returns:
+        マニフェストに書き込む統計情報（失敗した場合は error を含む）
+    """
+    import main
+
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    try:
+        if kind == "video":
+            video_options = {
+                key: options[key] for key in (
+                    "mosaic_ratio", "padding", "pipeline", "detector", "detect_stride", "detect_size", "motion_threshold",
+                    "roi_full_scan_interval", "tile_size", "tile_overlap", "reuse_detections"
+                )
+            }
+            stats = main.process_video(input_path, output_path, **video_options)
+            # /metrics 用の集計はマニフェストには不要
+            stats.pop("metrics", None)
+        else:
+            stats = _process_image(input_path, output_path, options)
+    except Exception as e:
+        detail = getattr(e, "detail", None) or str(e) or type(e).__name__
+        Path(output_path).unlink(missing_ok=True)
+        return {"status": "failed", "error": detail, "elapsed_sec": round(time.perf_counter() - start, 3)}
+    return {"status": "done", "elapsed_sec": round(time.perf_counter() - start, 3), "stats": stats}
+
+
+# --- 親プロセス側 ---
+
+def run_batch(items: list, options: dict, manifest_path: Path, workers: int) -> tuple[int, int]:
+    """
+    ファイルをワーカープロセスで並行に処理し、終わったものから順にマニフェストに追記
+
+    ワーカーに渡すのは常にワーカー数の SUBMIT_AHEAD 倍までにして、中断（Ctrl+C）した場合に
+    未着手のファイルを大量に抱えないようにする。
+
+    Returns:
+        (成功したファイル数, 失敗したファイル数)
+    """
+    ctx = multiprocessing.get_context("spawn")
+    done = failed = 0
+    total = len(items)
+    pending_items = iter(items)
+    running = {}
+    started = time.perf_counter()
+
+    with open(manifest_path, "a") as manifest, ProcessPoolExecutor(
+        max_workers=workers, mp_context=ctx, initializer=_init_worker
+    ) as executor:
+        def submit_next() -> None:
+            for item in pending_items:
+                running[executor.submit(_process_file, *item, options)] = item
+                if len(running) >= workers * SUBMIT_AHEAD:
+                    return
+
+        try:
+            submit_next()
+            while running:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    input_path, output_path, kind = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # ワーカープロセスの異常終了など
+                        result = {"status": "failed", "error": str(e) or type(e).__name__}
+                    stat = os.stat(input_path)
+                    entry = {
+                        "input": input_path,
+                        "output": output_path,
+                        "kind": kind,
+                        "input_size": stat.st_size,
+                        "input_mtime_ns": stat.st_mtime_ns,
+                        "options": options,
+                        "finished_at": datetime.now(timezone.utc).isoformat(),
+                        **result
+                    }
+                    manifest.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                    manifest.flush()
+
+                    if result["status"] == "done":
+                        done += 1
+                        detail = f"{result['elapsed_sec']:.1f}s"
+                        if kind == "video" and result["elapsed_sec"] > 0:
+                            frames = result["stats"].get("processed_frames", 0)
+                            detail += f", {frames / result['elapsed_sec']:.1f} fps"
+                    else:
+                        failed += 1
+                        detail = f"失敗: {result['error']}"
+                    elapsed = time.perf_counter() - started
+                    print(f"[{done + failed}/{total}] {input_path} ({detail}) 経過 {elapsed:.0f}s", flush=True)
+                submit_next()
+        except KeyboardInterrupt:
+            print("中断しました（再実行すると完了済みのファイルを飛ばして再開します）", flush=True)
+            for future in running:
+                future.cancel()
+            raise
+    return done, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="動画・画像の一括モザイク処理")
+    parser.add_argument("inputs", nargs="+", help="入力ディレクトリ（再帰的に処理）・ファイル・ワイルドカード")
+    parser.add_argument("-o", "--output-dir", required=True, help="出力先ディレクトリ")
+    parser.add_argument("--manifest", help="処理結果のマニフェスト（JSON Lines。デフォルト: 出力先/manifest.jsonl）")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="並行に処理するファイル数")
+    parser.add_argument("--force", action="store_true", help="完了済みのファイルも処理し直す")
+    parser.add_argument("--mosaic-ratio", type=float, default=0.05)
+    parser.add_argument("--padding", type=float, default=DEFAULT_PADDING, help="顔周りの余白（API と同じデフォルト）")
+    parser.add_argument("--pipeline", default="pipe", choices=("pipe", "opencv"))
+    parser.add_argument("--detector", default=DETECTOR_BACKEND, choices=tuple(BACKENDS), help="顔検出のバックエンド")
+    parser.add_argument("--detect-stride", type=int, default=1)
+    parser.add_argument("--detect-size", type=int, default=0)
+    parser.add_argument("--motion-threshold", type=float, default=0.0, help="差分ゲートのしきい値（0で無効）")
+    parser.add_argument("--roi-full-scan-interval", type=int, default=0, help="ROI 検出で画面全体を検出する間隔（0で無効）")
+    parser.add_argument("--tile-size", type=int, default=0, help="タイル分割検出のタイルの辺（0で無効）")
+    parser.add_argument("--tile-overlap", type=float, default=0.2)
+    parser.add_argument("--reuse-detections", action="store_true", help="動画の検出結果をサイドカーに保存・再利用する")
+    parser.add_argument("--image-format", choices=("png", "jpeg", "webp"), help="画像の出力形式（デフォルト: 入力と同じ）")
+    parser.add_argument("--quality", type=int, default=90, help="jpeg / webp の品質")
+    args = parser.parse_args()
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = Path(args.manifest) if args.manifest else output_dir / "manifest.jsonl"
+    options = {
+        "mosaic_ratio": args.mosaic_ratio,
+        "padding": args.padding,
+        "pipeline": args.pipeline,
+        "detector": args.detector,
+        "detect_stride": args.detect_stride,
+        "detect_size": args.detect_size,
+        "motion_threshold": args.motion_threshold,
+        "roi_full_scan_interval": args.roi_full_scan_interval,
+        "tile_size": args.tile_size,
+        "tile_overlap": args.tile_overlap,
+        "reuse_detections": args.reuse_detections,
+        "image_format": args.image_format,
+        "quality": args.quality,
+    }
+
+    try:
+        items = find_media(args.inputs, output_dir, args.image_format)
+    except ValueError as e:
+        parser.error(str(e))
+    completed = {} if args.force else load_manifest(manifest_path)
+    todo = [
+        item for item in items
+        if item[0] not in completed or not is_completed(completed[item[0]], item[0], options)
+    ]
+    print(f"{len(items)} ファイル（完了済み {len(items) - len(todo)}、処理対象 {len(todo)}）、"
+          f"ワーカー {args.workers}", flush=True)
+    if not todo:
+        return
+
+    started = time.perf_counter()
+    try:
+        done, failed = run_batch(todo, options, manifest_path, max(1, args.workers))
+    except KeyboardInterrupt:
+        sys.exit(130)
+    elapsed = time.perf_counter() - started
+    size_mb = sum(os.path.getsize(item[0]) for item in todo) / 1e6
+    print(f"\n完了 {done}、失敗 {failed}、{elapsed:.1f}s（{len(todo) / elapsed:.2f} ファイル/s、{size_mb / elapsed:.2f} MB/s）。"
+          f"マニフェスト: {manifest_path}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+モザイク処理のベンチマーク
+
+合成した動画・画像（480p / 1080p / 4K、顔 0 / 1 / 複数、回転 0 / 90 / 180 / 270）を
+実際の処理経路（process_video / process_frame）に通し、段階ごとの処理時間・FPS・
+ピークメモリ（RSS）を JSON で保存する。結果を比較して性能の劣化を検出できる。
+
+使い方:
+    python benchmark.py                                  # 全ケースを実行して bench_results.json に保存
+    python benchmark.py --resolutions 480p --frames 30   # ケースを絞る
+    python benchmark.py --baseline old.json              # 前回の結果と比較（劣化があれば終了コード 1）
+"""
+
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from metrics import StageMetrics
+
+RESOLUTIONS = {"480p": (854, 480), "1080p": (1920, 1080), "4k": (3840, 2160)}
+# "many" は顔を 4 x 2 に並べる（Short Range モデルで検出できる大きさを保てる上限）
+FACE_COUNTS = {"0": 0, "1": 1, "many": 8}
+ROTATIONS = (0, 90, 180, 270)
+# 顔の一辺（フレーム幅に対する割合）
+FACE_SCALE = 0.2
+FPS = 30
+
+# レポートの段階 -> StageMetrics の段階（残りの ffprobe などは other に含める）
+STAGES = {
+    "decode": ("decode",),
+    "detect": ("cvt_color", "detect"),
+    "track": ("track",),
+    "mosaic": ("mosaic",),
+    "encode": ("write", "finalize", "transcode"),
+}
+
+
+def draw_face(size: int) -> np.ndarray:
+    """顔検出器が顔として検出できる程度の合成の顔画像を描画"""
+    img = np.full((size, size, 3), (70, 90, 110), np.uint8)
+    c = size // 2
+    s = size / 256
+    cv2.ellipse(img, (c, int(size * 0.42)), (int(size * 0.40), int(size * 0.40)), 0, 180, 360, (30, 40, 60), -1)
+    cv2.ellipse(img, (c, int(size * 0.55)), (int(size * 0.33), int(size * 0.42)), 0, 0, 360, (120, 150, 200), -1)
+    for dx in (-1, 1):
+        ex, ey = c + dx * int(size * 0.13), int(size * 0.48)
+        cv2.ellipse(img, (ex, ey), (int(size * 0.06), int(size * 0.03)), 0, 0, 360, (230, 230, 230), -1)
+        cv2.circle(img, (ex, ey), int(size * 0.025) + 1, (30, 25, 25), -1)
+        cv2.line(
+            img, (ex - int(size * 0.07), ey - int(size * 0.07)), (ex + int(size * 0.07), ey - int(size * 0.075)),
+            (30, 40, 60), max(1, int(6 * s))
+        )
+        cv2.circle(img, (c + dx * int(size * 0.34), int(size * 0.55)), int(size * 0.05), (110, 140, 190), -1)
+    cv2.line(img, (c, int(size * 0.5)), (c, int(size * 0.64)), (90, 120, 170), max(1, int(4 * s)))
+    cv2.ellipse(img, (c, int(size * 0.66)), (int(size * 0.04), int(size * 0.02)), 0, 0, 360, (80, 100, 150), -1)
+    cv2.ellipse(img, (c, int(size * 0.76)), (int(size * 0.09), int(size * 0.03)), 0, 0, 360, (70, 70, 170), -1)
+    return cv2.GaussianBlur(img, (0, 0), max(0.5, size / 200))
+
+
+class SceneGenerator:
+    """背景の上で顔が少しずつ動く合成フレームを作る"""
+
+    def __init__(self, width: int, height: int, faces: int, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        noise = rng.integers(0, 255, (height // 8, width // 8, 3), dtype=np.uint8)
+        self.background = cv2.resize(noise, (width, height), interpolation=cv2.INTER_CUBIC)
+        self.size = int(width * FACE_SCALE)
+        self.face = draw_face(self.size)
+        self.width, self.height = width, height
+
+        if faces == 1:
+            self.anchors = [((width - self.size) // 2, (height - self.size) // 2)]
+        else:
+            cols = (faces + 1) // 2
+            gap_x = (width - cols * self.size) // (cols + 1)
+            gap_y = max(0, (height - 2 * self.size) // 3)
+            self.anchors = [
+                (gap_x + i % cols * (self.size + gap_x), gap_y + i // cols * (self.size + gap_y))
+                for i in range(faces)
+            ]
+
+    def frame(self, index: int) -> np.ndarray:
+        frame = self.background.copy()
+        amplitude = self.size // 10
+        for k, (x, y) in enumerate(self.anchors):
+            x = int(np.clip(x + amplitude * np.sin(index / 10 + k), 0, self.width - self.size))
+            y = int(np.clip(y + amplitude * np.cos(index / 13 + k), 0, self.height - self.size))
+            frame[y:y + self.size, x:x + self.size] = self.face
+        return frame
+
+
+def generate_video(path: Path, width: int, height: int, faces: int, frames: int, rotation: int) -> None:
+    """合成動画を作成（音声付き。回転はメタデータとして付ける）"""
+    if path.exists():
+        return
+    base = path.with_name(f"{path.stem}.base.mp4")
+    scene = SceneGenerator(width, height, faces)
+    proc = subprocess.Popen([
+        'ffmpeg', '-y', '-v', 'error',
+        '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}', '-r', str(FPS), '-i', '-',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:duration={frames / FPS}',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p', '-g', str(FPS),
+        '-c:a', 'aac', '-shortest',
+        str(base)
+    ], stdin=subprocess.PIPE)
+    for i in range(frames):
+        proc.stdin.write(scene.frame(i).tobytes())
+    proc.stdin.close()
+    if proc.wait() != 0:
+        raise RuntimeError(f"ffmpeg failed to generate {path}")
+
+    # get_video_rotation が読む side_data の rotation と同じ値になる
+    subprocess.run([
+        'ffmpeg', '-y', '-v', 'error',
+        '-display_rotation', str(rotation), '-i', str(base),
+        '-c', 'copy', str(path)
+    ], check=True)
+    base.unlink()
+
+
+def generate_image(path: Path, width: int, height: int, faces: int) -> None:
+    """合成画像（JPEG）を作成"""
+    if not path.exists():
+        cv2.imwrite(str(path), SceneGenerator(width, height, faces).frame(0), [cv2.IMWRITE_JPEG_QUALITY, 90])
+
+
+def _peak_rss_mb() -> float:
+    """このプロセスのピーク RSS（MB）。ffmpeg のサブプロセスは含まない"""
+    # Linux の ru_maxrss は KB 単位、macOS はバイト単位
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit, 1)
+
+
+def _stage_report(breakdown: dict, wall: float, frames: int) -> dict:
+    """StageMetrics.breakdown() の段階をレポートの段階にまとめる"""
+    stages = {}
+    for stage, names in STAGES.items():
+        total = sum(breakdown[name]["total_ms"] for name in names if name in breakdown) / 1000
+        stages[stage] = {"total_sec": round(total, 4), "ms_per_frame": round(total * 1000 / max(1, frames), 3)}
+    # デコード・検出・エンコードは別スレッドで並行に動くため、合計が経過時間を超えることがある
+    other = max(0.0, wall - sum(stage["total_sec"] for stage in stages.values()))
+    stages["other"] = {"total_sec": round(other, 4), "ms_per_frame": round(other * 1000 / max(1, frames), 3)}
+    return stages
+
+
+def run_video_case(case: dict) -> dict:
+    """子プロセスで動画1ケースを処理"""
+    import main
+
+    start = time.perf_counter()
+    main.get_detector(case["detector"])
+    model_load = time.perf_counter() - start
+
+    output_path = Path(case["path"]).with_name(f"{Path(case['path']).stem}.out.mp4")
+    start = time.perf_counter()
+    stats = main.process_video(
+        case["path"], str(output_path),
+        pipeline=case["pipeline"],
+        detector=case["detector"],
+        detect_stride=case["detect_stride"],
+        detect_size=case["detect_size"],
+        motion_threshold=case["motion_threshold"],
+        roi_full_scan_interval=case["roi_full_scan_interval"],
+        tile_size=case["tile_size"],
+        reuse_detections=False
+    )
+    wall = time.perf_counter() - start
+    output_path.unlink(missing_ok=True)
+
+    frames = stats["processed_frames"]
+    return {
+        "model_load_sec": round(model_load, 4),
+        "wall_sec": round(wall, 4),
+        "fps": round(frames / wall, 2),
+        "frames": frames,
+        "faces_detected": stats["total_faces_detected"],
+        "detector_calls": stats["detector_calls"],
+        "skipped_detections": stats["skipped_detections"],
+        "roi_scans": stats["roi_scans"],
+        "rotation_detected": main.get_video_rotation(case["path"]),
+        "stages": _stage_report(stats["timings"], wall, frames),
+        "peak_rss_mb": _peak_rss_mb()
+    }
+
+
+def run_image_case(case: dict) -> dict:
+    """子プロセスで画像1ケースを処理（/api/mosaic/image と同じ decode → 処理 → PNG エンコード）"""
+    import main
+
+    start = time.perf_counter()
+    face_detector = main.get_detector(case["detector"])
+    model_load = time.perf_counter() - start
+
+    metrics = StageMetrics()
+    content = Path(case["path"]).read_bytes()
+    laps = []
+    face_count = 0
+    for _ in range(case["repeat"]):
+        lap = time.perf_counter()
+        image = cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_COLOR)
+        metrics.since("decode", lap)
+        image, face_count, _ = main.process_frame(
+            image, face_detector, 0.05, main.DEFAULT_PADDING, None, detect_size=case["detect_size"], metrics=metrics
+        )
+        start = time.perf_counter()
+        cv2.imencode('.png', image)
+        metrics.since("write", start)
+        laps.append(time.perf_counter() - lap)
+
+    wall = sum(laps)
+    return {
+        "model_load_sec": round(model_load, 4),
+        "wall_sec": round(wall, 4),
+        "ms_per_image": round(float(np.median(laps)) * 1000, 3),
+        "p95_ms_per_image": round(float(np.percentile(laps, 95)) * 1000, 3),
+        "images_per_sec": round(len(laps) / wall, 2),
+        "faces_detected": face_count,
+        "stages": _stage_report(metrics.breakdown(), wall, len(laps)),
+        "peak_rss_mb": _peak_rss_mb()
+    }
+
+
+def _run_isolated(func, case: dict) -> dict:
+    """ケースごとに新しいプロセスで実行（ピーク RSS と Face Detector の状態を分けるため）"""
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(1, maxtasksperchild=1) as pool:
+        return pool.apply(func, (case,))
+
+
+def _versions() -> dict:
+    versions = {"python": platform.python_version(), "opencv": cv2.__version__, "numpy": np.__version__}
+    try:
+        import mediapipe
+        versions["mediapipe"] = mediapipe.__version__
+    except Exception:
+        pass
+    try:
+        first_line = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True).stdout.splitlines()[0]
+        versions["ffmpeg"] = first_line.split()[2]
+    except Exception:
+        pass
+    try:
+        versions["git_commit"] = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, cwd=Path(__file__).parent
+        ).stdout.strip()
+    except Exception:
+        pass
+    return versions
+
+
+def compare(results: list, baseline_path: str, threshold: float) -> bool:
+    """
+    前回の結果と比較して表示
+
+    Returns:
+        スループット（動画は fps、画像は images_per_sec）が threshold 以上低下したケースがなければ True
+    """
+    baseline = {r["name"]: r for r in json.loads(Path(baseline_path).read_text())["results"]}
+    ok = True
+    print(f"\n=== {baseline_path} との比較 ===")
+    for r in results:
+        old = baseline.get(r["name"])
+        if old is None:
+            continue
+        key = "fps" if r["kind"] == "video" else "images_per_sec"
+        change = r[key] / old[key] - 1 if old[key] else 0.0
+        regressed = change < -threshold
+        ok = ok and not regressed
+        mark = "  << 劣化" if regressed else ""
+        print(f"  {r['name']:<28} {key} {old[key]:>9.2f} -> {r[key]:>9.2f} ({change:+.1%}){mark}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="モザイク処理のベンチマーク")
+    parser.add_argument("--output", default="bench_results.json", help="結果の保存先（JSON）")
+    parser.add_argument("--workdir", default="bench_media", help="合成した動画・画像の保存先（再実行時は再利用）")
+    parser.add_argument("--resolutions", default=",".join(RESOLUTIONS), help="480p,1080p,4k")
+    parser.add_argument("--faces", default=",".join(FACE_COUNTS), help="0,1,many")
+    parser.add_argument("--rotations", default=",".join(map(str, ROTATIONS)), help="0,90,180,270")
+    parser.add_argument("--frames", type=int, default=90, help="動画のフレーム数")
+    parser.add_argument("--image-repeat", type=int, default=10, help="画像1枚あたりの処理回数")
+    parser.add_argument("--pipeline", default="pipe", choices=("pipe", "opencv"))
+    parser.add_argument("--detector", default="mediapipe", help="顔検出のバックエンド（mediapipe / yunet / haar）")
+    parser.add_argument("--detect-stride", type=int, default=1)
+    parser.add_argument("--detect-size", type=int, default=0)
+    parser.add_argument("--motion-threshold", type=float, default=0.0, help="差分ゲートのしきい値（0で無効）")
+    parser.add_argument("--roi-full-scan-interval", type=int, default=0, help="ROI 検出で画面全体を検出する間隔（0で無効）")
+    parser.add_argument("--tile-size", type=int, default=0, help="タイル分割検出のタイルの辺（0で無効）")
+    parser.add_argument("--skip-video", action="store_true")
+    parser.add_argument("--skip-image", action="store_true")
+    parser.add_argument("--baseline", help="比較する前回の結果（JSON）")
+    parser.add_argument("--threshold", type=float, default=0.1, help="劣化とみなすスループットの低下率")
+    args = parser.parse_args()
+
+    workdir = Path(args.workdir)
+    workdir.mkdir(parents=True, exist_ok=True)
+    resolutions = args.resolutions.split(",")
+    faces = args.faces.split(",")
+    rotations = [int(r) for r in args.rotations.split(",")]
+
+    results = []
+    for res in resolutions:
+        width, height = RESOLUTIONS[res]
+        for face in faces:
+            count = FACE_COUNTS[face]
+
+            if not args.skip_image:
+                path = workdir / f"{res}_faces-{face}.jpg"
+                generate_image(path, width, height, count)
+                name = f"image/{res}/faces-{face}"
+                print(f"{name} ...", flush=True)
+                result = _run_isolated(run_image_case, {
+                    "path": str(path), "repeat": args.image_repeat, "detector": args.detector,
+                    "detect_size": args.detect_size
+                })
+                results.append({"kind": "image", "name": name, "resolution": res, "faces": face, **result})
+                print(f"  {result['ms_per_image']:.1f} ms/image, faces={result['faces_detected']}, "
+                      f"peak RSS {result['peak_rss_mb']} MB")
+
+            if args.skip_video:
+                continue
+            for rotation in rotations:
+                path = workdir / f"{res}_faces-{face}_rot-{rotation}_{args.frames}f.mp4"
+                generate_video(path, width, height, count, args.frames, rotation)
+                name = f"video/{res}/faces-{face}/rot-{rotation}"
+                print(f"{name} ...", flush=True)
+                result = _run_isolated(run_video_case, {
+                    "path": str(path),
+                    "pipeline": args.pipeline,
+                    "detector": args.detector,
+                    "detect_stride": args.detect_stride,
+                    "detect_size": args.detect_size,
+                    "motion_threshold": args.motion_threshold,
+                    "roi_full_scan_interval": args.roi_full_scan_interval,
+                    "tile_size": args.tile_size
+                })
+                results.append({
+                    "kind": "video", "name": name, "resolution": res, "faces": face, "rotation": rotation, **result
+                })
+                print(f"  {result['fps']:.1f} fps, faces={result['faces_detected']}, "
+                      f"peak RSS {result['peak_rss_mb']} MB")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "platform": platform.platform(),
+            "cpu_count": multiprocessing.cpu_count(),
+            "versions": _versions(),
+            "params": {
+                "frames": args.frames,
+                "image_repeat": args.image_repeat,
+                "pipeline": args.pipeline,
+                "detector": args.detector,
+                "detect_stride": args.detect_stride,
+                "detect_size": args.detect_size,
+                "motion_threshold": args.motion_threshold,
+                "roi_full_scan_interval": args.roi_full_scan_interval,
+                "tile_size": args.tile_size,
+            },
+        },
+        "results": results,
+    }
+    Path(args.output).write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"\n結果を保存しました: {args.output}")
+
+    if args.baseline and not compare(results, args.baseline, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
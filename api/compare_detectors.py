@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+顔検出バックエンドの比較
+
+同じ動画・画像を各バックエンド（detectors.BACKENDS）で毎フレーム検出し、速度
+（1フレームあたりの処理時間）と見逃しの少なさ（再現率）を比べる。用途ごとに、
+必要な再現率を満たす中で最も速いバックエンドを選ぶために使う。
+
+再現率の基準（正解の顔）は、--ground-truth で指定した正解データか、指定が無ければ
+複数のバックエンドが同じ位置で検出した顔（--consensus 個以上のバックエンドの一致）とする。
+1つのバックエンドだけが検出した顔は「未確認」（誤検出の可能性）として別に数える。
+
+使い方:
+    python compare_detectors.py clip1.mp4 clip2.mp4
+    python compare_detectors.py clip.mp4 --detectors mediapipe,haar --frames 300 --min-recall 0.98
+    python compare_detectors.py clip.mp4 --ground-truth gt.json   # {"clip.mp4": {"フレーム番号": [[x, y, w, h], ...]}}
+"""
+
+import argparse
+import json
+import multiprocessing
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from detectors import BACKENDS, available_backends
+from tiling import overlap_ratio
+
+# 同じ顔とみなす重なり（小さい方の面積に対する割合）
+MATCH_OVERLAP = 0.5
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def read_frames(path: str, max_frames: int, step: int):
+    """動画（または画像1枚）から step フレームごとに (フレーム番号, フレーム) を返す"""
+    if Path(path).suffix.lower() in IMAGE_EXTENSIONS:
+        image = cv2.imread(path)
+        if image is not None:
+            yield 0, image
+        return
+    cap = cv2.VideoCapture(path)
+    try:
+        index = 0
+        count = 0
+        while count < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if index % step == 0:
+                yield index, frame
+                count += 1
+            index += 1
+    finally:
+        cap.release()
+
+
+def run_backend(name: str, clips: list, max_frames: int, step: int, detect_size: int) -> dict:
+    """
+    1つのバックエンドで全クリップを検出
+
+    Returns:
+        load_sec、ms_per_frame などの速度と、frames（クリップ -> フレーム番号 -> ボックスのリスト）
+    """
+    import main
+    from metrics import StageMetrics
+
+    start = time.perf_counter()
+    face_detector = main.create_detector(name)
+    load_sec = time.perf_counter() - start
+    # 初回の推論は遅いため計測から除く
+    main.detect_faces_scored(np.zeros((256, 256, 3), dtype=np.uint8), face_detector)
+
+    metrics = StageMetrics()
+    laps = []
+    frames = {}
+    try:
+        for clip in clips:
+            frames[clip] = {}
+            for index, frame in read_frames(clip, max_frames, step):
+                lap = time.perf_counter()
+                frames[clip][index] = main.detect_faces_scored(frame, face_detector, detect_size, metrics)
+                laps.append(time.perf_counter() - lap)
+    finally:
+        face_detector.close()
+
+    breakdown = metrics.breakdown()
+    missing = [stage for stage in ("cvt_color", "detect") if stage not in breakdown]
+    if laps and missing:
+        raise RuntimeError(f"{name}: 処理段階の計測がありません（{', '.join(missing)}）")
+    return {
+        "load_sec": round(load_sec, 3),
+        "frames_processed": len(laps),
+        "ms_per_frame": round(float(np.mean(laps)) * 1000, 2) if laps else None,
+        "p95_ms_per_frame": round(float(np.percentile(laps, 95)) * 1000, 2) if laps else None,
+        "prepare_ms": breakdown["cvt_color"]["mean_ms"] if laps else None,
+        "detect_ms": breakdown["detect"]["mean_ms"] if laps else None,
+        "frames": frames,
+    }
+
+
+def consensus_faces(detections: dict, consensus: int) -> tuple[list, dict]:
+    """
+    1フレーム分の各バックエンドの検出結果から、基準とする顔を決める
+
+    Args:
+        detections: バックエンド名 -> (x, y, w, h, score) のリスト
+        consensus: 基準とするのに必要な、同じ位置で検出したバックエンドの数
+
+    Returns:
+        (基準の顔のリスト, バックエンド名 -> 未確認の検出数)。基準の顔は (ボックス, 検出したバックエンドの集合)
+    """
+    clusters = []
+    for name, faces in detections.items():
+        for face in sorted(faces, key=lambda f: f[4], reverse=True):
+            for box, found_by in clusters:
+                if name not in found_by and overlap_ratio(face, box) >= MATCH_OVERLAP:
+                    found_by.add(name)
+                    break
+            else:
+                clusters.append((face, {name}))
+
+    reference = [c for c in clusters if len(c[1]) >= consensus]
+    unconfirmed = {name: 0 for name in detections}
+    for _, found_by in clusters:
+        if len(found_by) < consensus:
+            for name in found_by:
+                unconfirmed[name] += 1
+    return reference, unconfirmed
+
+
+def evaluate(runs: dict, clips: list, ground_truth: dict, consensus: int) -> dict:
+    """
+    バックエンドごとの再現率などを集計
+
+    Returns:
+        バックエンド名 -> {reference_faces, found, recall, frames_with_miss, unconfirmed}
+    """
+    names = list(runs)
+    totals = {name: {"reference_faces": 0, "found": 0, "frames_with_miss": 0, "unconfirmed": 0} for name in names}
+    for clip in clips:
+        truth = ground_truth.get(Path(clip).name) if ground_truth else None
+        for index in runs[names[0]]["frames"][clip]:
+            detections = {name: runs[name]["frames"][clip].get(index, []) for name in names}
+            if truth is not None:
+                if str(index) not in truth:
+                    continue
+                reference = [
+                    (box, {
+                        name for name, faces in detections.items()
+                        if any(overlap_ratio(face, box) >= MATCH_OVERLAP for face in faces)
+                    })
+                    for box in truth[str(index)]
+                ]
+                unconfirmed = {
+                    name: sum(
+                        1 for face in faces
+                        if all(overlap_ratio(face, box) < MATCH_OVERLAP for box, _ in reference)
+                    )
+                    for name, faces in detections.items()
+                }
+            else:
+                reference, unconfirmed = consensus_faces(detections, consensus)
+
+            for name in names:
+                found = sum(1 for _, found_by in reference if name in found_by)
+                totals[name]["reference_faces"] += len(reference)
+                totals[name]["found"] += found
+                totals[name]["frames_with_miss"] += int(found < len(reference))
+                totals[name]["unconfirmed"] += unconfirmed[name]
+
+    for entry in totals.values():
+        entry["recall"] = round(entry["found"] / entry["reference_faces"], 4) if entry["reference_faces"] else None
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="顔検出バックエンドの速度・再現率の比較")
+    parser.add_argument("clips", nargs="+", help="比較に使う動画・画像")
+    parser.add_argument("--detectors", help=f"比較するバックエンド（カンマ区切り。デフォルト: モデルがそろっているもの全て / {','.join(BACKENDS)}）")
+    parser.add_argument("--frames", type=int, default=300, help="1クリップあたりの最大フレーム数")
+    parser.add_argument("--step", type=int, default=1, help="このフレーム数ごとに1フレームを使う")
+    parser.add_argument("--detect-size", type=int, default=0, help="検出に使う画像の長辺（0で元の解像度）")
+    parser.add_argument("--ground-truth", help="正解の顔の JSON（{クリップのファイル名: {フレーム番号: [[x, y, w, h], ...]}}）")
+    parser.add_argument("--consensus", type=int, default=2, help="正解データが無い場合に、基準の顔とするのに必要な一致バックエンド数")
+    parser.add_argument("--min-recall", type=float, default=0.95, help="推奨するバックエンドに求める再現率")
+    parser.add_argument("--output", default="detector_comparison.json", help="結果の保存先（JSON）")
+    args = parser.parse_args()
+
+    names = args.detectors.split(",") if args.detectors else available_backends()
+    unknown = [name for name in names if name not in BACKENDS]
+    if unknown:
+        parser.error(f"不明なバックエンド: {', '.join(unknown)}")
+    missing = [name for name in names if name not in available_backends()]
+    if missing:
+        parser.error(f"モデルファイルが見つかりません: {', '.join(missing)}")
+    ground_truth = json.loads(Path(args.ground_truth).read_text()) if args.ground_truth else None
+    consensus = max(1, min(args.consensus, len(names)))
+
+    runs = {}
+    for name in names:
+        print(f"{name} ...", flush=True)
+        runs[name] = run_backend(name, args.clips, args.frames, args.step, args.detect_size)
+    scores = evaluate(runs, args.clips, ground_truth, consensus)
+
+    results = []
+    for name in names:
+        run = {k: v for k, v in runs[name].items() if k != "frames"}
+        results.append({"detector": name, **run, **scores[name]})
+
+    reference = "ground_truth" if ground_truth else f"consensus of {consensus}"
+    print(f"\n基準: {reference}")
+    print(f"  {'detector':<16} {'ms/frame':>9} {'p95':>8} {'recall':>8} {'miss frames':>12} {'unconfirmed':>12}")
+    for r in sorted(results, key=lambda r: r["ms_per_frame"] or 0):
+        recall = f"{r['recall']:.3f}" if r["recall"] is not None else "-"
+        print(f"  {r['detector']:<16} {r['ms_per_frame'] or 0:>9.2f} {r['p95_ms_per_frame'] or 0:>8.2f} "
+              f"{recall:>8} {r['frames_with_miss']:>12} {r['unconfirmed']:>12}")
+
+    # 再現率の条件を満たす中で最も速いもの
+    eligible = [r for r in results if r["recall"] is not None and r["recall"] >= args.min_recall]
+    recommended = min(eligible, key=lambda r: r["ms_per_frame"])["detector"] if eligible else None
+    if recommended:
+        print(f"\n再現率 {args.min_recall} 以上で最も速いバックエンド: {recommended}")
+    else:
+        print(f"\n再現率 {args.min_recall} 以上のバックエンドはありません")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "platform": platform.platform(),
+            "cpu_count": multiprocessing.cpu_count(),
+            "opencv": cv2.__version__,
+            "params": {
+                "clips": args.clips,
+                "frames": args.frames,
+                "step": args.step,
+                "detect_size": args.detect_size,
+                "reference": reference,
+                "min_recall": args.min_recall,
+            },
+        },
+        "results": results,
+        "recommended": recommended,
+    }
+    Path(args.output).write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"結果を保存しました: {args.output}")
+    if recommended is None:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+複数の顔へのモザイクの一括適用
+1フレーム内の顔領域をまとめてモザイク化する。重なり合う領域はまとめて1回だけモザイク化し、
+縮小・拡大に使うバッファはフレーム間で使い回す
+"""
+
+import cv2
+import numpy as np
+
+# 重なりの判定に使うセルの一辺（px）
+GROUP_CELL_SIZE = 16
+# 顔周りの余白（顔の幅・高さに対する割合）のデフォルト。API・ライブモード・一括処理で共通
+DEFAULT_PADDING = 0.3
+
+
+class MosaicCompositor:
+    """
+    1フレーム分の顔領域にまとめてモザイクを適用する
+
+    重ならない顔領域は apply_mosaic と同じく領域ごとに縮小→拡大する。
+    余白付きの領域どうしが重なる場合は、連結した領域の外接矩形を元フレームから
+    1回だけモザイク化してから各領域に書き戻すため、重なった部分が二重にモザイク化されない。
+    """
+
+    def __init__(self, ratio: float = 0.05):
+        """
+        Args:
+            ratio: モザイクの粗さ（小さいほど粗い）
+        """
+        self.ratio = ratio
+        self._shape = None
+        self._cells = None
+        self._small = None
+        self._large = None
+
+    def _prepare(self, shape: tuple) -> None:
+        """フレームサイズに合わせて作業用のバッファを確保（サイズが変わらなければ再利用）"""
+        if self._shape == shape:
+            return
+        height, width, channels = shape
+        self._shape = shape
+        self._cells = np.zeros(
+            (-(-height // GROUP_CELL_SIZE), -(-width // GROUP_CELL_SIZE)), dtype=np.uint8
+        )
+        self._small = np.empty(
+            (max(1, int(height * self.ratio)), max(1, int(width * self.ratio)), channels), dtype=np.uint8
+        )
+        self._large = np.empty(shape, dtype=np.uint8)
+
+    def _pixelate(self, frame: np.ndarray, x1: int, y1: int, x2: int, y2: int) -> np.ndarray:
+        """
+        領域を縮小→拡大したものを作業用バッファに作成
+
+        Returns:
+            モザイク化した領域（作業用バッファの一部。次の呼び出しで上書きされる）
+        """
+        w, h = x2 - x1, y2 - y1
+        small_w = max(1, int(w * self.ratio))
+        small_h = max(1, int(h * self.ratio))
+        small = self._small[:small_h, :small_w]
+        large = self._large[:h, :w]
+        cv2.resize(frame[y1:y2, x1:x2], (small_w, small_h), dst=small, interpolation=cv2.INTER_LINEAR)
+        cv2.resize(small, (w, h), dst=large, interpolation=cv2.INTER_NEAREST)
+        return large
+
+    def _groups(self, boxes: list) -> list:
+        """
+        重なり合う顔領域をまとめる
+
+        Returns:
+            (外接矩形, 含まれる顔領域のリスト) のリスト
+        """
+        cells = self._cells
+        c = GROUP_CELL_SIZE
+        overlapped = False
+        for (x1, y1, x2, y2) in boxes:
+            cx1, cy1, cx2, cy2 = x1 // c, y1 // c, -(-x2 // c), -(-y2 // c)
+            # 連結成分と同じく、隣接する（8近傍の）セルに顔があればまとめる対象にする
+            overlapped = overlapped or bool(cells[max(0, cy1 - 1):cy2 + 1, max(0, cx1 - 1):cx2 + 1].any())
+            cells[cy1:cy2, cx1:cx2] = 1
+
+        if not overlapped:
+            cells.fill(0)
+            return [(box, [box]) for box in boxes]
+
+        # 重なりがある場合だけ、セル単位の連結成分でまとめる
+        count, labels = cv2.connectedComponents(cells, connectivity=8)
+        cells.fill(0)
+        members = [[] for _ in range(count)]
+        for box in boxes:
+            members[labels[box[1] // c, box[0] // c]].append(box)
+
+        groups = []
+        for group in members[1:]:
+            xs1, ys1, xs2, ys2 = zip(*group)
+            rect = (min(xs1), min(ys1), max(xs2), max(ys2))
+            # 外接矩形が既存のまとまりと重なる場合は統合する（L字状のまとまりなど）
+            i = 0
+            while i < len(groups):
+                (ox1, oy1, ox2, oy2), other = groups[i]
+                if rect[0] < ox2 and ox1 < rect[2] and rect[1] < oy2 and oy1 < rect[3]:
+                    rect = (min(rect[0], ox1), min(rect[1], oy1), max(rect[2], ox2), max(rect[3], oy2))
+                    group = group + other
+                    del groups[i]
+                    i = 0
+                else:
+                    i += 1
+            groups.append((rect, group))
+        return groups
+
+    def apply(self, frame: np.ndarray, boxes: list) -> np.ndarray:
+        """
+        顔領域にモザイクを適用（frame をその場で書き換える）
+
+        Args:
+            frame: 入力フレーム (BGR)
+            boxes: 余白込みの顔領域 (x1, y1, x2, y2) のリスト（フレーム内に収まっていること）
+
+        Returns:
+            モザイク適用後のフレーム
+        """
+        boxes = [box for box in boxes if box[2] > box[0] and box[3] > box[1]]
+        if not boxes:
+            return frame
+
+        self._prepare(frame.shape)
+
+        # まとまりの外接矩形どうしは重ならないため、書き戻しが他のまとまりの縮小に影響することはない
+        for (gx1, gy1, gx2, gy2), group in self._groups(boxes):
+            mosaic = self._pixelate(frame, gx1, gy1, gx2, gy2)
+            for (x1, y1, x2, y2) in group:
+                frame[y1:y2, x1:x2] = mosaic[y1 - gy1:y2 - gy1, x1 - gx1:x2 - gx1]
+
+        return frame
@@ -7,25 +7,23 @@
 """
 
 import sys
-import subprocess
-import json
 import cv2
 
-def get_video_info(video_path: str) -> dict:
-    """ffprobeで動画の詳細情報を取得"""
-    result = subprocess.run([
-        'ffprobe', '-v', 'quiet',
-        '-print_format', 'json',
-        '-show_format',
-        '-show_streams',
-        video_path
-    ], capture_output=True, text=True)
+from media_probe import UnsupportedMedia, parse_mp4, probe_ffprobe
 
-    if result.returncode != 0:
-        print(f"ffprobe error: {result.stderr}")
-        return {}
+FIELDS = ("rotation", "width", "height", "frame_rate", "total_frames", "codec", "pix_fmt", "audio_codec")
 
-    return json.loads(result.stdout)
+def print_probe(title: str, info: dict) -> None:
+    """取得した動画情報を表示"""
+    print(f"【{title}】")
+    print(f"  コーデック: {info['codec']}（{info['pix_fmt']}）")
+    print(f"  解像度: {info['width']} x {info['height']}")
+    print(f"  FPS: {info['frame_rate']}")
+    print(f"  フレーム数: {info['total_frames']}")
+    print(f"  音声: {info['audio_codec']}")
+    print(f"  rotation: {info['rotation']}")
+    if info["keyframes"] is not None:
+        print(f"  キーフレーム: {len(info['keyframes'])}個 {info['keyframes'][:10]}")
 
 def main():
     if len(sys.argv) < 2:
@@ -35,34 +33,30 @@ def main():
     video_path = sys.argv[1]
     print(f"\n=== 動画情報: {video_path} ===\n")
 
-    # ffprobeで情報取得
-    info = get_video_info(video_path)
-
-    if not info:
-        print("動画情報を取得できませんでした")
-        sys.exit(1)
-
-    # ストリーム情報
-    for stream in info.get('streams', []):
-        if stream.get('codec_type') == 'video':
-            print("【ffprobe情報】")
-            print(f"  コーデック: {stream.get('codec_name')}")
-            print(f"  解像度: {stream.get('width')} x {stream.get('height')}")
-            print(f"  FPS: {stream.get('r_frame_rate')}")
-
-            # rotation タグを確認
-            tags = stream.get('tags', {})
-            rotation = tags.get('rotate', 'なし')
-            print(f"  rotation (tags): {rotation}")
-
-            # side_data_listを確認
-            side_data = stream.get('side_data_list', [])
-            print(f"  side_data_list: {side_data}")
-
-            # display matrixを確認
-            for sd in side_data:
-                if 'rotation' in sd:
-                    print(f"  rotation (side_data): {sd['rotation']}")
+    # moov の解析（MP4 / MOV）で情報取得
+    parsed = None
+    try:
+        parsed = parse_mp4(video_path)
+        print_probe("MP4 解析（tkhd の表示行列）", parsed)
+    except UnsupportedMedia as e:
+        print(f"【MP4 解析】対応していません（{e}）。ffprobe で取得します")
+
+    # ffprobeで情報取得（MP4 解析の結果との比較用）
+    try:
+        info = probe_ffprobe(video_path, keyframes=True)
+    except RuntimeError as e:
+        print(e)
+        if parsed is None:
+            print("動画情報を取得できませんでした")
+            sys.exit(1)
+        info = None
+    if info is not None:
+        print()
+        print_probe("ffprobe情報", info)
+        if parsed is not None:
+            diffs = [key for key in FIELDS + ("keyframes",) if parsed[key] != info[key]]
+            print(f"  MP4 解析との違い: {', '.join(diffs) if diffs else 'なし'}")
+    info = parsed or info
 
     # OpenCVで情報取得
     print("\n【OpenCV情報】")
@@ -87,30 +81,23 @@ def main():
         print("  OpenCVで動画を開けませんでした")
 
     print("\n【判定】")
-    for stream in info.get('streams', []):
-        if stream.get('codec_type') == 'video':
-            w = stream.get('width')
-            h = stream.get('height')
-            rotation = stream.get('tags', {}).get('rotate', '0')
-
-            # side_dataからも確認
-            for sd in stream.get('side_data_list', []):
-                if 'rotation' in sd:
-                    rotation = str(sd['rotation'])
-
-            if w > h:
-                print(f"  メタデータ上: 横長 ({w}x{h})")
-            else:
-                print(f"  メタデータ上: 縦長 ({w}x{h})")
-
-            print(f"  回転メタデータ: {rotation}度")
-
-            if rotation in ['90', '-90', '270', '-270']:
-                print("  → 縦向きで撮影された動画です")
-                if w > h:
-                    print("  → OpenCVは横向きで読み込みます（回転補正が必要）")
-            else:
-                print("  → 横向きで撮影された動画です")
+    w = info["width"]
+    h = info["height"]
+    rotation = info["rotation"]
+
+    if w > h:
+        print(f"  メタデータ上: 横長 ({w}x{h})")
+    else:
+        print(f"  メタデータ上: 縦長 ({w}x{h})")
+
+    print(f"  回転メタデータ: {rotation}度")
+
+    if rotation in (90, 270):
+        print("  → 縦向きで撮影された動画です")
+        if w > h:
+            print("  → OpenCVは横向きで読み込みます（回転補正が必要）")
+    else:
+        print("  → 横向きで撮影された動画です")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,171 @@
+"""
+処理済みファイルの配信
+HTTP の Range リクエスト（バイト範囲の指定）に対応し、書き込み中の断片化 MP4 は
+書き込まれた分から順に送る
+"""
+
+import asyncio
+from pathlib import Path
+from typing import AsyncIterator, Callable, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+# 1回に読み込むバイト数
+DELIVERY_CHUNK_SIZE = 1024 * 1024
+# 書き込み中のファイルへの追記を確認する間隔（秒）
+TAIL_POLL_INTERVAL_SEC = 0.25
+
+
+def parse_range_spec(header: Optional[str]) -> Optional[tuple[Optional[int], Optional[int]]]:
+    """
+    Range ヘッダを解析（単一範囲のみ。複数範囲・不正な値は無視して全体を返す扱い）
+
+    Returns:
+        (開始, 終了)。"bytes=100-" なら (100, None)、末尾 N バイトの "bytes=-N" なら (None, N)
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        start = int(first) if first else None
+        end = int(last) if last else None
+    except ValueError:
+        return None
+    if start is None and end is None:
+        return None
+    if start is not None and end is not None and start > end:
+        return None
+    return start, end
+
+
+def resolve_range(spec: tuple[Optional[int], Optional[int]], size: int) -> Optional[tuple[int, int]]:
+    """
+    parse_range_spec の結果をファイルサイズに当てはめる
+
+    Returns:
+        (開始, 終了)（終了を含む）。範囲がファイル外の場合は None
+    """
+    start, end = spec
+    if start is None:
+        # 末尾 end バイト
+        if end == 0 or size == 0:
+            return None
+        return max(0, size - end), size - 1
+    if start >= size:
+        return None
+    return start, size - 1 if end is None else min(end, size - 1)
+
+
+async def _read_file(path: Path, start: int, length: int) -> AsyncIterator[bytes]:
+    """ファイルの start から length バイトをチャンク単位で読む"""
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = await asyncio.to_thread(f.read, min(DELIVERY_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+async def _tail_file(path: Path, start: int, is_writing: Callable[[], bool]) -> AsyncIterator[bytes]:
+    """書き込み中のファイルを追記に合わせて読む（書き込みが終わって末尾まで読んだら終了）"""
+    while not path.exists():
+        if not is_writing():
+            return
+        await asyncio.sleep(TAIL_POLL_INTERVAL_SEC)
+
+    with open(path, "rb") as f:
+        f.seek(start)
+        while True:
+            # 読み込みの前に確認し、書き込み終了後の最後の追記を読み逃さない
+            writing = is_writing()
+            chunk = await asyncio.to_thread(f.read, DELIVERY_CHUNK_SIZE)
+            if chunk:
+                yield chunk
+            elif not writing:
+                return
+            else:
+                await asyncio.sleep(TAIL_POLL_INTERVAL_SEC)
+
+
+def _download_headers(filename: Optional[str]) -> dict:
+    headers = {"Accept-Ranges": "bytes"}
+    if filename:
+        headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return headers
+
+
+def file_response(
+    path: Path,
+    range_header: Optional[str],
+    media_type: str,
+    filename: Optional[str] = None
+) -> StreamingResponse:
+    """
+    書き込み済みのファイルを返す（Range があれば 206 で指定範囲だけ）
+
+    Args:
+        path: 配信するファイル
+        range_header: リクエストの Range ヘッダ
+        media_type: Content-Type
+        filename: ダウンロード時のファイル名
+    """
+    size = path.stat().st_size
+    headers = _download_headers(filename)
+    spec = parse_range_spec(range_header)
+    if spec is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(_read_file(path, 0, size), media_type=media_type, headers=headers)
+
+    byte_range = resolve_range(spec, size)
+    if byte_range is None:
+        raise HTTPException(
+            status_code=416,
+            detail="指定された範囲がファイルの外です",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        _read_file(path, start, end - start + 1), status_code=206, media_type=media_type, headers=headers
+    )
+
+
+def growing_file_response(
+    path: Path,
+    range_header: Optional[str],
+    is_writing: Callable[[], bool],
+    media_type: str,
+    filename: Optional[str] = None
+) -> StreamingResponse:
+    """
+    書き込み中のファイルを返す
+
+    Range が無い（または先頭からの "bytes=0-"）場合は、書き込みに追従して最後まで送り続ける。
+    途中からの範囲は、その時点で書き込まれている分だけを 206 で返す（全体のサイズは未確定のため "*"）。
+
+    Args:
+        path: 配信するファイル（まだ作られていなくてもよい）
+        range_header: リクエストの Range ヘッダ
+        is_writing: 書き込みが続いているか
+        media_type: Content-Type
+        filename: ダウンロード時のファイル名
+    """
+    headers = {**_download_headers(filename), "Cache-Control": "no-store"}
+    spec = parse_range_spec(range_header)
+    if spec is None or spec == (0, None):
+        return StreamingResponse(_tail_file(path, 0, is_writing), media_type=media_type, headers=headers)
+
+    size = path.stat().st_size if path.exists() else 0
+    byte_range = resolve_range(spec, size)
+    if byte_range is None:
+        raise HTTPException(status_code=416, detail="指定された範囲はまだ書き込まれていません")
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/*"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        _read_file(path, start, end - start + 1), status_code=206, media_type=media_type, headers=headers
+    )
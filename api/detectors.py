@@ -0,0 +1,188 @@
+"""
+顔検出のバックエンド
+MediaPipe（BlazeFace short range）・OpenCV YuNet・Haar cascade を同じインターフェースで切り替える。
+どのバックエンドも (x, y, w, h, score) のリスト（入力画像の座標）を返すため、
+トラッキング・タイル分割・モザイクなど後段の処理はバックエンドによらず共通
+
+バックエンドごとに速度と見逃しの少なさが異なるため、compare_detectors.py で
+同じ動画を使って比較し、用途ごとに選ぶ
+"""
+
+import os
+from pathlib import Path
+from typing import Any, Optional
+
+import cv2
+import numpy as np
+from fastapi import HTTPException
+
+MODELS_DIR = Path(__file__).parent / "models"
+# デフォルトのバックエンド（リクエストの detector で上書きできる）
+DETECTOR_BACKEND = os.environ.get("MOSAIC_DETECTOR", "mediapipe")
+
+# MediaPipe Face Detector タスク用のモデル（Face Detector タスク向けに公開されているのは short range のみ。
+# 遠くの小さな顔には yunet かタイル分割検出を使う）
+MEDIAPIPE_SHORT_MODEL = MODELS_DIR / "blaze_face_short_range.tflite"
+# OpenCV Zoo の YuNet（cv2.FaceDetectorYN 用の ONNX）
+YUNET_MODEL = Path(os.environ.get("MOSAIC_YUNET_MODEL", MODELS_DIR / "face_detection_yunet_2023mar.onnx"))
+# OpenCV に同梱の Haar cascade（モデルのダウンロードが不要）
+HAAR_CASCADE = Path(cv2.data.haarcascades) / "haarcascade_frontalface_default.xml"
+
+# 検出のしきい値（見逃しを減らすため、各モデルの推奨値より低めにしている）
+MEDIAPIPE_MIN_CONFIDENCE = 0.3
+YUNET_SCORE_THRESHOLD = 0.6
+YUNET_NMS_THRESHOLD = 0.3
+# Haar cascade: 同じ位置で重なった候補がこの数以上なら顔とみなす
+HAAR_MIN_NEIGHBORS = 4
+HAAR_MIN_SIZE = 20
+
+
+class DetectorBackend:
+    """
+    顔検出のバックエンドの基底クラス
+
+    検出は prepare（色変換など入力の準備）と detect（推論）の2段階に分け、
+    処理時間をそれぞれ cvt_color / detect として記録できるようにする。
+    インスタンスはスレッドセーフではないため、並行に検出する場合はスレッドごとに作成する。
+    """
+
+    name = ""
+
+    def prepare(self, frame: np.ndarray) -> Any:
+        """BGR のフレームを推論の入力に変換"""
+        return frame
+
+    def detect(self, image: Any) -> list:
+        """
+        顔を検出
+
+        Returns:
+            (x, y, w, h, score) のリスト（入力画像の座標）
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """モデルを解放"""
+
+
+class MediaPipeBackend(DetectorBackend):
+    """MediaPipe Face Detector（BlazeFace）"""
+
+    def __init__(self, name: str, model_path: Path, min_confidence: float = MEDIAPIPE_MIN_CONFIDENCE):
+        import mediapipe as mp
+        from mediapipe.tasks import python
+        from mediapipe.tasks.python import vision
+
+        self.name = name
+        self._mp = mp
+        options = vision.FaceDetectorOptions(
+            base_options=python.BaseOptions(model_asset_path=str(model_path)),
+            min_detection_confidence=min_confidence
+        )
+        self._detector = vision.FaceDetector.create_from_options(options)
+
+    def prepare(self, frame: np.ndarray) -> Any:
+        # BGRからRGBに変換（MediaPipeはRGBを期待）
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        return self._mp.Image(image_format=self._mp.ImageFormat.SRGB, data=rgb_frame)
+
+    def detect(self, image: Any) -> list:
+        faces = []
+        for detection in self._detector.detect(image).detections:
+            bbox = detection.bounding_box
+            score = detection.categories[0].score if detection.categories else 0.0
+            faces.append((bbox.origin_x, bbox.origin_y, bbox.width, bbox.height, score))
+        return faces
+
+    def close(self) -> None:
+        self._detector.close()
+
+
+class YuNetBackend(DetectorBackend):
+    """OpenCV の YuNet（cv2.FaceDetectorYN）。入力サイズは画像ごとに合わせる"""
+
+    def __init__(self, name: str, model_path: Path, score_threshold: float = YUNET_SCORE_THRESHOLD):
+        self.name = name
+        self._detector = cv2.FaceDetectorYN.create(
+            str(model_path), "", (320, 320), score_threshold, YUNET_NMS_THRESHOLD
+        )
+        self._input_size = (320, 320)
+
+    def detect(self, image: np.ndarray) -> list:
+        size = (image.shape[1], image.shape[0])
+        if size != self._input_size:
+            self._detector.setInputSize(size)
+            self._input_size = size
+        _, detections = self._detector.detect(image)
+        if detections is None:
+            return []
+        # 各行は x, y, w, h, ランドマーク5点 (x, y), スコア
+        return [
+            (int(d[0]), int(d[1]), int(round(d[2])), int(round(d[3])), float(d[14]))
+            for d in detections
+        ]
+
+
+class HaarBackend(DetectorBackend):
+    """
+    OpenCV の Haar cascade（正面顔）
+
+    モデルのダウンロードが不要（OpenCV に同梱）。BlazeFace より遅く、横顔・小さな顔の見逃しや
+    誤検出も多いため、他のモデルが使えない環境向けの予備。スコアは常に1
+    """
+
+    def __init__(self, name: str, model_path: Path, min_neighbors: int = HAAR_MIN_NEIGHBORS):
+        self.name = name
+        self._cascade = cv2.CascadeClassifier(str(model_path))
+        if self._cascade.empty():
+            raise HTTPException(status_code=500, detail=f"Haar cascade を読み込めません: {model_path}")
+        self._min_neighbors = min_neighbors
+
+    def prepare(self, frame: np.ndarray) -> np.ndarray:
+        # ヒストグラム平坦化は行わない（候補が増えて検出が数倍遅くなる）
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    def detect(self, image: np.ndarray) -> list:
+        faces = self._cascade.detectMultiScale(
+            image, scaleFactor=1.1, minNeighbors=self._min_neighbors, minSize=(HAAR_MIN_SIZE, HAAR_MIN_SIZE)
+        )
+        return [(int(x), int(y), int(w), int(h), 1.0) for (x, y, w, h) in faces]
+
+
+# バックエンド名 -> (クラス, モデルのパス)
+BACKENDS = {
+    "mediapipe": (MediaPipeBackend, MEDIAPIPE_SHORT_MODEL),
+    "yunet": (YuNetBackend, YUNET_MODEL),
+    "haar": (HaarBackend, HAAR_CASCADE),
+}
+# リクエストのパラメータの検証用
+BACKEND_PATTERN = "^(" + "|".join(BACKENDS) + ")$"
+
+
+def backend_model_path(name: str) -> Path:
+    """バックエンドのモデルファイルのパス"""
+    return BACKENDS[name][1]
+
+
+def available_backends() -> list:
+    """モデルファイルがそろっていて使えるバックエンドの名前"""
+    return [name for name, (_, model_path) in BACKENDS.items() if model_path.exists()]
+
+
+def create_backend(name: Optional[str] = None) -> DetectorBackend:
+    """
+    バックエンドを作成
+
+    Args:
+        name: BACKENDS のキー（None なら DETECTOR_BACKEND）
+    """
+    name = name or DETECTOR_BACKEND
+    if name not in BACKENDS:
+        raise HTTPException(status_code=400, detail=f"不明な検出器です: {name}（{', '.join(BACKENDS)}）")
+    backend_class, model_path = BACKENDS[name]
+    if not model_path.exists():
+        raise HTTPException(
+            status_code=500,
+            detail=f"モデルファイルが見つかりません: {model_path}"
+        )
+    return backend_class(name, model_path)
@@ -0,0 +1,198 @@
+"""
+ffmpeg パイプによる動画の入出力
+デコーダ → process_frame → libx264 エンコーダ を生フレームのパイプでつなぎ、
+1本の動画につきデコード1回・エンコード1回で処理する
+"""
+
+import shutil
+import subprocess
+from typing import Optional
+
+import numpy as np
+
+from media_probe import probe_media
+
+# 断片化 MP4 の1フラグメントの長さ（秒）。この間隔でキーフレームを入れ、キーフレームごとに区切る
+FRAGMENT_DURATION_SEC = 2
+
+
+def movflags(fragmented: bool) -> list:
+    """
+    出力 MP4 のボックス配置の ffmpeg オプション
+
+    Args:
+        fragmented: True なら断片化 MP4（moov を先頭に書き、フラグメントを追記していく。
+            書き込み中のファイルも先頭から再生できる）。False なら書き終えてから moov を
+            先頭に移動する（faststart。ファイル全体の書き直しが発生する）
+    """
+    if fragmented:
+        return ['-movflags', '+frag_keyframe+empty_moov+default_base_moof']
+    return ['-movflags', '+faststart']
+
+
+def ffmpeg_available() -> bool:
+    """ffmpeg / ffprobe が利用可能か"""
+    return shutil.which("ffmpeg") is not None and shutil.which("ffprobe") is not None
+
+
+def probe_video(video_path: str, file_hash: Optional[str] = None) -> dict:
+    """
+    映像ストリームの情報を取得（media_probe。同じ動画の2回目以降はキャッシュを使う）
+
+    Args:
+        file_hash: ファイルの内容のハッシュ（計算済みの場合）
+
+    Returns:
+        width, height（保存されている向きのサイズ）, fps, frame_rate（ffmpeg に渡す分数表記）,
+        total_frames（不明な場合は0）
+    """
+    info = probe_media(video_path, file_hash)
+    return {key: info[key] for key in ("width", "height", "fps", "frame_rate", "total_frames")}
+
+
+class FFmpegReader:
+    """
+    ffmpeg で動画をデコードし、BGR の生フレームを読み出す（cv2.VideoCapture 互換の read/release）
+
+    自動回転は無効化するため、フレームは保存されている向きのまま返る。
+    """
+
+    def __init__(
+        self,
+        video_path: str,
+        width: int,
+        height: int,
+        start_time: Optional[float] = None,
+        max_frames: Optional[int] = None
+    ):
+        """
+        Args:
+            video_path: 入力動画パス
+            width, height: フレームサイズ（保存されている向き）
+            start_time: 読み込み開始時刻（秒）。デコードしながら正確な位置までシークする
+            max_frames: 読み込む最大フレーム数
+        """
+        self.width = width
+        self.height = height
+        self.frame_size = width * height * 3
+        command = ['ffmpeg', '-v', 'error', '-noautorotate']
+        if start_time is not None:
+            command += ['-ss', f'{start_time:.6f}']
+        command += ['-i', video_path, '-map', '0:v:0']
+        if max_frames is not None:
+            command += ['-frames:v', str(max_frames)]
+        command += ['-f', 'rawvideo', '-pix_fmt', 'bgr24', '-']
+        self.process = subprocess.Popen(
+            command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=self.frame_size
+        )
+
+    def read(self) -> tuple[bool, Optional[np.ndarray]]:
+        """1フレーム読み込む（書き込み可能な配列を返す）"""
+        frame = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        view = memoryview(frame).cast('B')
+        filled = 0
+        while filled < self.frame_size:
+            n = self.process.stdout.readinto(view[filled:])
+            if not n:
+                return False, None
+            filled += n
+        return True, frame
+
+    def release(self) -> None:
+        """デコーダを終了"""
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.stdout.close()
+        self.process.wait()
+
+
+class FFmpegWriter:
+    """
+    BGR の生フレームを標準入力で受け取り、libx264 でエンコードする（cv2.VideoWriter 互換の write/release）
+
+    回転フィルタと元動画の音声の多重化も同じ ffmpeg 呼び出しで行う。
+    """
+
+    def __init__(
+        self,
+        output_path: str,
+        width: int,
+        height: int,
+        frame_rate: str,
+        vf_filter: str,
+        audio_source: Optional[str] = None,
+        faststart: bool = True,
+        fragmented: bool = False,
+        inband_headers: bool = False
+    ):
+        """
+        Args:
+            output_path: 出力動画パス
+            width, height: 入力フレームサイズ
+            frame_rate: フレームレート（"30000/1001" などの分数表記も可）
+            vf_filter: 回転フィルタ
+            audio_source: 音声を取り出す元動画（None なら映像のみ）
+            faststart: moov を先頭に移動する（再生開始を早める。中間ファイルでは不要）
+            fragmented: 断片化 MP4 で書き出す（faststart より優先。処理中のファイルを配信できる）
+            inband_headers: SPS/PPS をキーフレームごとにストリーム内にも書く（別のエンコーダの GOP と結合する場合）
+        """
+        self.output_path = output_path
+        command = [
+            'ffmpeg', '-y', '-v', 'error',
+            '-f', 'rawvideo',
+            '-pix_fmt', 'bgr24',
+            '-s', f'{width}x{height}',
+            '-r', frame_rate,
+            '-i', '-',
+        ]
+        if audio_source:
+            command += ['-i', audio_source]
+        command += [
+            '-vf', vf_filter,
+            '-map', '0:v:0',
+        ]
+        if audio_source:
+            command += ['-map', '1:a:0?', '-c:a', 'aac']
+        command += [
+            '-c:v', 'libx264',
+            '-preset', 'fast',
+            '-crf', '23',
+            '-pix_fmt', 'yuv420p',
+            '-metadata:s:v', 'rotate=0',
+        ]
+        if inband_headers:
+            command += ['-x264-params', 'repeat-headers=1']
+        if fragmented:
+            command += ['-force_key_frames', f'expr:gte(t,n_forced*{FRAGMENT_DURATION_SEC})']
+            command += movflags(True)
+        elif faststart:
+            command += movflags(False)
+        command.append(output_path)
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def write(self, frame: np.ndarray) -> None:
+        """1フレーム書き込む"""
+        try:
+            self.process.stdin.write(memoryview(np.ascontiguousarray(frame)).cast('B'))
+        except BrokenPipeError:
+            raise RuntimeError(f"ffmpeg encoder error: {self._stderr()}")
+
+    def release(self) -> None:
+        """入力を閉じてエンコードの完了を待つ"""
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        stderr = self._stderr()
+        if self.process.wait() != 0:
+            raise RuntimeError(f"ffmpeg encoder error: {stderr}")
+
+    def kill(self) -> None:
+        """エンコードを中断"""
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+
+    def _stderr(self) -> str:
+        """終了したエンコーダのエラー出力を取得"""
+        return self.process.stderr.read().decode(errors="replace")
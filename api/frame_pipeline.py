@@ -0,0 +1,151 @@
+"""
+動画フレームのパイプライン処理
+デコード・顔検出・モザイク＋エンコードを別々のスレッドで並行に実行し、上限付きのキューでつなぐ。
+OpenCV・MediaPipe の処理や ffmpeg パイプの読み書きは GIL を解放するため、1本の動画でも複数コアを使える
+"""
+
+import os
+import queue
+import threading
+from typing import Any, Callable, Iterator, Optional
+
+# 段と段の間のキューに溜めるフレーム数の上限（0ならスレッドを使わずに順番に処理する）
+PIPELINE_QUEUE_SIZE = int(os.environ.get("MOSAIC_PIPELINE_QUEUE_SIZE", 8))
+# 停止の確認間隔（秒）。キューの空き・到着を待つ間に他の段の失敗に気付くため
+_POLL_INTERVAL_SEC = 0.1
+
+_END = object()
+
+
+class FramePipeline:
+    """
+    デコード（read）→ 呼び出し元のスレッド（顔検出）→ モザイク＋エンコード（consume）の3段
+
+    デコードと consume はそれぞれ専用のスレッドで動く。キューに上限があるため、遅い段があれば
+    前の段が待たされ（バックプレッシャー）、メモリに載るフレーム数は上限で抑えられる。
+    各段は1スレッドずつなので、フレームの順序は入力のまま保たれる。
+    いずれかの段で例外が起きた場合は全段を止め、呼び出し元のスレッドで同じ例外を送出する。
+
+    使い方:
+        with FramePipeline(reader.read, consume) as pipeline:
+            for frame in pipeline.frames():
+                pipeline.submit((frame, detect(frame)))
+    """
+
+    def __init__(
+        self,
+        read: Callable[[], tuple[bool, Any]],
+        consume: Callable[[Any], None],
+        queue_size: int = PIPELINE_QUEUE_SIZE
+    ):
+        """
+        Args:
+            read: (ret, frame) を返すデコード関数（cv2.VideoCapture.read / FFmpegReader.read）
+            consume: 顔検出の済んだ項目を受け取る関数（モザイク＋エンコード）
+            queue_size: キューの上限（0ならスレッドを使わない）
+        """
+        self._read = read
+        self._consume = consume
+        self.threaded = queue_size > 0
+        self._decoded: queue.Queue = queue.Queue(max(1, queue_size))
+        self._pending: queue.Queue = queue.Queue(max(1, queue_size))
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._threads: list = []
+
+    def __enter__(self) -> "FramePipeline":
+        if self.threaded:
+            self._threads = [
+                threading.Thread(target=self._decode_loop, name="mosaic-decode", daemon=True),
+                threading.Thread(target=self._consume_loop, name="mosaic-encode", daemon=True),
+            ]
+            for thread in self._threads:
+                thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if not self.threaded:
+            return
+        if exc_type is None:
+            # 残りのフレームを書き終えるまで待つ
+            self._put(self._pending, _END)
+        else:
+            self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        if exc_type is None:
+            self._raise_if_failed()
+
+    def frames(self) -> Iterator[Any]:
+        """デコードしたフレームを順に返す"""
+        if not self.threaded:
+            while True:
+                ret, frame = self._read()
+                if not ret:
+                    return
+                yield frame
+
+        while True:
+            item = self._get(self._decoded)
+            if item is _END:
+                break
+            yield item
+        self._raise_if_failed()
+
+    def submit(self, item: Any) -> None:
+        """顔検出の済んだ項目を次の段に渡す（キューが一杯なら空くまで待つ）"""
+        if not self.threaded:
+            self._consume(item)
+            return
+        if not self._put(self._pending, item):
+            self._raise_if_failed()
+
+    def _decode_loop(self) -> None:
+        try:
+            while not self._stop.is_set():
+                ret, frame = self._read()
+                if not ret:
+                    break
+                if not self._put(self._decoded, frame):
+                    return
+        except BaseException as e:
+            self._fail(e)
+        self._put(self._decoded, _END)
+
+    def _consume_loop(self) -> None:
+        try:
+            while True:
+                item = self._get(self._pending)
+                if item is _END:
+                    return
+                self._consume(item)
+        except BaseException as e:
+            self._fail(e)
+
+    def _put(self, q: queue.Queue, item: Any) -> bool:
+        """停止されるまで空きを待って入れる（停止された場合は False）"""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=_POLL_INTERVAL_SEC)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue) -> Any:
+        """停止されるまで到着を待って取り出す（停止された場合は _END）"""
+        while True:
+            try:
+                return q.get(timeout=_POLL_INTERVAL_SEC)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return _END
+
+    def _fail(self, error: BaseException) -> None:
+        if self._error is None:
+            self._error = error
+        self._stop.set()
+
+    def _raise_if_failed(self) -> None:
+        if self._error is not None:
+            raise self._error
@@ -0,0 +1,147 @@
+"""
+アップロードの取り込み
+アップロードをチャンク単位でディスクに書き出し、サイズ上限と先頭バイト（マジックナンバー）による
+形式チェックを読み込みながら行う。ハッシュも同時に計算するため、ファイル全体をメモリに載せない
+"""
+
+import asyncio
+import hashlib
+import os
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+from fastapi import HTTPException, UploadFile
+
+# 1回に読み込むバイト数
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# アップロードできる動画・画像のサイズの上限（バイト）
+MAX_VIDEO_BYTES = int(os.environ.get("MOSAIC_MAX_VIDEO_BYTES", 4 * 1024 ** 3))
+MAX_IMAGE_BYTES = int(os.environ.get("MOSAIC_MAX_IMAGE_BYTES", 50 * 1024 ** 2))
+
+VIDEO_FORMATS = {"mp4": ".mp4", "webm": ".webm", "avi": ".avi"}
+IMAGE_FORMATS = {"jpeg": ".jpg", "png": ".png", "webp": ".webp"}
+
+# 形式の判定に必要な先頭のバイト数
+SNIFF_BYTES = 12
+
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """
+    先頭バイトからファイル形式を判定
+
+    Returns:
+        "mp4"（mov を含む）/ "webm"（mkv を含む）/ "avi" / "jpeg" / "png" / "webp"。不明な場合は None
+    """
+    if head[4:8] in (b"ftyp", b"moov", b"mdat", b"wide", b"free", b"skip"):
+        return "mp4"
+    if head.startswith(b"\x1a\x45\xdf\xa3"):
+        return "webm"
+    if head.startswith(b"RIFF") and head[8:12] == b"AVI ":
+        return "avi"
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return "webp"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    return None
+
+
+async def iter_upload(file: UploadFile) -> AsyncIterator[bytes]:
+    """UploadFile をチャンク単位で読み込む"""
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        yield chunk
+
+
+async def _read_checked(
+    chunks: AsyncIterator[bytes],
+    max_bytes: int,
+    formats: dict
+) -> AsyncIterator[tuple[str, bytes]]:
+    """
+    サイズ上限と形式をチェックしながらチャンクを返す
+
+    最初に判定した形式と各チャンクの組を返す。上限を超えた時点・形式が不明な時点で中断する。
+    """
+    head = b""
+    fmt = None
+    total = 0
+    async for chunk in chunks:
+        total += len(chunk)
+        if total > max_bytes:
+            raise HTTPException(status_code=413, detail=f"ファイルサイズが上限（{max_bytes} バイト）を超えています")
+
+        if fmt is None:
+            # 形式を判定できるだけのバイト数が揃うまで貯める
+            head += chunk
+            if len(head) < SNIFF_BYTES:
+                continue
+            fmt = sniff_format(head)
+            if fmt not in formats:
+                raise HTTPException(status_code=415, detail="サポートされていないファイル形式です")
+            chunk, head = head, b""
+        yield fmt, chunk
+
+    if fmt is None:
+        fmt = sniff_format(head)
+        if fmt not in formats:
+            raise HTTPException(status_code=415, detail="サポートされていないファイル形式です")
+        if head:
+            yield fmt, head
+
+
+async def save_upload(
+    chunks: AsyncIterator[bytes],
+    dest: Path,
+    max_bytes: int = MAX_VIDEO_BYTES,
+    formats: dict = VIDEO_FORMATS
+) -> tuple[str, int, str]:
+    """
+    アップロードをチャンク単位でファイルに保存
+
+    Args:
+        chunks: アップロードの内容（UploadFile なら iter_upload、生のボディなら request.stream()）
+        dest: 保存先
+        max_bytes: サイズの上限（超えた時点で 413）
+        formats: 受け付ける形式（形式が違えば 415）
+
+    Returns:
+        判定した形式、サイズ、内容の SHA-256
+    """
+    h = hashlib.sha256()
+    size = 0
+    fmt = None
+
+    def write_chunk(f, chunk: bytes) -> None:
+        f.write(chunk)
+        h.update(chunk)
+
+    try:
+        with open(dest, "wb") as f:
+            async for fmt, chunk in _read_checked(chunks, max_bytes, formats):
+                # ディスク書き込みとハッシュ計算はスレッドで行い、イベントループを止めない
+                await asyncio.to_thread(write_chunk, f, chunk)
+                size += len(chunk)
+    except BaseException:
+        dest.unlink(missing_ok=True)
+        raise
+
+    return fmt, size, h.hexdigest()
+
+
+async def read_upload(
+    chunks: AsyncIterator[bytes],
+    max_bytes: int = MAX_IMAGE_BYTES,
+    formats: dict = IMAGE_FORMATS
+) -> tuple[str, bytes]:
+    """
+    アップロードをサイズ上限・形式をチェックしながらメモリに読み込む（画像用）
+
+    Returns:
+        判定した形式、内容
+    """
+    buffer = bytearray()
+    fmt = None
+    async for fmt, chunk in _read_checked(chunks, max_bytes, formats):
+        buffer += chunk
+    return fmt, bytes(buffer)
@@ -0,0 +1,470 @@
+"""
+動画処理ジョブ管理
+ProcessPoolExecutor 上で process_video を実行し、ジョブの状態を保持する
+（分割処理のジョブは親プロセスのスレッドで進行を管理し、各セグメントを同じプロセスプールで処理する）
+"""
+
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import CancelledError, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional
+
+from admission import Workload
+from metrics import REGISTRY, StageMetrics
+
+# ワーカープロセス数（デフォルトはCPUコア数）
+MAX_WORKERS = int(os.environ.get("MOSAIC_MAX_WORKERS", os.cpu_count() or 1))
+# 完了したジョブ情報を保持する秒数
+JOB_RETENTION_SEC = int(os.environ.get("MOSAIC_JOB_RETENTION_SEC", 3600))
+# ワーカーから親プロセスへ進捗を書き込む最小間隔（秒）
+PROGRESS_INTERVAL_SEC = 0.5
+# セグメントのワーカーがキャンセル要求を確認する最小間隔（秒。フレームごとに呼ばれるがプロセス間通信を減らす）
+CANCEL_POLL_INTERVAL_SEC = 0.1
+
+
+class JobCancelled(Exception):
+    """ジョブがキャンセルされた"""
+
+
+class JobFailed(Exception):
+    """ワーカー内でのジョブ失敗（プロセス間で受け渡せるよう args に値を保持）"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+    def __str__(self) -> str:
+        return self.detail
+
+
+class CancelFlag:
+    """
+    ジョブのキャンセル要求（Manager の共有辞書のジョブID のキー）
+
+    pickle できるため、分割処理のセグメントのワーカープロセスにも渡せる。
+    セグメントの1つが失敗した場合は、set() で残りのセグメントも止める
+    """
+
+    def __init__(self, cancel_requests, job_id: str):
+        self._cancel_requests = cancel_requests
+        self._job_id = job_id
+        self._checked_at = 0.0
+
+    def is_set(self) -> bool:
+        return bool(self._cancel_requests.get(self._job_id))
+
+    def set(self) -> None:
+        self._cancel_requests[self._job_id] = True
+
+    def check(self) -> None:
+        """キャンセルされていれば JobCancelled を送出（CANCEL_POLL_INTERVAL_SEC ごとに確認）"""
+        now = time.monotonic()
+        if now - self._checked_at < CANCEL_POLL_INTERVAL_SEC:
+            return
+        self._checked_at = now
+        if self.is_set():
+            raise JobCancelled()
+
+
+# --- ワーカープロセス側 ---
+
+_cancel_requests = None  # ジョブID -> True（親プロセスが書き込む）
+_progress = None  # ジョブID -> {"phase", "processed_frames", "total_frames", "fps", "eta_sec"}
+
+
+def _init_worker(cancel_requests, progress) -> None:
+    """ワーカー起動時に共有状態を受け取り、ワーカー専用の Face Detector を生成してウォームアップ"""
+    global _cancel_requests, _progress
+    _cancel_requests = cancel_requests
+    _progress = progress
+
+    import main
+
+    # fork された場合に親の検出器を引き継がないよう作り直す
+    main.detectors.clear()
+    try:
+        main.warm_up_detector()
+    except Exception as e:
+        # モデルが無い場合などはジョブ実行時にエラーを返す
+        print(f"Detector init error in worker: {e}")
+
+
+def _run_video_job(
+    job_id: str,
+    input_path: str,
+    output_path: str,
+    options: dict,
+    submitted_at: float,
+    shared: Optional[tuple] = None,
+    segment_executor: Optional[Executor] = None
+) -> dict:
+    """
+    ワーカープロセスで動画処理を実行
+
+    Args:
+        shared: (キャンセル要求, 進捗) の共有辞書（親プロセスのスレッドで実行する場合。None ならワーカーの共有状態）
+        segment_executor: 分割処理のセグメントを処理するプロセスプール
+    """
+    from fastapi import HTTPException
+    import main
+
+    cancel_requests, progress = shared if shared is not None else (_cancel_requests, _progress)
+
+    # 投入からワーカーが処理を始めるまでの待ち時間
+    metrics = StageMetrics()
+    metrics.observe("queue_wait", max(0.0, time.time() - submitted_at))
+    last_report = 0.0
+    last_frames = 0
+    last_phase = "starting"
+
+    def on_progress(processed_frames: int, total_frames: int, phase: str = "detecting") -> None:
+        """
+        進捗を親プロセスに書き込む（PROGRESS_INTERVAL_SEC ごと、フェーズが変わった場合はすぐに）
+
+        Args:
+            phase: "detecting"（フレームごとの検出・モザイク処理）/ "encoding"（エンコードの完了待ち・結合）
+        """
+        nonlocal last_report, last_frames, last_phase
+        now = time.monotonic()
+        if phase == last_phase and now - last_report < PROGRESS_INTERVAL_SEC:
+            return
+        if cancel_requests.get(job_id):
+            raise JobCancelled()
+
+        # 直前の報告からの処理速度（報告の間隔で平均した現在の fps）
+        fps = eta_sec = None
+        if phase == last_phase == "detecting" and now > last_report:
+            fps = (processed_frames - last_frames) / (now - last_report)
+            if fps > 0 and total_frames > 0:
+                eta_sec = round(max(0, total_frames - processed_frames) / fps, 1)
+            fps = round(fps, 1)
+        last_report, last_frames, last_phase = now, processed_frames, phase
+        progress[job_id] = {
+            "phase": phase,
+            "processed_frames": processed_frames,
+            "total_frames": total_frames,
+            "fps": fps,
+            "eta_sec": eta_sec,
+        }
+
+    progress[job_id] = {
+        "phase": "starting", "processed_frames": 0, "total_frames": 0, "fps": None, "eta_sec": None
+    }
+    try:
+        return main.process_video(
+            input_path,
+            output_path,
+            progress_callback=on_progress,
+            cancel_flag=CancelFlag(cancel_requests, job_id),
+            metrics=metrics,
+            segment_executor=segment_executor,
+            **options
+        )
+    except HTTPException as e:
+        raise JobFailed(e.status_code, str(e.detail))
+    except JobCancelled:
+        Path(output_path).unlink(missing_ok=True)
+        raise
+    except Exception as e:
+        raise JobFailed(500, str(e))
+
+
+def _wait_workers(barrier) -> int:
+    """全ワーカーがそろうまで待つ（ウォームアップのタスクが同じワーカーに重ならないように）"""
+    barrier.wait()
+    return os.getpid()
+
+
+# --- 親プロセス側 ---
+
+class JobManager:
+    """
+    動画処理ジョブの投入・状態管理・キャンセルを行う
+
+    ワーカーはそれぞれ独自の Face Detector を持つため、
+    同時に処理できる動画の数はワーカー数に比例する。
+    分割処理のジョブは親プロセスのスレッドで実行し、セグメントを他のジョブと同じワーカーで処理する
+    （ワーカーを占有して待つことが無いため、セグメントがワーカーの空きを待ってもデッドロックしない）。
+    """
+
+    def __init__(self, max_workers: int = MAX_WORKERS):
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._coordinator: Optional[ThreadPoolExecutor] = None
+        self._manager = None
+        self._cancel_requests = None
+        self._progress = None
+        self._jobs: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """プロセスプールを遅延生成"""
+        with self._lock:
+            if self._executor is None:
+                ctx = multiprocessing.get_context("spawn")
+                self._manager = ctx.Manager()
+                self._cancel_requests = self._manager.dict()
+                self._progress = self._manager.dict()
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=ctx,
+                    initializer=_init_worker,
+                    initargs=(self._cancel_requests, self._progress)
+                )
+            return self._executor
+
+    def _get_coordinator(self) -> ThreadPoolExecutor:
+        """分割処理のジョブを実行するスレッドプールを遅延生成"""
+        with self._lock:
+            if self._coordinator is None:
+                self._coordinator = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="mosaic-segments"
+                )
+            return self._coordinator
+
+    def submit_video(
+        self,
+        job_id: str,
+        input_path: str,
+        output_path: str,
+        on_done: Optional[Callable[[dict], None]] = None,
+        cost_sec: float = 0.0,
+        segmented: bool = False,
+        **options
+    ) -> str:
+        """
+        動画処理ジョブを投入
+
+        Args:
+            job_id: ジョブID（出力ファイルの file_id と共通）
+            input_path: 入力動画パス（ジョブ終了時に削除される）
+            output_path: 出力動画パス
+            on_done: ジョブ終了時に状態の辞書を受け取るコールバック
+            cost_sec: 見積もり処理コスト（受け付け制御の待ち時間の見積もり用）
+            segmented: 分割処理のジョブ（親プロセスのスレッドで実行し、セグメントをワーカーで処理する）
+            **options: process_video に渡すパラメータ
+
+        Returns:
+            ジョブID
+        """
+        executor = self._get_executor()
+        self._prune()
+
+        if segmented:
+            future = self._get_coordinator().submit(
+                _run_video_job, job_id, input_path, output_path, options, time.time(),
+                shared=(self._cancel_requests, self._progress),
+                segment_executor=executor
+            )
+        else:
+            future = executor.submit(_run_video_job, job_id, input_path, output_path, options, time.time())
+        job = {
+            "job_id": job_id,
+            "status": "queued",
+            "created_at": time.time(),
+            "finished_at": None,
+            "input_path": input_path,
+            "output_path": output_path,
+            "output_format": options.get("output_format", "mp4"),
+            "cost_sec": cost_sec,
+            "stats": None,
+            "error": None,
+            "status_code": None,
+            "future": future,
+            "on_done": on_done,
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+
+        future.add_done_callback(lambda f: self._on_done(job_id, f))
+        return job_id
+
+    def warm_up(self, timeout: float = 300) -> None:
+        """
+        すべてのワーカープロセスを起動し、Face Detector のウォームアップが終わるまで待つ
+
+        ワーカーは初期化（_init_worker）を終えてからタスクを受け取るため、ワーカー数と同じ数の
+        タスクを全員がそろうまで待たせることで、全ワーカーの初期化の完了を確認する。
+        """
+        executor = self._get_executor()
+        barrier = self._manager.Barrier(self.max_workers, timeout=timeout)
+        futures = [executor.submit(_wait_workers, barrier) for _ in range(self.max_workers)]
+        for future in futures:
+            future.result(timeout=timeout)
+
+    def _on_done(self, job_id: str, future: Future) -> None:
+        """ジョブ終了時に状態を更新し、入力ファイルを削除"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job["finished_at"] = time.time()
+            try:
+                stats = future.result()
+                # ワーカーの処理時間の集計は /metrics にまとめ、ジョブの結果には内訳だけを残す
+                REGISTRY.merge(stats.pop("metrics", None))
+                job["stats"] = stats
+                job["status"] = "completed"
+            except (CancelledError, JobCancelled):
+                job["status"] = "cancelled"
+            except JobFailed as e:
+                job["status"] = "failed"
+                job["error"] = e.detail
+                job["status_code"] = e.status_code
+            except Exception as e:
+                job["status"] = "failed"
+                job["error"] = str(e)
+                job["status_code"] = 500
+
+        Path(job["input_path"]).unlink(missing_ok=True)
+        REGISTRY.inc("mosaic_jobs_total", status=job["status"])
+        if job["status"] != "completed":
+            Path(job["output_path"]).unlink(missing_ok=True)
+        else:
+            try:
+                REGISTRY.inc("mosaic_output_bytes_total", Path(job["output_path"]).stat().st_size, kind="video")
+            except OSError:
+                pass
+        if job["on_done"] is not None:
+            job["on_done"](job)
+        try:
+            # キャンセル要求は残す（起動中の分割処理のセグメントが後から確認するため。_prune で削除する）
+            self._progress.pop(job_id, None)
+        except (AttributeError, OSError):
+            # 停止処理中で共有状態がすでに閉じられている
+            pass
+
+    def add_completed(self, job_id: str, stats: dict) -> None:
+        """処理済みの結果（キャッシュヒットなど）を完了したジョブとして登録"""
+        future: Future = Future()
+        future.set_result(stats)
+        now = time.time()
+        with self._lock:
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "status": "completed",
+                "created_at": now,
+                "finished_at": now,
+                "input_path": None,
+                "output_path": None,
+                "output_format": stats.get("output_format", "mp4"),
+                "cost_sec": 0.0,
+                "stats": stats,
+                "error": None,
+                "status_code": None,
+                "future": future,
+                "on_done": None,
+            }
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """ジョブの状態を取得（公開用の辞書）"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            info = {
+                k: v for k, v in job.items()
+                if k not in ("future", "on_done", "input_path", "output_path", "cost_sec")
+            }
+
+        if info["status"] == "queued" and self._progress is not None:
+            progress = self._progress.get(job_id)
+            if progress is not None:
+                info["status"] = "running"
+                info["progress"] = progress
+            else:
+                info["queue_position"] = self._queue_position(job_id)
+        return info
+
+    def workload(self) -> list:
+        """終了していないジョブの Workload のリスト（受け付け制御用）"""
+        with self._lock:
+            active = [
+                (job_id, job["cost_sec"]) for job_id, job in self._jobs.items()
+                if job["status"] == "queued"
+            ]
+        progress = dict(self._progress) if self._progress is not None and active else {}
+        workload = []
+        for job_id, cost_sec in active:
+            p = progress.get(job_id)
+            done_ratio = p["processed_frames"] / p["total_frames"] if p and p["total_frames"] else 0.0
+            workload.append(Workload(cost_sec, running=p is not None, done_ratio=done_ratio))
+        return workload
+
+    def _queue_position(self, job_id: str) -> Optional[int]:
+        """処理を始めていないジョブの中での順番（1始まり。投入順に処理される）"""
+        with self._lock:
+            waiting = sorted(
+                (job["created_at"], jid) for jid, job in self._jobs.items() if job["status"] == "queued"
+            )
+        progress = dict(self._progress) if self._progress is not None else {}
+        position = 0
+        for _, jid in waiting:
+            if jid in progress:
+                continue
+            position += 1
+            if jid == job_id:
+                return position
+        return None
+
+    async def wait(self, job_id: str) -> dict:
+        """ジョブの完了を待って統計情報を返す（失敗時は JobFailed を送出）"""
+        with self._lock:
+            future = self._jobs[job_id]["future"]
+        return await asyncio.wrap_future(future)
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        ジョブをキャンセル
+
+        待機中のジョブはその場で取り消し、実行中のジョブはワーカーに
+        キャンセルを通知して次の進捗報告のタイミングで中断させる。
+
+        Returns:
+            キャンセルを受け付けた場合 True
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] not in ("queued", "running"):
+                return False
+            future = job["future"]
+
+        if not future.cancel():
+            self._cancel_requests[job_id] = True
+        return True
+
+    def _prune(self) -> None:
+        """保持期間を過ぎた終了済みジョブを削除"""
+        now = time.time()
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job["finished_at"] is not None and now - job["finished_at"] > JOB_RETENTION_SEC
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+        if expired and self._cancel_requests is not None:
+            try:
+                for job_id in expired:
+                    self._cancel_requests.pop(job_id, None)
+            except (AttributeError, OSError):
+                pass
+
+    def shutdown(self) -> None:
+        """プロセスプールを停止"""
+        with self._lock:
+            executor, manager, coordinator = self._executor, self._manager, self._coordinator
+            self._executor = None
+            self._manager = None
+            self._coordinator = None
+        if coordinator is not None:
+            coordinator.shutdown(wait=False, cancel_futures=True)
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        if manager is not None:
+            manager.shutdown()
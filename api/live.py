@@ -0,0 +1,111 @@
+"""
+ライブモード（WebSocket）
+カメラのプレビューなど、アップロードの完了を待てない用途向けに、エンコード済みのフレーム（JPEG / WebP）を
+1枚ずつ受け取ってモザイクを適用し、すぐに送り返す。
+処理が追いつかない場合は古いフレームを捨てて常に最新のフレームを処理し、遅延が積み上がらないようにする
+"""
+
+import time
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from compositor import DEFAULT_PADDING, MosaicCompositor
+from tracking import FaceTracker
+
+
+class LiveSession:
+    """
+    1接続分の処理状態
+
+    Face Detector は接続ごとに作成する（MediaPipe の検出器はスレッドセーフではなく、
+    複数の接続のフレームを並行に処理するため）。トラッカー・前フレームの顔の位置・
+    モザイクの作業用バッファもフレーム間で引き継ぐ。
+    """
+
+    def __init__(
+        self,
+        mosaic_ratio: float = 0.05,
+        padding: float = DEFAULT_PADDING,
+        detect_stride: int = 1,
+        detect_size: int = 0,
+        image_format: str = "jpeg",
+        quality: int = 80,
+        detector: Optional[str] = None
+    ):
+        """
+        Args:
+            mosaic_ratio: モザイクの粗さ
+            padding: 顔周りの余白
+            detect_stride: 顔検出を行うフレーム間隔（間のフレームはトラッキングで補う）
+            detect_size: 顔検出に使う画像の長辺（0なら元の解像度）
+            image_format: 送り返すフレームの形式（jpeg / webp）
+            quality: 送り返すフレームの品質（1〜100）
+            detector: 顔検出のバックエンド（None ならサーバーの設定）
+        """
+        import main
+
+        self._main = main
+        self.mosaic_ratio = mosaic_ratio
+        self.padding = padding
+        self.detect_stride = detect_stride
+        self.detect_size = detect_size
+        self.image_format = image_format
+        self.quality = quality
+        self.detector = main.create_detector(detector)
+        self._reset(None)
+
+    def _reset(self, shape: Optional[tuple]) -> None:
+        """フレームサイズが変わった場合にトラッキングの状態を作り直す"""
+        self._shape = shape
+        self.tracker = FaceTracker(self.detect_stride)
+        self.compositor = MosaicCompositor(self.mosaic_ratio)
+        self.previous_faces = None
+
+    def process(self, data: bytes) -> tuple[Optional[bytes], dict]:
+        """
+        エンコード済みのフレームを1枚処理
+
+        Returns:
+            (モザイク適用後のエンコード済みフレーム, 情報)。デコードできない場合はフレームが None で
+            情報に error を含む。情報には顔の数と、段階ごとの処理時間（ミリ秒）を含む
+        """
+        main = self._main
+        start = time.perf_counter()
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            return None, {"error": "フレームを読み込めません（JPEG / WebP / PNG に対応）"}
+        if image.shape != self._shape:
+            self._reset(image.shape)
+        decoded = time.perf_counter()
+
+        detections = self.tracker.update(
+            image, lambda frame: main.detect_faces(frame, self.detector, self.detect_size)
+        )
+        detected = time.perf_counter()
+
+        processed, face_count, current_faces = main.process_frame(
+            image, self.detector, self.mosaic_ratio, self.padding, self.previous_faces, detections,
+            compositor=self.compositor
+        )
+        if face_count > 0:
+            self.previous_faces = current_faces
+        mosaicked = time.perf_counter()
+
+        encoded = main.encode_image(processed, self.image_format, self.quality)
+        end = time.perf_counter()
+
+        return encoded, {
+            "faces": face_count,
+            "timings_ms": {
+                "decode": round((decoded - start) * 1000, 2),
+                "detect": round((detected - decoded) * 1000, 2),
+                "mosaic": round((mosaicked - detected) * 1000, 2),
+                "encode": round((end - mosaicked) * 1000, 2),
+            }
+        }
+
+    def close(self) -> None:
+        """Face Detector を解放"""
+        self.detector.close()
@@ -3,27 +3,66 @@ Face Mosaic API Server
 MediaPipe + OpenCV を使用した顔モザイク処理API
 """
 
+import time
+
+# 起動時間の計測の起点（モジュールの読み込み開始）
+IMPORT_STARTED = time.perf_counter()
+
+import asyncio
 import os
 import tempfile
+import threading
 import uuid
 import subprocess
 import json
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass
 from pathlib import Path
-from typing import Optional
+from concurrent.futures import Executor
+from typing import AsyncIterator, Callable, Optional
 
 import cv2
 import numpy as np
-import mediapipe as mp
-from mediapipe.tasks import python
-from mediapipe.tasks.python import vision
-from fastapi import FastAPI, File, UploadFile, HTTPException, Query
+from fastapi import Depends, FastAPI, File, UploadFile, HTTPException, Query, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+
+from admission import AdmissionController, AdmissionRejected, estimate_video_cost
+from compositor import DEFAULT_PADDING, MosaicCompositor
+from detectors import BACKEND_PATTERN, DETECTOR_BACKEND, DetectorBackend, backend_model_path, create_backend
+from delivery import file_response, growing_file_response
+from ffmpeg_pipe import FFmpegReader, FFmpegWriter, ffmpeg_available, movflags, probe_video
+from frame_pipeline import FramePipeline
+from ingest import (
+    IMAGE_FORMATS, MAX_IMAGE_BYTES, MAX_VIDEO_BYTES, VIDEO_FORMATS,
+    iter_upload, read_upload, save_upload
+)
+from jobs import CancelFlag, JobCancelled, JobFailed, JobManager
+from live import LiveSession
+from media_probe import probe_media
+from metrics import REGISTRY, StageMetrics
+from remux import process_video_remux
+from result_cache import CACHE_EVICT_INTERVAL_SEC, ResultCache, content_sha256
+from segments import effective_segments, process_video_segments
+from sidecar import DetectionRecorder, DetectionReplay, file_sha256, load_replay, sidecar_key
+from tiling import DetectorPool, merge_overlaps, plan_tiles
+from tracking import FaceTracker
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """起動時にキャッシュの削除処理とウォームアップをバックグラウンドで開始し、終了時に停止する"""
+    await start_cache_evictor()
+    await start_warm_up()
+    yield
+    await shutdown_workers()
+
 
 app = FastAPI(
     title="Face Mosaic API",
     description="MediaPipe + OpenCV による顔検出・モザイク処理API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS設定（Next.jsからのアクセスを許可）
@@ -33,43 +72,65 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # direct モードの画像レスポンスで検出した顔の数を返すヘッダ
+    expose_headers=["X-Faces-Detected"],
 )
 
-# モデルのパス
-MODEL_PATH = Path(__file__).parent / "models" / "blaze_face_short_range.tflite"
 OUTPUT_DIR = Path(tempfile.gettempdir()) / "face_mosaic_output"
 OUTPUT_DIR.mkdir(exist_ok=True)
-
-# Face Detector の初期化
-detector: Optional[vision.FaceDetector] = None
-
-
-def get_video_rotation(video_path: str) -> int:
-    """ffprobeを使用して動画の回転メタデータを取得し、0, 90, 180, 270に正規化する"""
+# フレームごとの顔検出結果（サイドカー）の保存先
+DETECTIONS_DIR = OUTPUT_DIR / "detections"
+
+# Face Detector（バックエンド名 -> インスタンス。使われたバックエンドだけを作成する）
+# mediapipe の読み込みは重い（約1秒）ため、実際の読み込みは Face Detector の作成時まで遅らせ、
+# サーバーの起動（ポートの待ち受け開始）を待たせない
+detectors: dict[str, DetectorBackend] = {}
+_detector_lock = threading.Lock()
+# タイル分割検出用の Face Detector（バックエンド名 -> プール。タイルを並行に検出するため複数持つ）
+detector_pools: dict[str, DetectorPool] = {}
+
+# 動画処理ジョブ（ワーカープロセスごとに Face Detector を持つ）
+job_manager = JobManager()
+# 混雑時の動画処理ジョブの受け付け制御
+admission = AdmissionController(job_manager.max_workers)
+# 起動時にワーカープロセスも立ち上げて Face Detector を準備する（無効にするとワーカーは最初のジョブで起動）
+WARMUP_WORKERS = os.environ.get("MOSAIC_WARMUP_WORKERS", "1") != "0"
+# 起動時の準備の状態（/ready で返す）。timings は各段階の所要時間と、読み込み開始からの経過時間（秒）
+startup_state: dict = {"ready": False, "error": None, "timings": {}}
+# ライブモードの同時接続数の上限（接続ごとに Face Detector を作り、API のプロセスで処理するため）
+MAX_LIVE_SESSIONS = int(os.environ.get("MOSAIC_MAX_LIVE_SESSIONS", os.cpu_count() or 1))
+# 接続中のライブモードのセッション数
+live_sessions = 0
+# 接続を受け付けない場合の WebSocket の close code（1013: Try Again Later）
+LIVE_TRY_AGAIN_CODE = 1013
+
+# 画像の出力形式: 拡張子、Content-Type、品質を指定する cv2.imwrite のフラグ（PNG は可逆のため品質なし）
+IMAGE_ENCODINGS = {
+    "png": (".png", "image/png", None),
+    "jpeg": (".jpg", "image/jpeg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", "image/webp", cv2.IMWRITE_WEBP_QUALITY),
+}
+# 処理結果の拡張子（{file_id}_output{拡張子} で保存する動画・画像）
+OUTPUT_EXTENSIONS = (".mp4",) + tuple(ext for ext, _, _ in IMAGE_ENCODINGS.values())
+
+# 処理結果のキャッシュ（内容のハッシュ＋パラメータ → 処理済みファイル）
+result_cache = ResultCache(OUTPUT_DIR, output_extensions=OUTPUT_EXTENSIONS)
+evictor_task: Optional[asyncio.Task] = None
+warmup_task: Optional[asyncio.Task] = None
+# 出力に影響する動画処理パラメータ（キャッシュキーに含める）
+VIDEO_CACHE_PARAMS = ("mosaic_ratio", "padding", "pipeline", "detector", "detect_stride", "detect_size", "motion_threshold",
+    "roi_full_scan_interval", "tile_size", "tile_overlap", "output_format", "smart_remux")
+
+# 進捗イベント（SSE）でジョブの状態を確認する間隔（秒）
+SSE_POLL_INTERVAL_SEC = 0.5
+# 進捗に変化がない場合もプロキシに切断されないようコメントを送る間隔（秒）
+SSE_KEEPALIVE_SEC = 15
+
+
+def get_video_rotation(video_path: str, file_hash: Optional[str] = None) -> int:
+    """動画の回転メタデータを取得し、0, 90, 180, 270に正規化する（media_probe。結果はキャッシュされる）"""
     try:
-        result = subprocess.run([
-            'ffprobe', '-v', 'quiet',
-            '-select_streams', 'v:0',
-            '-show_entries', 'stream_tags=rotate:stream_side_data=rotation',
-            '-print_format', 'json',
-            video_path
-        ], capture_output=True, text=True)
-
-        if result.returncode == 0:
-            data = json.loads(result.stdout)
-            stream = data.get('streams', [{}])[0]
-            
-            # 回転情報を取得（tags または side_data から）
-            rotation = stream.get('tags', {}).get('rotate', '0')
-            side_data = stream.get('side_data_list', [])
-            for sd in side_data:
-                if 'rotation' in sd:
-                    rotation = sd['rotation']
-            
-            rot_int = int(float(rotation))
-            # マイナスの回転（-90など）を正の数（270など）に変換し、360の範囲に収める
-            return rot_int % 360
-            
+        return probe_media(video_path, file_hash)["rotation"]
     except Exception as e:
         print(f"Error getting video rotation: {e}")
     return 0
@@ -102,23 +163,61 @@ def rotate_frame(frame: np.ndarray, rotation: int) -> np.ndarray:
     return frame
 
 
-def get_detector() -> vision.FaceDetector:
-    """Face Detector のシングルトンインスタンスを取得"""
-    global detector
-    if detector is None:
-        if not MODEL_PATH.exists():
-            raise HTTPException(
-                status_code=500,
-                detail=f"モデルファイルが見つかりません: {MODEL_PATH}"
-            )
+def create_detector(backend: Optional[str] = None) -> DetectorBackend:
+    """
+    Face Detector を作成
+
+    Args:
+        backend: 検出のバックエンド（detectors.BACKENDS のキー。None なら DETECTOR_BACKEND）
+    """
+    return create_backend(backend)
+
+
+def get_detector(backend: Optional[str] = None) -> DetectorBackend:
+    """バックエンドごとの Face Detector のシングルトンインスタンスを取得"""
+    backend = backend or DETECTOR_BACKEND
+    face_detector = detectors.get(backend)
+    if face_detector is None:
+        with _detector_lock:
+            face_detector = detectors.get(backend)
+            if face_detector is None:
+                face_detector = detectors[backend] = create_detector(backend)
+    return face_detector
+
+
+def warm_up_detector() -> dict:
+    """
+    デフォルトのバックエンドの Face Detector を作成し、ダミーの画像で1回推論しておく
+    （最初のリクエストの待ち時間を無くす）
+
+    Returns:
+        各段階の所要時間（mediapipe_import_sec（MediaPipe の場合のみ）/ detector_load_sec / warmup_inference_sec）
+    """
+    timings = {}
+    start = time.perf_counter()
+    if DETECTOR_BACKEND.startswith("mediapipe"):
+        import mediapipe  # noqa: F401
+        start = _elapsed(timings, "mediapipe_import_sec", start)
+    face_detector = get_detector()
+    start = _elapsed(timings, "detector_load_sec", start)
+    detect_faces(np.zeros((256, 256, 3), dtype=np.uint8), face_detector)
+    _elapsed(timings, "warmup_inference_sec", start)
+    return timings
+
+
+def _elapsed(timings: dict, key: str, start: float) -> float:
+    now = time.perf_counter()
+    timings[key] = round(now - start, 3)
+    return now
 
-        base_options = python.BaseOptions(model_asset_path=str(MODEL_PATH))
-        options = vision.FaceDetectorOptions(
-            base_options=base_options,
-            min_detection_confidence=0.3  # 感度を上げる（0.5→0.3）
-        )
-        detector = vision.FaceDetector.create_from_options(options)
-    return detector
+
+def get_detector_pool(backend: Optional[str] = None) -> DetectorPool:
+    """タイル分割検出用の Face Detector のプールを取得（バックエンドごとに初回のタイル分割検出で作成）"""
+    backend = backend or DETECTOR_BACKEND
+    with _detector_lock:
+        if backend not in detector_pools:
+            detector_pools[backend] = DetectorPool(lambda: create_detector(backend))
+        return detector_pools[backend]
 
 
 def apply_mosaic(image: np.ndarray, x: int, y: int, w: int, h: int, ratio: float = 0.05) -> np.ndarray:
@@ -152,46 +251,156 @@ def apply_mosaic(image: np.ndarray, x: int, y: int, w: int, h: int, ratio: float
     return image
 
 
+def detect_faces(
+    frame: np.ndarray,
+    face_detector: DetectorBackend,
+    detect_size: int = 0,
+    metrics: Optional[StageMetrics] = None
+) -> list:
+    """
+    フレームから顔を検出（引数は detect_faces_scored と同じ）
+
+    Returns:
+        顔のバウンディングボックス (x, y, w, h) のリスト（パディングなし、元の解像度の座標）
+    """
+    return [face[:4] for face in detect_faces_scored(frame, face_detector, detect_size, metrics)]
+
+
+def detect_faces_scored(
+    frame: np.ndarray,
+    face_detector: DetectorBackend,
+    detect_size: int = 0,
+    metrics: Optional[StageMetrics] = None
+) -> list:
+    """
+    フレームから顔を検出し、検出のスコアも返す
+
+    Args:
+        frame: 入力フレーム (BGR)
+        face_detector: Face Detector（検出のバックエンド）
+        detect_size: 検出に使う画像の長辺（px）。フレームがこれより大きい場合は
+            縮小した画像で検出し、座標を元の解像度に戻す（0なら縮小しない）
+        metrics: 処理時間の記録先（縮小・色変換は cvt_color、検出は detect）
+
+    Returns:
+        (x, y, w, h, score) のリスト（パディングなし、元の解像度の座標）
+    """
+    start = time.perf_counter()
+    height, width = frame.shape[:2]
+    scale_x = scale_y = 1.0
+    if detect_size and max(height, width) > detect_size:
+        # BlazeFace の入力は小さいため、縮小してから色変換・検出を行う
+        scale = detect_size / max(height, width)
+        small_w = max(1, round(width * scale))
+        small_h = max(1, round(height * scale))
+        frame = cv2.resize(frame, (small_w, small_h), interpolation=cv2.INTER_LINEAR)
+        scale_x = width / small_w
+        scale_y = height / small_h
+
+    # バックエンドの入力に変換（MediaPipe なら RGB、Haar cascade ならグレースケール）
+    image = face_detector.prepare(frame)
+    if metrics is not None:
+        start = metrics.since("cvt_color", start)
+
+    # 顔検出
+    detections = face_detector.detect(image)
+    if metrics is not None:
+        metrics.since("detect", start)
+
+    return [
+        (int(x * scale_x), int(y * scale_y), int(round(w * scale_x)), int(round(h * scale_y)), score)
+        for (x, y, w, h, score) in detections
+    ]
+
+
+def detect_faces_tiled(
+    frame: np.ndarray,
+    tile_size: int,
+    tile_overlap: float = 0.2,
+    detect_size: int = 0,
+    metrics: Optional[StageMetrics] = None,
+    backend: Optional[str] = None
+) -> list:
+    """
+    フレームを重なりのあるタイルに分けて顔を検出
+
+    各タイルは元の解像度のまま検出するため、フレーム全体を縮小して検出すると見逃す
+    小さな顔・遠くの顔も拾える。タイルより大きな顔のためにフレーム全体（detect_size、
+    指定が無ければ tile_size に縮小）も合わせて検出し、重なった結果は両方を囲むボックスにまとめる
+    （タイルの境界で切れた顔の一部のボックスだけが残って顔がはみ出さないようにする）。
+    タイルの検出は DetectorPool の検出器で並行に行う。
+
+    Args:
+        frame: 入力フレーム (BGR)
+        tile_size: タイルの辺（px）
+        tile_overlap: 隣り合うタイルの重なり（タイルの辺に対する割合）
+        detect_size: フレーム全体の検出に使う画像の長辺
+        metrics: 処理時間の記録先（タイルの検出全体を detect として記録）
+        backend: 検出のバックエンド（None なら DETECTOR_BACKEND）
+
+    Returns:
+        顔のバウンディングボックス (x, y, w, h) のリスト（元の解像度の座標）
+    """
+    height, width = frame.shape[:2]
+    tiles = plan_tiles(width, height, tile_size, tile_overlap)
+    if len(tiles) == 1:
+        # タイルに収まる（ROI 検出の切り出しなど）
+        return detect_faces(frame, get_detector(backend), detect_size, metrics)
+
+    def detect_tile(face_detector: DetectorBackend, tile: Optional[tuple]) -> list:
+        if tile is None:
+            return detect_faces_scored(frame, face_detector, detect_size or tile_size)
+        x1, y1, x2, y2 = tile
+        return [
+            (x + x1, y + y1, w, h, score)
+            for (x, y, w, h, score) in detect_faces_scored(frame[y1:y2, x1:x2], face_detector)
+        ]
+
+    start = time.perf_counter()
+    results = get_detector_pool(backend).map(detect_tile, [None] + tiles)
+    if metrics is not None:
+        metrics.since("detect", start)
+    return [face[:4] for face in merge_overlaps([face for faces in results for face in faces])]
+
+
 def process_frame(
     frame: np.ndarray,
-    face_detector: vision.FaceDetector,
+    face_detector: DetectorBackend,
     mosaic_ratio: float = 0.05,
-    padding: float = 0.4,
-    previous_faces: list = None
+    padding: float = DEFAULT_PADDING,
+    previous_faces: list = None,
+    detections: Optional[list] = None,
+    detect_size: int = 0,
+    compositor: Optional[MosaicCompositor] = None,
+    metrics: Optional[StageMetrics] = None
 ) -> tuple[np.ndarray, int, list]:
     """
     1フレームを処理し、顔にモザイクを適用
 
     Args:
         frame: 入力フレーム (BGR)
-        face_detector: MediaPipe Face Detector
+        face_detector: Face Detector（検出のバックエンド）
         mosaic_ratio: モザイクの粗さ
         padding: 顔周りの余白（%）
         previous_faces: 前フレームで検出された顔の位置（補間用）
+        detections: 検出済みの顔 (x, y, w, h) のリスト。指定時は顔検出を行わない（トラッキング結果など）
+        detect_size: 検出に使う画像の長辺（0なら元の解像度で検出）
+        compositor: モザイクの適用に使う MosaicCompositor（動画ではフレーム間で使い回す）
+        metrics: 処理時間・顔の数の記録先
 
     Returns:
         処理後のフレーム、検出された顔の数、顔の位置リスト
     """
-    # BGRからRGBに変換（MediaPipeはRGBを期待）
-    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_frame)
-
-    # 顔検出
-    detection_result = face_detector.detect(mp_image)
+    if detections is None:
+        detections = detect_faces(frame, face_detector, detect_size, metrics)
+    if compositor is None:
+        compositor = MosaicCompositor(mosaic_ratio)
 
     height, width = frame.shape[:2]
     face_count = 0
     current_faces = []
 
-    for detection in detection_result.detections:
-        bbox = detection.bounding_box
-
-        # バウンディングボックスの座標を取得
-        x = bbox.origin_x
-        y = bbox.origin_y
-        w = bbox.width
-        h = bbox.height
-
+    for (x, y, w, h) in detections:
         # パディングを追加（大きめに設定）
         pad_x = int(w * padding)
         pad_y = int(h * padding)
@@ -203,17 +412,19 @@ def process_frame(
 
         # 顔の位置を保存
         current_faces.append((x1, y1, x2, y2))
-
-        # モザイクを適用
-        frame = apply_mosaic(frame, x1, y1, x2 - x1, y2 - y1, mosaic_ratio)
         face_count += 1
 
     # 前フレームで検出された顔が今回検出されなかった場合、補間して適用
     if previous_faces and face_count == 0:
-        for (x1, y1, x2, y2) in previous_faces:
-            frame = apply_mosaic(frame, x1, y1, x2 - x1, y2 - y1, mosaic_ratio)
         current_faces = previous_faces
 
+    # すべての顔にまとめてモザイクを適用（重なった領域は1回だけ）
+    start = time.perf_counter()
+    frame = compositor.apply(frame, current_faces)
+    if metrics is not None:
+        metrics.since("mosaic", start)
+        metrics.observe_faces(len(current_faces))
+
     return frame, face_count, current_faces
 
 
@@ -348,18 +559,312 @@ def process_frame(
 #         "rotation_applied": rotation
 #     }
 
+def get_rotation_filter(rotation: int) -> str:
+    """
+    回転メタデータから、向きを物理的に固定するための ffmpeg フィルタを取得
+
+    フレームは保存されている向き（自動回転なし）で処理されている前提。
+    """
+    # 270度（-90度）の場合 = 反時計回りに90度 (transpose=2)
+    # 90度の場合 = 時計回りに90度 (transpose=1)
+    # 180度の場合 = 上下左右反転 (transpose=2,transpose=2)
+
+    # --- 修正版：回転フィルタの割り当て ---
+    vf_filter = "pad=ceil(iw/2)*2:ceil(ih/2)*2" # デフォルト
+
+    if rotation == 90:
+        # 90度の時に逆さまなら、反時計回り(2)を試す
+        vf_filter = "transpose=2"
+    elif rotation == 180:
+        vf_filter = "transpose=2,transpose=2"
+    elif rotation == 270:
+        # 270度（-90度）の時に逆さまなら、時計回り(1)を適用する
+        # これが「あと180度回す」ことと同じ効果になります
+        vf_filter = "transpose=1"
+
+    return vf_filter
+
+
+def mosaic_frames(
+    reader,
+    writer,
+    face_detector: DetectorBackend,
+    total_frames: int,
+    mosaic_ratio: float = 0.05,
+    padding: float = DEFAULT_PADDING,
+    detect_stride: int = 1,
+    detect_size: int = 0,
+    motion_threshold: float = 0.0,
+    roi_full_scan_interval: int = 0,
+    tile_size: int = 0,
+    tile_overlap: float = 0.2,
+    warmup_frames: int = 0,
+    frame_offset: int = 0,
+    replay: Optional[DetectionReplay] = None,
+    recorder: Optional[DetectionRecorder] = None,
+    progress_callback: Optional[Callable[..., None]] = None,
+    metrics: Optional[StageMetrics] = None
+) -> dict:
+    """
+    reader から読んだフレームにモザイクを適用して writer に書き込む
+
+    デコード（reader）・顔検出とトラッキング（呼び出し元のスレッド）・モザイクとエンコード（writer）を
+    FramePipeline で別々のスレッドに分け、上限付きのキューでつないで並行に処理する。
+    フレームの順序・トラッキングの状態・補間に使う前フレームの顔位置は順番に処理した場合と変わらない。
+
+    Args:
+        reader: read() で (ret, frame) を返すもの（cv2.VideoCapture / FFmpegReader）
+        writer: write(frame) を持つもの（cv2.VideoWriter / FFmpegWriter）
+        face_detector: Face Detector（検出のバックエンド）
+        total_frames: 総フレーム数（進捗通知用）
+        mosaic_ratio: モザイクの粗さ
+        padding: 顔周りの余白
+        detect_stride: 顔検出を行うフレーム間隔（間のフレームはトラッキングで補う）
+        detect_size: 顔検出に使う画像の長辺（0なら元の解像度）
+        motion_threshold: 前回の検出からの平均差分がこれ未満なら検出を省略する（0なら毎回検出）
+        roi_full_scan_interval: 前回の顔の周囲だけを検出し、この回数に1回画面全体を検出する（0なら常に画面全体）
+        tile_size: タイル分割検出のタイルの辺（0ならタイルに分けない）
+        tile_overlap: 隣り合うタイルの重なり
+        warmup_frames: 先頭から数えて書き込まないフレーム数（顔位置・トラッキング状態の引き継ぎ用）
+        frame_offset: reader の最初のフレームの動画全体でのフレーム番号
+        replay: 保存済みの検出結果。指定時は顔検出・トラッキングを行わない
+        recorder: 検出結果の記録先
+        progress_callback: 進捗通知（顔検出を終えてモザイク＋エンコードの段に渡したフレーム数）
+        metrics: 処理時間の記録先（decode / cvt_color / detect / track / mosaic / write）。
+            各段の時間はそれぞれのスレッドで計測するため、合計は経過時間より長くなりうる
+
+    Returns:
+        処理したフレーム数などの統計情報
+    """
+    if metrics is None:
+        metrics = StageMetrics()
+    processed_frames = 0
+    total_faces_detected = 0
+    previous_faces = None
+    tracker = FaceTracker(detect_stride, motion_threshold, roi_full_scan_interval)
+    compositor = MosaicCompositor(mosaic_ratio)
+    # これより前のフレームは書き込まない（ウォームアップ）
+    first_output_index = frame_offset + warmup_frames
+
+    detect_time = 0.0
+
+    def detect(frame: np.ndarray) -> list:
+        nonlocal detect_time
+        start = time.perf_counter()
+        if tile_size:
+            faces = detect_faces_tiled(frame, tile_size, tile_overlap, detect_size, metrics, face_detector.name)
+        else:
+            faces = detect_faces(frame, face_detector, detect_size, metrics)
+        detect_time += time.perf_counter() - start
+        return faces
+
+    def read() -> tuple[bool, Optional[np.ndarray]]:
+        # デコードの段（専用スレッド）
+        start = time.perf_counter()
+        ret, frame = reader.read()
+        if ret:
+            metrics.since("decode", start)
+        return ret, frame
+
+    def mosaic_and_write(item: tuple) -> None:
+        # モザイク＋エンコードの段（専用スレッド）
+        nonlocal previous_faces, processed_frames, total_faces_detected
+        frame_index, frame, detections = item
+        # 生の向きでモザイク処理
+        processed_frame, face_count, current_faces = process_frame(
+            frame, face_detector, mosaic_ratio, padding, previous_faces, detections,
+            compositor=compositor, metrics=metrics
+        )
+        if face_count > 0:
+            previous_faces = current_faces
+        if frame_index < first_output_index:
+            return
+        start = time.perf_counter()
+        writer.write(processed_frame)
+        metrics.since("write", start)
+        processed_frames += 1
+        total_faces_detected += face_count
+
+    dispatched_frames = 0
+    frame_index = frame_offset - 1
+    with FramePipeline(read, mosaic_and_write) as pipeline:
+        for frame in pipeline.frames():
+            # 顔検出の段（呼び出し元のスレッド。トラッキングの状態を持つため1スレッドで順番に処理）
+            start = time.perf_counter()
+            frame_index += 1
+            if replay is not None:
+                detections = replay.boxes_for(frame_index)
+            else:
+                detect_time = 0.0
+                detections = tracker.update(frame, detect)
+                # トラッキングの時間（検出の時間を除く）
+                metrics.observe("track", time.perf_counter() - start - detect_time)
+                if recorder is not None and frame_index >= first_output_index:
+                    recorder.add(frame_index, detections)
+            pipeline.submit((frame_index, frame, detections))
+            if frame_index < first_output_index:
+                continue
+            dispatched_frames += 1
+            if progress_callback is not None:
+                progress_callback(dispatched_frames, total_frames)
+
+    return {
+        "processed_frames": processed_frames,
+        "total_faces_detected": total_faces_detected,
+        "detector_calls": tracker.detector_calls,
+        "tracked_frames": tracker.tracked_frames,
+        "skipped_detections": tracker.skipped_detections,
+        "roi_scans": tracker.regions.roi_scans if tracker.regions is not None else 0
+    }
+
+
 def process_video(
     input_path: str,
     output_path: str,
     mosaic_ratio: float = 0.05,
-    padding: float = 0.4
+    padding: float = DEFAULT_PADDING,
+    pipeline: str = "pipe",
+    detector: Optional[str] = None,
+    detect_stride: int = 1,
+    detect_size: int = 0,
+    motion_threshold: float = 0.0,
+    roi_full_scan_interval: int = 0,
+    tile_size: int = 0,
+    tile_overlap: float = 0.2,
+    segments: int = 1,
+    reuse_detections: bool = True,
+    file_hash: Optional[str] = None,
+    output_format: str = "mp4",
+    smart_remux: bool = False,
+    progress_callback: Optional[Callable[..., None]] = None,
+    cancel_flag: Optional[CancelFlag] = None,
+    metrics: Optional[StageMetrics] = None,
+    segment_executor: Optional[Executor] = None
 ) -> dict:
-    face_detector = get_detector()
+    """
+    動画全体を処理
+
+    Args:
+        input_path: 入力動画パス
+        output_path: 出力動画パス
+        mosaic_ratio: モザイクの粗さ
+        padding: 顔周りの余白
+        pipeline: "pipe"（ffmpeg パイプでデコード1回・エンコード1回）または
+            "opencv"（OpenCV で一時ファイルに書き出してから ffmpeg で再エンコード）。
+            ffmpeg が無い環境では常に "opencv" になる
+        detector: 顔検出のバックエンド（detectors.BACKENDS のキー。None なら DETECTOR_BACKEND）
+        detect_stride: 顔検出を行うフレーム間隔（1なら毎フレーム検出）
+        detect_size: 顔検出に使う画像の長辺（0なら元の解像度で検出）
+        motion_threshold: 差分ゲートのしきい値（縮小したグレースケール画像の平均差分、0〜255）。
+            前回の検出から変化が小さいフレームは検出を省略して前回の結果を使い回す（0なら毎回検出）
+        roi_full_scan_interval: ROI 検出。前回検出した顔の周囲だけを切り出して検出し、検出この回数に1回と
+            顔を見失った場合は画面全体を検出する（0なら常に画面全体を検出）
+        tile_size: タイル分割検出。フレームをこの辺の重なりのあるタイルに分け、元の解像度のまま
+            並行に検出し、重なった結果を外接矩形にまとめる（4K・広角の小さな顔向け。0ならタイルに分けない）
+        tile_overlap: 隣り合うタイルの重なり（タイルの辺に対する割合）
+        segments: 分割して並列処理するセグメント数（pipe のみ。1なら分割しない）
+        reuse_detections: フレームごとの検出結果をサイドカーに保存し、同じ動画・同じ検出パラメータの
+            再処理では顔検出を省略する
+        file_hash: 入力動画のハッシュ（計算済みの場合）
+        output_format: "mp4"（書き終えてから moov を先頭に移動）または
+            "fmp4"（断片化 MP4。pipe で分割しない場合は処理しながら出力が伸びていき、処理中から配信できる）
+        smart_remux: 先に顔検出だけを行い、顔を含まない GOP は元動画からストリームコピーして
+            顔を含む GOP だけを再エンコードする（pipe のみ。対応していない動画では通常の処理になる）
+        progress_callback: フレームごとに (処理済みフレーム数, 総フレーム数) で呼ばれ、
+            フレームの処理を終えてエンコードの完了を待つ段階に入る時に
+            (処理済みフレーム数, 総フレーム数, "encoding") で呼ばれる。
+            例外を送出すると処理を中断する（ジョブのキャンセル用）
+        cancel_flag: ジョブのキャンセル要求（分割処理の各セグメントのワーカーがフレームごとに確認する）
+        metrics: 処理時間の記録先（ジョブの待ち時間を記録済みの場合など）
+        segment_executor: 分割処理のセグメントを処理するプロセスプール（ジョブのワーカー。
+            None ならセグメント数のプロセスを処理の間だけ起動する）
+
+    Returns:
+        処理結果の統計情報（timings に処理段階ごとの内訳、metrics に /metrics 用の集計を含む）
+    """
+    if metrics is None:
+        metrics = StageMetrics()
+    face_detector = get_detector(detector)
+    pipeline = "pipe" if pipeline == "pipe" and ffmpeg_available() else "opencv"
+
+    # 検出結果のサイドカー（デコード方式によってフレームの向きが変わるため pipeline もキーに含める）
+    replay = recorder = sidecar_path = None
+    if reuse_detections:
+        sidecar_path = DETECTIONS_DIR / (sidecar_key(
+            file_hash or file_sha256(input_path),
+            pipeline=pipeline,
+            detector=face_detector.name,
+            detect_stride=detect_stride,
+            detect_size=detect_size,
+            motion_threshold=motion_threshold,
+            roi_full_scan_interval=roi_full_scan_interval,
+            tile_size=tile_size,
+            tile_overlap=tile_overlap
+        ) + ".npz")
+        replay = load_replay(sidecar_path)
+        if replay is None:
+            recorder = DetectionRecorder()
+        else:
+            # 最終利用時刻を更新（キャッシュの LRU 削除用）
+            os.utime(sidecar_path)
+
+    frame_options = {
+        "mosaic_ratio": mosaic_ratio,
+        "padding": padding,
+        "detect_stride": detect_stride,
+        "detect_size": detect_size,
+        "motion_threshold": motion_threshold,
+        "roi_full_scan_interval": roi_full_scan_interval,
+        "tile_size": tile_size,
+        "tile_overlap": tile_overlap,
+        "replay": replay,
+        "recorder": recorder,
+        "progress_callback": progress_callback,
+        "metrics": metrics
+    }
 
     # 1. 元の動画の回転角を確実に取得
-    rotation = get_video_rotation(input_path)
-    print(f"DEBUG: 最終判定回転角: {rotation}")
+    start = time.perf_counter()
+    rotation = get_video_rotation(input_path, file_hash)
+    metrics.since("ffprobe", start)
+
+    fragmented = output_format == "fmp4"
+    stats = None
+    if pipeline == "pipe" and smart_remux:
+        # 対応していない動画・顔の無い GOP が無い場合は None（通常の処理に任せる）
+        stats = process_video_remux(input_path, output_path, face_detector, rotation, frame_options, fragmented)
+    if stats is None and pipeline == "pipe":
+        stats = process_video_pipe(
+            input_path, output_path, face_detector, rotation, frame_options, segments, fragmented,
+            cancel_flag, segment_executor
+        )
+    elif stats is None:
+        stats = process_video_opencv(input_path, output_path, face_detector, rotation, frame_options, fragmented)
+
+    if recorder is not None:
+        recorder.save(sidecar_path, stats["processed_frames"])
+    stats["detections_reused"] = replay is not None
+    stats["output_format"] = output_format
+    stats["timings"] = metrics.breakdown()
+    stats["metrics"] = metrics.state()
+    return stats
+
+
+def process_video_opencv(
+    input_path: str,
+    output_path: str,
+    face_detector: DetectorBackend,
+    rotation: int,
+    frame_options: dict,
+    fragmented: bool = False
+) -> dict:
+    """
+    OpenCV でデコード・一時ファイルへの書き出しを行い、ffmpeg で再エンコードして動画を処理
 
+    Args:
+        frame_options: mosaic_frames に渡すパラメータ
+        fragmented: 再エンコードした動画を断片化 MP4 で書き出す
+    """
     cap = cv2.VideoCapture(input_path)
     if not cap.isOpened():
         raise HTTPException(status_code=400, detail="動画ファイルを開けません")
@@ -374,48 +879,24 @@ def process_video(
     fourcc = cv2.VideoWriter_fourcc(*'mp4v')
     out = cv2.VideoWriter(temp_output, fourcc, fps, (width, height))
 
-    processed_frames = 0
-    total_faces_detected = 0
-    previous_faces = None
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        # 生の向きでモザイク処理
-        processed_frame, face_count, current_faces = process_frame(
-            frame, face_detector, mosaic_ratio, padding, previous_faces
-        )
-        if face_count > 0:
-            previous_faces = current_faces
-        out.write(processed_frame)
-        processed_frames += 1
-        total_faces_detected += face_count
+    try:
+        stats = mosaic_frames(cap, out, face_detector, total_frames, **frame_options)
+        if frame_options.get("progress_callback") is not None:
+            frame_options["progress_callback"](stats["processed_frames"], total_frames, "encoding")
+    except BaseException:
+        # 中断時は一時ファイルを残さない
+        cap.release()
+        out.release()
+        Path(temp_output).unlink(missing_ok=True)
+        raise
 
     cap.release()
     out.release()
 
     # 2. FFmpegで「回転フィルタ」を適用して、向きを物理的に固定する
-    # 270度（-90度）の場合 = 反時計回りに90度 (transpose=2)
-    # 90度の場合 = 時計回りに90度 (transpose=1)
-    # 180度の場合 = 上下左右反転 (transpose=2,transpose=2)
-    
-    # --- 修正版：回転フィルタの割り当て ---
-    vf_filter = "pad=ceil(iw/2)*2:ceil(ih/2)*2" # デフォルト
-    
-    if rotation == 90:
-        # 90度の時に逆さまなら、反時計回り(2)を試す
-        vf_filter = "transpose=2" 
-    elif rotation == 180:
-        vf_filter = "transpose=2,transpose=2"
-    elif rotation == 270:
-        # 270度（-90度）の時に逆さまなら、時計回り(1)を適用する
-        # これが「あと180度回す」ことと同じ効果になります
-        vf_filter = "transpose=1" 
-
-    print(f"DEBUG: 適用するフィルタ: {vf_filter}")
-    # -----------------------------------
+    vf_filter = get_rotation_filter(rotation)
 
+    start = time.perf_counter()
     try:
         subprocess.run([
             'ffmpeg', '-y',
@@ -429,7 +910,7 @@ def process_video(
             '-map', '1:a:0?',
             '-c:a', 'aac',
             '-metadata:s:v', 'rotate=0', # 回転情報をリセット（焼き付け済みのため）
-            '-movflags', '+faststart',
+            *movflags(fragmented),
             output_path
         ], check=True, capture_output=True)
 
@@ -438,13 +919,165 @@ def process_video(
         print(f"FFmpeg Error: {e}")
         if Path(temp_output).exists():
             Path(temp_output).rename(output_path)
+    frame_options["metrics"].since("transcode", start)
 
     return {
-        "processed_frames": processed_frames,
+        **stats,
         "rotation_fixed": rotation,
+        "pipeline": "opencv",
         "status": "Success with FFmpeg transpose"
     }
 
+
+def process_video_pipe(
+    input_path: str,
+    output_path: str,
+    face_detector: DetectorBackend,
+    rotation: int,
+    frame_options: dict,
+    segments: int = 1,
+    fragmented: bool = False,
+    cancel_flag: Optional[CancelFlag] = None,
+    segment_executor: Optional[Executor] = None
+) -> dict:
+    """
+    ffmpeg のデコーダ・エンコーダをパイプでつないで動画を処理
+
+    中間ファイルを作らず、回転フィルタと音声の多重化もエンコーダの1回の呼び出しで行う。
+
+    Args:
+        frame_options: mosaic_frames に渡すパラメータ
+        segments: 2以上なら動画をセグメントに分けて複数のワーカープロセスで並列に処理する
+        fragmented: 断片化 MP4 で書き出す（分割しない場合はエンコードしたフラグメントから順に出力に追記される）
+        cancel_flag: ジョブのキャンセル要求（分割する場合に各セグメントのワーカーに渡す）
+        segment_executor: 分割する場合にセグメントを処理するプロセスプール
+    """
+    metrics = frame_options["metrics"]
+    start = time.perf_counter()
+    try:
+        info = probe_video(input_path)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"動画ファイルを開けません: {e}")
+    metrics.since("ffprobe", start)
+
+    vf_filter = get_rotation_filter(rotation)
+
+    if segments > 1 and effective_segments(info["total_frames"], segments) > 1:
+        options = dict(frame_options)
+        progress_callback = options.pop("progress_callback", None)
+        replay = options.pop("replay", None)
+        recorder = options.pop("recorder", None)
+        options.pop("metrics")
+        stats = process_video_segments(
+            input_path, output_path, info, vf_filter, segments, options,
+            detector=face_detector.name,
+            replay_path=str(replay.path) if replay is not None and replay.path is not None else None,
+            recorder=recorder,
+            progress_callback=progress_callback,
+            metrics=metrics,
+            fragmented=fragmented,
+            cancel_flag=cancel_flag,
+            executor=segment_executor
+        )
+        return {
+            **stats,
+            "rotation_fixed": rotation,
+            "pipeline": "pipe",
+            "status": "Success with FFmpeg pipe (segmented)"
+        }
+
+    reader = FFmpegReader(input_path, info["width"], info["height"])
+    writer = FFmpegWriter(
+        output_path, info["width"], info["height"], info["frame_rate"],
+        vf_filter, audio_source=input_path, fragmented=fragmented
+    )
+
+    try:
+        stats = mosaic_frames(reader, writer, face_detector, info["total_frames"], **frame_options)
+        if frame_options.get("progress_callback") is not None:
+            frame_options["progress_callback"](stats["processed_frames"], info["total_frames"], "encoding")
+    except BaseException:
+        reader.release()
+        writer.kill()
+        Path(output_path).unlink(missing_ok=True)
+        raise
+
+    reader.release()
+    # エンコーダの残りのフレームの書き出しと faststart の移動（断片化 MP4 では最後のフラグメント）を待つ
+    start = time.perf_counter()
+    writer.release()
+    metrics.since("finalize", start)
+
+    if stats["processed_frames"] == 0:
+        Path(output_path).unlink(missing_ok=True)
+        raise HTTPException(status_code=400, detail="動画ファイルを開けません")
+
+    return {
+        **stats,
+        "rotation_fixed": rotation,
+        "pipeline": "pipe",
+        "status": "Success with FFmpeg pipe"
+    }
+
+
+async def evict_cache_periodically():
+    """OUTPUT_DIR の容量・保存期間の上限を定期的に適用"""
+    while True:
+        try:
+            removed = await asyncio.to_thread(result_cache.evict)
+            if removed:
+                print(f"Cache eviction: {removed} files removed")
+        except Exception as e:
+            print(f"Cache eviction error: {e}")
+        await asyncio.sleep(CACHE_EVICT_INTERVAL_SEC)
+
+
+async def start_cache_evictor():
+    """キャッシュの削除処理をバックグラウンドで開始"""
+    global evictor_task
+    evictor_task = asyncio.create_task(evict_cache_periodically())
+
+
+async def warm_up() -> None:
+    """Face Detector の準備とワーカープロセスの起動を並行に行い、終わったら ready にする"""
+    timings = startup_state["timings"]
+
+    async def detector_ready():
+        timings.update(await asyncio.to_thread(warm_up_detector))
+        timings["detector_ready_sec"] = round(time.perf_counter() - IMPORT_STARTED, 3)
+
+    async def workers_ready():
+        if WARMUP_WORKERS:
+            await asyncio.to_thread(job_manager.warm_up)
+            timings["workers_ready_sec"] = round(time.perf_counter() - IMPORT_STARTED, 3)
+
+    try:
+        await asyncio.gather(detector_ready(), workers_ready())
+    except Exception as e:
+        startup_state["error"] = getattr(e, "detail", None) or str(e)
+        print(f"Warm-up error: {startup_state['error']}")
+        return
+    timings["ready_sec"] = round(time.perf_counter() - IMPORT_STARTED, 3)
+    startup_state["ready"] = True
+    print(f"Ready: {timings}")
+
+
+async def start_warm_up():
+    """待ち受けを始めてから、バックグラウンドでモデルの読み込み・ウォームアップを行う"""
+    startup_state["timings"]["serving_sec"] = round(time.perf_counter() - IMPORT_STARTED, 3)
+    global warmup_task
+    warmup_task = asyncio.create_task(warm_up())
+
+
+async def shutdown_workers():
+    """ワーカープロセスとキャッシュの削除処理を停止"""
+    if evictor_task is not None:
+        evictor_task.cancel()
+    if warmup_task is not None:
+        warmup_task.cancel()
+    job_manager.shutdown()
+
+
 @app.get("/")
 async def root():
     """ヘルスチェック"""
@@ -453,100 +1086,576 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """詳細なヘルスチェック"""
-    model_exists = MODEL_PATH.exists()
+    """詳細なヘルスチェック（プロセスが動いているか。処理を受けられるかは /ready）"""
+    model_path = backend_model_path(DETECTOR_BACKEND)
+    model_exists = model_path.exists()
     return {
         "status": "healthy" if model_exists else "degraded",
-        "model_loaded": model_exists,
-        "model_path": str(MODEL_PATH)
+        "detector": DETECTOR_BACKEND,
+        "model_exists": model_exists,
+        "model_loaded": DETECTOR_BACKEND in detectors,
+        "ready": startup_state["ready"],
+        "model_path": str(model_path)
     }
 
 
-@app.post("/api/mosaic/video")
-async def process_video_endpoint(
-    file: UploadFile = File(...),
-    mosaic_ratio: float = Query(0.05, ge=0.01, le=0.2, description="モザイクの粗さ（小さいほど粗い）"),
-    padding: float = Query(0.3, ge=0.0, le=1.0, description="顔周りの余白")
-):
+@app.get("/ready")
+async def readiness_check():
     """
-    動画にモザイク処理を適用
+    レディネスチェック
 
-    - **file**: 入力動画ファイル（mp4, mov, webm対応）
-    - **mosaic_ratio**: モザイクの粗さ（0.01〜0.2、デフォルト0.05）
-    - **padding**: 顔周りの余白（0〜1、デフォルト0.3）
+    Face Detector の読み込みとダミー画像での推論（ワーカープロセスの起動を含む）が終わるまでは 503、
+    終わったら 200 を返す。timings に起動の各段階の所要時間を含める。
     """
-    # ファイル拡張子チェック
+    body = {
+        "status": "ready" if startup_state["ready"] else "starting" if startup_state["error"] is None else "failed",
+        "error": startup_state["error"],
+        "timings": startup_state["timings"]
+    }
+    return JSONResponse(body, status_code=200 if startup_state["ready"] else 503)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """
+    Prometheus 形式のメトリクス
+
+    処理段階ごとの所要時間（mosaic_stage_seconds）、フレームごとの顔の数、
+    リクエスト・ジョブの件数、入出力のバイト数、キャッシュの状態を出力する。
+    """
+    cache = result_cache.stats()
+    body = REGISTRY.render({
+        "mosaic_cache_entries": ("Entries in the result cache", cache["entries"]),
+        "mosaic_cache_pending": ("Results being processed", cache["pending"]),
+        "mosaic_cache_hits": ("Result cache hits since start", cache["hits"]),
+        "mosaic_cache_misses": ("Result cache misses since start", cache["misses"]),
+        "mosaic_cache_evicted_bytes": ("Bytes evicted from the result cache since start", cache["evicted_bytes"]),
+        "mosaic_live_sessions": ("Open live mode sessions", live_sessions),
+    })
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+
+def validate_video_upload(file: UploadFile) -> str:
+    """アップロードされた動画のファイル名を検証し、拡張子を返す"""
     if not file.filename:
         raise HTTPException(status_code=400, detail="ファイル名が必要です")
 
     ext = Path(file.filename).suffix.lower()
     if ext not in ['.mp4', '.mov', '.webm', '.avi']:
         raise HTTPException(status_code=400, detail="サポートされていない動画形式です")
+    return ext
 
-    # 一時ファイルに保存
+
+def check_admission(queue_only: bool = False) -> None:
+    """
+    動画処理ジョブを受け付けられるか確認（混雑時は 429 と Retry-After・待ち行列での順番を返す）
+
+    Args:
+        queue_only: 待ち行列の長さだけを見る（アップロードを受信する前の確認用）
+    """
+    try:
+        admission.check(job_manager.workload(), queue_only)
+    except AdmissionRejected as e:
+        REGISTRY.inc("mosaic_rejected_total", reason=e.reason)
+        raise HTTPException(
+            status_code=429,
+            detail={
+                "message": "混雑しているため受け付けられません。しばらくしてから再試行してください",
+                "reason": e.reason,
+                "queue_position": e.queue_position,
+                "estimated_wait_sec": e.estimated_wait_sec,
+                "retry_after_sec": e.retry_after_sec
+            },
+            headers={"Retry-After": str(e.retry_after_sec)}
+        )
+
+
+def response_stats(stats: dict, timings: bool) -> dict:
+    """レスポンスに含める統計情報（処理段階ごとの内訳 timings は要求された場合のみ）"""
+    if timings:
+        return stats
+    return {k: v for k, v in stats.items() if k != "timings"}
+
+
+def count_segments(input_path: str, file_hash: Optional[str], segments: int) -> int:
+    """
+    動画を実際に分割するセグメント数（process_video_pipe と同じ判断。フレーム数が取れない場合は1）
+    """
+    if segments <= 1:
+        return 1
+    try:
+        return effective_segments(probe_media(input_path, file_hash)["total_frames"], segments)
+    except Exception:
+        return 1
+
+
+async def submit_video_upload(chunks: AsyncIterator[bytes], options: dict) -> tuple[str, bool]:
+    """
+    アップロードされた動画の処理ジョブを投入
+
+    アップロードはチャンク単位でディスクに保存し、サイズ上限と形式のチェック・ハッシュ計算を
+    読み込みながら行う。同じ内容・同じパラメータの処理結果がキャッシュにあれば再処理せず
+    完了済みのジョブとして返し、処理中であればそのジョブにまとめる。
+    新しく処理する場合は、フレーム数×解像度から見積もった処理コストで受け付け制御を行い、
+    混雑時は 429 を返す（待ち行列が一杯ならアップロードを受信する前に返す）。
+
+    Args:
+        chunks: アップロードの内容
+        options: process_video に渡すパラメータ
+
+    Returns:
+        ジョブID（= file_id）、キャッシュを使ったかどうか
+    """
     file_id = str(uuid.uuid4())
-    input_path = OUTPUT_DIR / f"{file_id}_input{ext}"
+    upload_path = OUTPUT_DIR / f"{file_id}_input.upload"
     output_path = OUTPUT_DIR / f"{file_id}_output.mp4"
 
+    check_admission(queue_only=True)
+
+    # 一時ファイルに保存
+    start = time.perf_counter()
+    fmt, size, content_hash = await save_upload(chunks, upload_path, MAX_VIDEO_BYTES, VIDEO_FORMATS)
+    REGISTRY.observe("upload", time.perf_counter() - start)
+    REGISTRY.inc("mosaic_input_bytes_total", size, kind="video")
+    input_path = upload_path.with_suffix(VIDEO_FORMATS[fmt])
+    upload_path.rename(input_path)
+
+    cache_key = ResultCache.make_key(
+        content_hash, "video",
+        **{k: v for k, v in options.items() if k in VIDEO_CACHE_PARAMS}
+    )
+
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        input_path.unlink(missing_ok=True)
+        if job_manager.get(cached["file_id"]) is None:
+            job_manager.add_completed(cached["file_id"], cached["stats"])
+        REGISTRY.inc("mosaic_requests_total", endpoint="video", cached="true")
+        return cached["file_id"], True
+
+    pending_id = result_cache.pending(cache_key)
+    if pending_id is not None and job_manager.get(pending_id) is not None:
+        input_path.unlink(missing_ok=True)
+        REGISTRY.inc("mosaic_requests_total", endpoint="video", cached="true")
+        return pending_id, True
     try:
-        # アップロードされたファイルを保存
-        content = await file.read()
-        with open(input_path, "wb") as f:
-            f.write(content)
+        # 分割処理は pipe のみ（スマートリミックスを使う場合は分割しない）
+        segments = options.get("segments", 1)
+        if options.get("pipeline") != "pipe" or options.get("smart_remux") or not ffmpeg_available():
+            segments = 1
+        cost_sec = await asyncio.to_thread(estimate_video_cost, str(input_path), content_hash, segments)
+        segmented = await asyncio.to_thread(count_segments, str(input_path), content_hash, segments) > 1
+        check_admission()
+    except HTTPException:
+        input_path.unlink(missing_ok=True)
+        raise
+    REGISTRY.inc("mosaic_requests_total", endpoint="video", cached="false")
+
+    def on_done(job: dict) -> None:
+        if job["status"] == "completed":
+            result_cache.put(cache_key, file_id, output_path, job["stats"])
+        else:
+            result_cache.abort(cache_key)
 
-        # 動画処理
-        stats = process_video(
+    try:
+        # 動画処理（入力ファイルはジョブ終了時に削除される）
+        result_cache.begin(cache_key, file_id)
+        job_manager.submit_video(
+            file_id,
             str(input_path),
             str(output_path),
-            mosaic_ratio,
-            padding
+            on_done=on_done,
+            cost_sec=cost_sec,
+            segmented=segmented,
+            file_hash=content_hash,
+            **options
         )
-
-        # 入力ファイルを削除
+    except Exception:
+        # エラー時はファイルをクリーンアップ
+        result_cache.abort(cache_key)
         input_path.unlink(missing_ok=True)
+        raise
+
+    return file_id, False
+
+
+@dataclass
+class VideoOptions:
+    """
+    動画処理のクエリパラメータ（/api/mosaic/video・/api/mosaic/jobs/video・/api/mosaic/jobs/video/stream で共通）
+
+    エンドポイントでは Depends() で受け取り、to_dict() で process_video に渡すパラメータにする。
+    """
+    mosaic_ratio: float = Query(0.05, ge=0.01, le=0.2, description="モザイクの粗さ（小さいほど粗い）")
+    padding: float = Query(DEFAULT_PADDING, ge=0.0, le=1.0, description="顔周りの余白")
+    pipeline: str = Query("pipe", pattern="^(pipe|opencv)$", description="動画の入出力方式")
+    detector: Optional[str] = Query(None, pattern=BACKEND_PATTERN, description="顔検出のバックエンド（省略時はサーバーの設定）")
+    detect_stride: int = Query(1, ge=1, le=30, description="顔検出を行うフレーム間隔")
+    detect_size: int = Query(0, ge=0, le=4096, description="顔検出に使う画像の長辺（0で元の解像度）")
+    motion_threshold: float = Query(0.0, ge=0.0, le=255.0, description="前回の検出から変化が小さいフレームの検出を省略するしきい値（0で無効）")
+    roi_full_scan_interval: int = Query(0, ge=0, le=300, description="顔の周囲だけを検出し、この回数に1回画面全体を検出する（0で無効）")
+    tile_size: int = Query(0, ge=0, le=4096, description="タイル分割検出のタイルの辺（0で無効）")
+    tile_overlap: float = Query(0.2, ge=0.0, le=0.5, description="隣り合うタイルの重なり（タイルの辺に対する割合）")
+    segments: int = Query(1, ge=1, le=32, description="並列処理するセグメント数")
+    reuse_detections: bool = Query(True, description="同じ動画の検出結果を再利用する")
+    output_format: str = Query("mp4", pattern="^(mp4|fmp4)$", description="出力形式（fmp4 なら処理中から配信）")
+    smart_remux: bool = Query(False, description="顔を含まない GOP を再エンコードせずにコピーする")
+
+    def to_dict(self) -> dict:
+        """submit_video_upload に渡すパラメータ（検出器の省略時はサーバーの設定）"""
+        return {**asdict(self), "detector": self.detector or DETECTOR_BACKEND}
+
+
+async def wait_video_job(job_id: str) -> dict:
+    """
+    ジョブの完了を待って統計情報を返す
+
+    待っている間にジョブがキャンセルされた（DELETE /api/jobs/{job_id}）場合は 409 を返す。
+    待機中のジョブの取り消しは asyncio.CancelledError、実行中のジョブの中断は JobCancelled になるため、
+    ジョブの状態で判断する。リクエスト自体が中断された場合はジョブを取り消さず（shield）、
+    CancelledError をそのまま伝える
+    """
+    try:
+        return await asyncio.shield(job_manager.wait(job_id))
+    except JobCancelled:
+        raise HTTPException(status_code=409, detail="ジョブは処理中にキャンセルされました")
+    except asyncio.CancelledError:
+        job = job_manager.get(job_id)
+        if job is None or job["status"] != "cancelled":
+            raise
+        raise HTTPException(status_code=409, detail="ジョブは処理を始める前にキャンセルされました")
+
+
+@app.post("/api/mosaic/video")
+async def process_video_endpoint(
+    file: UploadFile = File(...),
+    options: VideoOptions = Depends(),
+    timings: bool = Query(False, description="処理段階ごとの所要時間の内訳を stats に含める")
+):
+    """
+    動画にモザイク処理を適用
+
+    処理はワーカープロセスで行い、完了まで待ってから結果を返す。
+    イベントループはブロックしないため、処理中も他のリクエストに応答できる。
+    同じ動画・同じパラメータの処理結果があれば再処理せずに返す。
+
+    - **file**: 入力動画ファイル（mp4, mov, webm対応）
+    - **mosaic_ratio**: モザイクの粗さ（0.01〜0.2、デフォルト0.05）
+    - **padding**: 顔周りの余白（0〜1、デフォルト0.3）
+    - **pipeline**: pipe（ffmpeg パイプで1回エンコード、デフォルト）/ opencv（従来方式）
+    - **detector**: 顔検出のバックエンド mediapipe / yunet / haar（省略時は環境変数 MOSAIC_DETECTOR、デフォルト mediapipe）
+    - **detect_stride**: 顔検出を行うフレーム間隔（1〜30、デフォルト1）。間のフレームはトラッキングで追従
+    - **detect_size**: 顔検出に使う画像の長辺（0〜4096、デフォルト0=元の解像度）。座標は元の解像度に戻してからモザイクを適用
+    - **motion_threshold**: 差分ゲートのしきい値（0〜255、デフォルト0=無効）。縮小した画像の前回の検出からの平均輝度差が、顔の周囲（顔が無ければ画面全体）でこれ未満なら検出を省略して前回の結果を使う
+    - **roi_full_scan_interval**: ROI 検出（0〜300、デフォルト0=無効）。前回検出した顔の周囲だけを切り出して検出し、検出この回数に1回と顔を見失った場合は画面全体を検出して新しい顔を拾う
+    - **tile_size**: タイル分割検出（0〜4096、デフォルト0=無効、128未満は128）。フレームを重なりのあるタイルに分けて元の解像度のまま並行に検出し、重なった結果を外接矩形にまとめる。4K・広角の動画の小さな顔・遠くの顔向け
+    - **tile_overlap**: 隣り合うタイルの重なり（0〜0.5、デフォルト0.2）
+    - **segments**: 動画を分割して並列処理するセグメント数（1〜32、デフォルト1）。pipe のみ有効
+    - **reuse_detections**: 同じ動画・同じ検出パラメータの検出結果を保存・再利用し、顔検出を省略する（デフォルトtrue）
+    - **output_format**: mp4（デフォルト）/ fmp4（断片化 MP4。moov の移動による書き直しが無く、処理中から download_url で再生できる）
+    - **smart_remux**: 顔検出を先に行い、顔を含まない GOP は元動画からコピーして顔を含む GOP だけを再エンコードする（デフォルトfalse）。pipe のみ有効
+    - **timings**: stats.timings に処理段階ごと（decode / detect / mosaic / write など）の回数・合計・平均時間を含める（デフォルトfalse）
+    """
+    # ファイル拡張子チェック
+    validate_video_upload(file)
+
+    try:
+        file_id, cached = await submit_video_upload(iter_upload(file), options.to_dict())
+        stats = await wait_video_job(file_id)
 
         return {
             "success": True,
             "file_id": file_id,
             "download_url": f"/api/mosaic/download/{file_id}",
-            "stats": stats
+            "stats": {**response_stats(stats, timings), "cached": cached}
         }
 
+    except HTTPException:
+        raise
+    except JobFailed as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/mosaic/jobs/video", status_code=202)
+async def submit_video_job(
+    file: UploadFile = File(...),
+    options: VideoOptions = Depends()
+):
+    """
+    動画のモザイク処理ジョブを投入し、すぐにジョブIDを返す
+
+    - **file**: 入力動画ファイル（mp4, mov, webm対応）
+    - **mosaic_ratio**: モザイクの粗さ（0.01〜0.2、デフォルト0.05）
+    - **padding**: 顔周りの余白（0〜1、デフォルト0.3）
+    - **pipeline**: pipe（ffmpeg パイプで1回エンコード、デフォルト）/ opencv（従来方式）
+    - **detector**: 顔検出のバックエンド mediapipe / yunet / haar（省略時は環境変数 MOSAIC_DETECTOR、デフォルト mediapipe）
+    - **detect_stride**: 顔検出を行うフレーム間隔（1〜30、デフォルト1）。間のフレームはトラッキングで追従
+    - **detect_size**: 顔検出に使う画像の長辺（0〜4096、デフォルト0=元の解像度）。座標は元の解像度に戻してからモザイクを適用
+    - **motion_threshold**: 差分ゲートのしきい値（0〜255、デフォルト0=無効）。縮小した画像の前回の検出からの平均輝度差が、顔の周囲（顔が無ければ画面全体）でこれ未満なら検出を省略して前回の結果を使う
+    - **roi_full_scan_interval**: ROI 検出（0〜300、デフォルト0=無効）。前回検出した顔の周囲だけを切り出して検出し、検出この回数に1回と顔を見失った場合は画面全体を検出して新しい顔を拾う
+    - **tile_size**: タイル分割検出（0〜4096、デフォルト0=無効、128未満は128）。フレームを重なりのあるタイルに分けて元の解像度のまま並行に検出し、重なった結果を外接矩形にまとめる。4K・広角の動画の小さな顔・遠くの顔向け
+    - **tile_overlap**: 隣り合うタイルの重なり（0〜0.5、デフォルト0.2）
+    - **segments**: 動画を分割して並列処理するセグメント数（1〜32、デフォルト1）。pipe のみ有効
+    - **reuse_detections**: 同じ動画・同じ検出パラメータの検出結果を保存・再利用し、顔検出を省略する（デフォルトtrue）
+    - **output_format**: mp4（デフォルト）/ fmp4（断片化 MP4。moov の移動による書き直しが無く、処理中から download_url で再生できる）
+    - **smart_remux**: 顔検出を先に行い、顔を含まない GOP は元動画からコピーして顔を含む GOP だけを再エンコードする（デフォルトfalse）。pipe のみ有効
+    """
+    validate_video_upload(file)
+
+    try:
+        job_id, cached = await submit_video_upload(iter_upload(file), options.to_dict())
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {
+        "success": True,
+        "job_id": job_id,
+        "cached": cached,
+        "status_url": f"/api/mosaic/jobs/{job_id}",
+        "events_url": f"/api/mosaic/jobs/{job_id}/events",
+        "result_url": f"/api/mosaic/jobs/{job_id}/result",
+        # 断片化 MP4 は処理中から再生できる
+        **({"download_url": f"/api/mosaic/download/{job_id}"} if options.output_format == "fmp4" else {})
+    }
+
+
+@app.post("/api/mosaic/jobs/video/stream", status_code=202)
+async def submit_video_job_stream(
+    request: Request,
+    options: VideoOptions = Depends()
+):
+    """
+    リクエストボディに動画ファイルそのものを送ってジョブを投入（multipart を使わない）
+
+    受信しながらディスクに書き出すため、サイズ上限を超えた時点・先頭バイトが動画でない時点で
+    受信を打ち切って拒否できる。Content-Length が上限を超えていれば本文を読む前に拒否する。
+    パラメータは /api/mosaic/jobs/video と同じ。
+    """
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_VIDEO_BYTES:
+        raise HTTPException(status_code=413, detail=f"ファイルサイズが上限（{MAX_VIDEO_BYTES} バイト）を超えています")
+
+    try:
+        job_id, cached = await submit_video_upload(request.stream(), options.to_dict())
+    except HTTPException:
+        raise
     except Exception as e:
-        # エラー時はファイルをクリーンアップ
-        input_path.unlink(missing_ok=True)
-        output_path.unlink(missing_ok=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+    return {
+        "success": True,
+        "job_id": job_id,
+        "cached": cached,
+        "status_url": f"/api/mosaic/jobs/{job_id}",
+        "events_url": f"/api/mosaic/jobs/{job_id}/events",
+        "result_url": f"/api/mosaic/jobs/{job_id}/result",
+        # 断片化 MP4 は処理中から再生できる
+        **({"download_url": f"/api/mosaic/download/{job_id}"} if options.output_format == "fmp4" else {})
+    }
+
+
+@app.get("/api/mosaic/jobs/{job_id}")
+async def get_video_job(
+    job_id: str,
+    timings: bool = Query(False, description="処理段階ごとの所要時間の内訳を stats に含める")
+):
+    """ジョブの状態を取得（queued / running / completed / failed / cancelled）"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="ジョブが見つかりません")
+    if job["stats"] is not None:
+        job["stats"] = response_stats(job["stats"], timings)
+    return job
+
+
+@app.get("/api/mosaic/jobs/{job_id}/result")
+async def get_video_job_result(
+    job_id: str,
+    timings: bool = Query(False, description="処理段階ごとの所要時間の内訳を stats に含める")
+):
+    """完了したジョブの結果を取得"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="ジョブが見つかりません")
+
+    if job["status"] == "failed":
+        raise HTTPException(status_code=job["status_code"] or 500, detail=job["error"])
+    if job["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"ジョブはまだ完了していません（{job['status']}）")
+
+    return {
+        "success": True,
+        "file_id": job_id,
+        "download_url": f"/api/mosaic/download/{job_id}",
+        "stats": response_stats(job["stats"], timings)
+    }
+
+
+def format_sse(event: str, data: dict) -> str:
+    """Server-Sent Events の1イベント分の文字列"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.get("/api/mosaic/jobs/{job_id}/events")
+async def stream_video_job_events(job_id: str, request: Request):
+    """
+    ジョブの進捗を Server-Sent Events で配信
+
+    進捗が変わるたびに progress イベント（status, phase, processed_frames, total_frames, fps, eta_sec）を送り、
+    ジョブが終了したら completed（download_url と stats）/ failed / cancelled イベントを送って閉じる。
+    phase は queued / starting / detecting（フレームの処理中）/ encoding（エンコードの完了待ち・結合）。
+    """
+    if job_manager.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="ジョブが見つかりません")
+
+    async def events():
+        last_progress = None
+        last_sent = time.monotonic()
+        while True:
+            job = job_manager.get(job_id)
+            if job is None:
+                yield format_sse("failed", {"job_id": job_id, "error": "ジョブが見つかりません", "status_code": 404})
+                return
+            if job["status"] == "completed":
+                yield format_sse("completed", {
+                    "job_id": job_id,
+                    "download_url": f"/api/mosaic/download/{job_id}",
+                    "stats": response_stats(job["stats"], False)
+                })
+                return
+            if job["status"] in ("failed", "cancelled"):
+                yield format_sse(job["status"], {
+                    "job_id": job_id, "error": job["error"], "status_code": job["status_code"]
+                })
+                return
+
+            progress = {
+                "job_id": job_id,
+                "status": job["status"],
+                **job.get("progress", {"phase": "queued"})
+            }
+            now = time.monotonic()
+            if progress != last_progress:
+                yield format_sse("progress", progress)
+                last_progress, last_sent = progress, now
+            elif now - last_sent >= SSE_KEEPALIVE_SEC:
+                yield ": keep-alive\n\n"
+                last_sent = now
+
+            if await request.is_disconnected():
+                return
+            await asyncio.sleep(SSE_POLL_INTERVAL_SEC)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # プロキシ（nginx など）にバッファリングさせない
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.delete("/api/mosaic/jobs/{job_id}")
+async def cancel_video_job(job_id: str):
+    """ジョブをキャンセル"""
+    if job_manager.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="ジョブが見つかりません")
+    if not job_manager.cancel(job_id):
+        raise HTTPException(status_code=409, detail="終了済みのジョブはキャンセルできません")
+    return {"success": True, "message": "ジョブのキャンセルを受け付けました"}
+
 
 @app.get("/api/mosaic/download/{file_id}")
-async def download_processed_video(file_id: str):
-    """処理済み動画をダウンロード"""
+async def download_processed_video(file_id: str, request: Request):
+    """
+    処理済み動画をダウンロード
+
+    Range リクエストに対応する（動画プレイヤーのシーク用）。
+    output_format=fmp4 のジョブは処理中でも、書き込まれた分から順に送り続ける。
+    """
     output_path = OUTPUT_DIR / f"{file_id}_output.mp4"
+    range_header = request.headers.get("range")
+
+    job = job_manager.get(file_id)
+    if job is not None and job["status"] in ("queued", "running"):
+        if job.get("output_format") != "fmp4":
+            raise HTTPException(status_code=409, detail=f"ジョブはまだ完了していません（{job['status']}）")
+
+        def is_writing() -> bool:
+            current = job_manager.get(file_id)
+            return current is not None and current["status"] in ("queued", "running")
+
+        return growing_file_response(
+            output_path, range_header, is_writing,
+            media_type="video/mp4",
+            filename=f"mosaic_{file_id}.mp4"
+        )
 
     if not output_path.exists():
         raise HTTPException(status_code=404, detail="ファイルが見つかりません")
 
-    return FileResponse(
-        output_path,
+    return file_response(
+        output_path, range_header,
         media_type="video/mp4",
         filename=f"mosaic_{file_id}.mp4"
     )
 
 
+@app.get("/api/mosaic/cache")
+async def cache_stats():
+    """処理結果キャッシュのヒット・ミス・削除の件数"""
+    return result_cache.stats()
+
+
 @app.delete("/api/mosaic/cleanup/{file_id}")
 async def cleanup_file(file_id: str):
-    """処理済みファイルを削除"""
-    output_path = OUTPUT_DIR / f"{file_id}_output.mp4"
-    output_path.unlink(missing_ok=True)
+    """処理済みファイル（動画・画像）を削除"""
+    for ext in OUTPUT_EXTENSIONS:
+        (OUTPUT_DIR / f"{file_id}_output{ext}").unlink(missing_ok=True)
+    result_cache.forget_file(file_id)
     return {"success": True, "message": "ファイルを削除しました"}
 
 
+def encode_image(image: np.ndarray, image_format: str, quality: int) -> bytes:
+    """
+    画像をエンコード
+
+    Args:
+        image: 画像 (BGR)
+        image_format: IMAGE_ENCODINGS のキー
+        quality: JPEG / WebP の品質（1〜100。PNG では無視）
+    """
+    ext, _, quality_flag = IMAGE_ENCODINGS[image_format]
+    params = [quality_flag, quality] if quality_flag is not None else []
+    ok, buffer = cv2.imencode(ext, image, params)
+    if not ok:
+        raise HTTPException(status_code=500, detail="画像のエンコードに失敗しました")
+    return buffer.tobytes()
+
+
+def server_timing(metrics: StageMetrics) -> str:
+    """処理段階ごとの所要時間を Server-Timing ヘッダの形式にする"""
+    return ", ".join(
+        f"{stage};dur={entry['total_ms']}" for stage, entry in metrics.breakdown().items()
+    )
+
+
 @app.post("/api/mosaic/image")
 async def process_image_endpoint(
     file: UploadFile = File(...),
     mosaic_ratio: float = Query(0.05, ge=0.01, le=0.2),
-    padding: float = Query(0.3, ge=0.0, le=1.0)
+    padding: float = Query(DEFAULT_PADDING, ge=0.0, le=1.0),
+    detector: Optional[str] = Query(None, pattern=BACKEND_PATTERN),
+    detect_size: int = Query(0, ge=0, le=4096),
+    tile_size: int = Query(0, ge=0, le=4096),
+    tile_overlap: float = Query(0.2, ge=0.0, le=0.5),
+    direct: bool = Query(False),
+    image_format: Optional[str] = Query(None, pattern="^(png|jpeg|webp)$"),
+    quality: int = Query(90, ge=1, le=100),
+    timings: bool = Query(False)
 ):
     """
     画像にモザイク処理を適用
@@ -554,6 +1663,15 @@ async def process_image_endpoint(
     - **file**: 入力画像ファイル（jpg, png対応）
     - **mosaic_ratio**: モザイクの粗さ
     - **padding**: 顔周りの余白
+    - **detector**: 顔検出のバックエンド（省略時はサーバーの設定）
+    - **detect_size**: 顔検出に使う画像の長辺（0で元の解像度）
+    - **tile_size**: タイル分割検出のタイルの辺（0で無効）。大きな画像の小さな顔向け
+    - **tile_overlap**: 隣り合うタイルの重なり（0〜0.5）
+    - **direct**: 処理後の画像をこのレスポンスの本文として直接返す（デフォルトfalse）。
+      ディスクへの保存とダウンロードの往復を省く。検出した顔の数は X-Faces-Detected ヘッダで返す
+    - **image_format**: 出力形式 png / jpeg / webp（デフォルト: direct なら入力と同じ形式、それ以外は png）
+    - **quality**: jpeg / webp の品質（1〜100、デフォルト90）
+    - **timings**: 処理段階ごとの所要時間の内訳をレスポンスに含める（direct では Server-Timing ヘッダ）
     """
     if not file.filename:
         raise HTTPException(status_code=400, detail="ファイル名が必要です")
@@ -562,51 +1680,208 @@ async def process_image_endpoint(
     if ext not in ['.jpg', '.jpeg', '.png', '.webp']:
         raise HTTPException(status_code=400, detail="サポートされていない画像形式です")
 
-    face_detector = get_detector()
+    # 画像を読み込み（サイズ上限・形式をチェックしながら）
+    start = time.perf_counter()
+    input_format, content = await read_upload(iter_upload(file), MAX_IMAGE_BYTES, IMAGE_FORMATS)
+    REGISTRY.observe("upload", time.perf_counter() - start)
+    REGISTRY.inc("mosaic_input_bytes_total", len(content), kind="image")
+    detector = detector or DETECTOR_BACKEND
+    if image_format is None:
+        image_format = input_format if direct else "png"
+    if IMAGE_ENCODINGS[image_format][2] is None:
+        # 品質の指定は出力に影響しない
+        quality = 0
+
+    # 同じ画像・同じパラメータの処理結果があれば再利用（direct はファイルに保存しないため対象外）
+    cache_key = ResultCache.make_key(
+        content_sha256(content), "image",
+        mosaic_ratio=mosaic_ratio, padding=padding, detector=detector, detect_size=detect_size,
+        tile_size=tile_size, tile_overlap=tile_overlap, image_format=image_format, quality=quality
+    )
+    cached = None if direct else result_cache.get(cache_key)
+    REGISTRY.inc("mosaic_requests_total", endpoint="image", cached="true" if cached is not None else "false")
+    if cached is not None:
+        return {
+            "success": True,
+            "file_id": cached["file_id"],
+            "download_url": f"/api/mosaic/download/image/{cached['file_id']}",
+            "faces_detected": cached["stats"]["faces_detected"],
+            "cached": True
+        }
+
+    face_detector = get_detector(detector)
 
-    # 画像を読み込み
-    content = await file.read()
+    metrics = StageMetrics()
+    start = time.perf_counter()
     nparr = np.frombuffer(content, np.uint8)
     image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
 
     if image is None:
         raise HTTPException(status_code=400, detail="画像を読み込めません")
+    metrics.since("decode", start)
 
     # 処理
+    detections = None
+    if tile_size:
+        detections = detect_faces_tiled(image, tile_size, tile_overlap, detect_size, metrics, detector)
     processed_image, face_count, _ = process_frame(
-        image, face_detector, mosaic_ratio, padding, None
+        image, face_detector, mosaic_ratio, padding, None, detections, detect_size=detect_size, metrics=metrics
     )
 
-    # PNGとしてエンコード
-    _, buffer = cv2.imencode('.png', processed_image)
+    start = time.perf_counter()
+    buffer = encode_image(processed_image, image_format, quality)
+    metrics.since("encode", start)
+
+    if direct:
+        REGISTRY.merge(metrics.state())
+        REGISTRY.inc("mosaic_output_bytes_total", len(buffer), kind="image")
+        ext, media_type, _ = IMAGE_ENCODINGS[image_format]
+        headers = {
+            "X-Faces-Detected": str(face_count),
+            "Content-Disposition": f'inline; filename="mosaic{ext}"'
+        }
+        if timings:
+            headers["Server-Timing"] = server_timing(metrics)
+        return Response(content=buffer, media_type=media_type, headers=headers)
 
     file_id = str(uuid.uuid4())
-    output_path = OUTPUT_DIR / f"{file_id}_output.png"
+    output_path = OUTPUT_DIR / f"{file_id}_output{IMAGE_ENCODINGS[image_format][0]}"
 
     with open(output_path, "wb") as f:
-        f.write(buffer.tobytes())
+        f.write(buffer)
+    result_cache.put(cache_key, file_id, output_path, {"faces_detected": face_count})
+    REGISTRY.merge(metrics.state())
+    REGISTRY.inc("mosaic_output_bytes_total", len(buffer), kind="image")
 
-    return {
+    response = {
         "success": True,
         "file_id": file_id,
         "download_url": f"/api/mosaic/download/image/{file_id}",
-        "faces_detected": face_count
+        "faces_detected": face_count,
+        "cached": False
     }
+    if timings:
+        response["timings"] = metrics.breakdown()
+    return response
 
 
 @app.get("/api/mosaic/download/image/{file_id}")
 async def download_processed_image(file_id: str):
     """処理済み画像をダウンロード"""
-    output_path = OUTPUT_DIR / f"{file_id}_output.png"
+    for ext, media_type, _ in IMAGE_ENCODINGS.values():
+        output_path = OUTPUT_DIR / f"{file_id}_output{ext}"
+        if output_path.exists():
+            return FileResponse(
+                output_path,
+                media_type=media_type,
+                filename=f"mosaic_{file_id}{ext}"
+            )
 
-    if not output_path.exists():
-        raise HTTPException(status_code=404, detail="ファイルが見つかりません")
+    raise HTTPException(status_code=404, detail="ファイルが見つかりません")
 
-    return FileResponse(
-        output_path,
-        media_type="image/png",
-        filename=f"mosaic_{file_id}.png"
-    )
+
+@app.websocket("/api/mosaic/live")
+async def live_mosaic(
+    websocket: WebSocket,
+    mosaic_ratio: float = Query(0.05, ge=0.01, le=0.2),
+    padding: float = Query(DEFAULT_PADDING, ge=0.0, le=1.0),
+    detector: Optional[str] = Query(None, pattern=BACKEND_PATTERN),
+    detect_stride: int = Query(1, ge=1, le=30),
+    detect_size: int = Query(0, ge=0, le=4096),
+    image_format: str = Query("jpeg", pattern="^(jpeg|webp)$"),
+    quality: int = Query(80, ge=1, le=100)
+):
+    """
+    ライブモード: エンコード済みのフレームを WebSocket で受け取り、モザイクを適用して送り返す
+
+    クライアントはフレーム（JPEG / WebP）をバイナリメッセージで送る。サーバーは1フレームごとに
+    情報（JSON のテキストメッセージ）と処理後のフレーム（バイナリメッセージ）をこの順に送り返す。
+    情報の seq は受信したフレームの通し番号（1始まり）、latency_ms は受信してから送り返すまでの時間、
+    dropped は処理が追いつかずに捨てたフレームの累計。
+    処理中に届いたフレームは最新の1枚だけを残し、それより古いものは処理せずに捨てる。
+    起動時の準備が終わる前と、同時接続数が MAX_LIVE_SESSIONS に達している場合は
+    接続を受け付けた直後に close code 1013（Try Again Later）で閉じる。
+    """
+    global live_sessions
+
+    await websocket.accept()
+    if not startup_state["ready"]:
+        REGISTRY.inc("mosaic_live_rejected_total", reason="starting")
+        await websocket.close(code=LIVE_TRY_AGAIN_CODE, reason="サーバーの起動準備中です")
+        return
+    if live_sessions >= MAX_LIVE_SESSIONS:
+        REGISTRY.inc("mosaic_live_rejected_total", reason="too_many_sessions")
+        await websocket.close(
+            code=LIVE_TRY_AGAIN_CODE, reason=f"ライブモードの同時接続数が上限（{MAX_LIVE_SESSIONS}）に達しています"
+        )
+        return
+
+    # Face Detector の作成中も1接続として数える（同時に届いた接続が上限を超えないように）
+    live_sessions += 1
+    try:
+        session = await asyncio.to_thread(
+            LiveSession, mosaic_ratio, padding, detect_stride, detect_size, image_format, quality, detector
+        )
+    except HTTPException as e:
+        live_sessions -= 1
+        await websocket.close(code=1011, reason=str(e.detail))
+        return
+
+    latest: Optional[tuple] = None
+    frame_ready = asyncio.Event()
+    received = dropped = 0
+
+    async def receive_frames() -> None:
+        # 受信は処理と並行に続け、処理待ちのフレームは最新の1枚だけにする
+        nonlocal latest, received, dropped
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+                data = message.get("bytes")
+                if not data:
+                    continue
+                received += 1
+                if latest is not None:
+                    dropped += 1
+                    REGISTRY.inc("mosaic_live_frames_total", status="dropped")
+                latest = (received, data, time.perf_counter())
+                frame_ready.set()
+        finally:
+            frame_ready.set()
+
+    receiver = asyncio.create_task(receive_frames())
+    try:
+        while True:
+            await frame_ready.wait()
+            frame_ready.clear()
+            if latest is None:
+                if receiver.done():
+                    break
+                continue
+            seq, data, received_at = latest
+            latest = None
+
+            if len(data) > MAX_IMAGE_BYTES:
+                await websocket.send_json({"seq": seq, "error": "フレームが大きすぎます", "dropped": dropped})
+                continue
+            frame, info = await asyncio.to_thread(session.process, data)
+            latency = time.perf_counter() - received_at
+            REGISTRY.observe("live_frame", latency)
+            REGISTRY.inc("mosaic_live_frames_total", status="processed" if frame is not None else "invalid")
+            await websocket.send_json({
+                "seq": seq, "latency_ms": round(latency * 1000, 2), "dropped": dropped, **info
+            })
+            if frame is not None:
+                await websocket.send_bytes(frame)
+    except Exception as e:
+        # 送信中の切断など
+        print(f"Live session closed: {e}")
+    finally:
+        receiver.cancel()
+        session.close()
+        live_sessions -= 1
 
 
 if __name__ == "__main__":
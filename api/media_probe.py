@@ -0,0 +1,594 @@
+"""
+動画の情報の取得（プローブ）
+回転・サイズ・フレームレート・フレーム数・コーデック・キーフレームの位置を1回でまとめて取得し、
+ファイルのハッシュ（無ければパス・サイズ・更新時刻）をキーにキャッシュする。
+
+MP4 / MOV はファイル末尾の mdat を読まずに moov ボックスだけを Python で解析する
+（tkhd の表示行列から回転、stsd / avcC からコーデックとサイズ、stts / ctts / stss から
+フレームレート・フレーム数・キーフレーム）。ffprobe のプロセス起動（数十ms）が不要になる。
+それ以外の形式や、断片化 MP4・可変フレームレートなど解析できない場合だけ ffprobe を使う
+"""
+
+import json
+import math
+import os
+import struct
+import subprocess
+import threading
+from collections import OrderedDict
+from fractions import Fraction
+from pathlib import Path
+from typing import Iterator, Optional
+
+import numpy as np
+
+# キャッシュする動画の数
+PROBE_CACHE_SIZE = 256
+# moov の大きさの上限（これより大きい場合は ffprobe に任せる）
+MAX_MOOV_BYTES = 256 * 1024 * 1024
+
+# サンプルエントリの形式 -> ffprobe の codec_name
+VIDEO_CODECS = {
+    "avc1": "h264", "avc3": "h264", "hvc1": "hevc", "hev1": "hevc", "av01": "av1",
+    "vp09": "vp9", "vp08": "vp8", "mp4v": "mpeg4", "jpeg": "mjpeg", "mjpa": "mjpeg", "apcn": "prores",
+    "apch": "prores", "apcs": "prores", "apco": "prores", "ap4h": "prores",
+}
+AUDIO_CODECS = {
+    "ac-3": "ac3", "ec-3": "eac3", "alac": "alac", "Opus": "opus", "fLaC": "flac", ".mp3": "mp3",
+    "samr": "amr_nb", "sawb": "amr_wb", "sowt": "pcm_s16le", "twos": "pcm_s16be",
+}
+# mp4a の esds の objectTypeIndication -> codec_name
+MP4A_OBJECT_TYPES = {0x40: "aac", 0x66: "aac", 0x67: "aac", 0x68: "aac", 0x69: "mp3", 0x6B: "mp3", 0xA5: "ac3", 0xA6: "eac3"}
+# chroma_format_idc と色範囲 -> pix_fmt（8bit）
+H264_PIX_FMTS = {0: "gray", 1: "yuv420p", 2: "yuv422p", 3: "yuv444p"}
+# SPS に chroma_format_idc などが含まれるプロファイル
+H264_HIGH_PROFILES = (100, 110, 122, 244, 44, 83, 86, 118, 128, 138, 139, 134, 135)
+
+_cache: OrderedDict = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class UnsupportedMedia(Exception):
+    """Python での解析に対応していない（ffprobe に任せる）"""
+
+
+def probe_media(path: str, file_hash: Optional[str] = None, keyframes: bool = False) -> dict:
+    """
+    動画の情報を取得（キャッシュ済みならそれを返す）
+
+    Args:
+        path: 動画のパス
+        file_hash: ファイルの内容のハッシュ（計算済みの場合。同じ内容の別のファイルでもキャッシュを使う）
+        keyframes: キーフレームの位置と各フレームの時刻も必要（ffprobe ではファイル全体の走査が必要になる）
+
+    Returns:
+        width, height（保存されている向きのサイズ）, rotation（0 / 90 / 180 / 270）, fps,
+        frame_rate（ffmpeg に渡す分数表記）, total_frames（不明な場合は0）, codec, pix_fmt（不明なら None）,
+        audio_codec（音声が無ければ None）, keyframes（キーフレームの表示順のフレーム番号）,
+        pts（表示順の各フレームの時刻、秒）, source（"mp4" / "ffprobe"）。
+        keyframes / pts は ffprobe で keyframes=False の場合は None
+    """
+    stat = os.stat(path)
+    keys = [f"{Path(path).resolve()}:{stat.st_size}:{stat.st_mtime_ns}"]
+    if file_hash:
+        keys.insert(0, file_hash)
+
+    with _cache_lock:
+        for key in keys:
+            info = _cache.get(key)
+            if info is not None and (info["keyframes"] is not None or not keyframes):
+                _cache.move_to_end(key)
+                return dict(info)
+
+    try:
+        info = parse_mp4(path)
+    except UnsupportedMedia:
+        info = probe_ffprobe(path, keyframes)
+    except Exception as e:
+        print(f"MP4 parse failed, falling back to ffprobe: {e}")
+        info = probe_ffprobe(path, keyframes)
+
+    with _cache_lock:
+        for key in keys:
+            _cache[key] = info
+            _cache.move_to_end(key)
+        while len(_cache) > PROBE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return dict(info)
+
+
+# --- ffprobe ---
+
+def probe_ffprobe(path: str, keyframes: bool = False) -> dict:
+    """ffprobe で動画の情報を取得（戻り値は probe_media と同じ）"""
+    entries = "stream=index,codec_type,codec_name,pix_fmt,width,height,r_frame_rate,nb_frames" \
+        ":stream_tags=rotate:stream_side_data=rotation"
+    if keyframes:
+        # パケットを走査する（デコードはしない）
+        entries += ":packet=stream_index,pts_time,flags"
+    result = subprocess.run([
+        'ffprobe', '-v', 'error',
+        '-show_entries', entries,
+        '-print_format', 'json',
+        path
+    ], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe error: {result.stderr}")
+
+    data = json.loads(result.stdout)
+    streams = data.get('streams', [])
+    video = next((s for s in streams if s.get('codec_type') == 'video'), None)
+    if video is None:
+        raise RuntimeError("映像ストリームが見つかりません")
+    audio = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+
+    # 回転情報を取得（tags または side_data から）
+    rotation = video.get('tags', {}).get('rotate', '0')
+    for sd in video.get('side_data_list', []):
+        if 'rotation' in sd:
+            rotation = sd['rotation']
+
+    frame_rate = video.get('r_frame_rate', '30/1')
+    num, _, den = frame_rate.partition('/')
+    fps = float(num) / float(den) if den and float(den) else float(num)
+    nb_frames = video.get('nb_frames', '0')
+
+    keyframe_list = pts = None
+    if keyframes:
+        packets = [
+            (float(p['pts_time']), 'K' in p.get('flags', ''))
+            for p in data.get('packets', [])
+            if p.get('stream_index') == video.get('index') and p.get('pts_time', 'N/A') != 'N/A'
+        ]
+        # パケットはデコード順のため、表示時刻で並べ替えてフレーム番号を振る
+        packets.sort(key=lambda p: p[0])
+        keyframe_list = [i for i, (_, key) in enumerate(packets) if key]
+        pts = [t for t, _ in packets]
+
+    return {
+        "width": int(video['width']),
+        "height": int(video['height']),
+        # マイナスの回転（-90など）を正の数（270など）に変換し、360の範囲に収める
+        "rotation": int(float(rotation)) % 360,
+        "fps": fps,
+        "frame_rate": frame_rate,
+        "total_frames": int(nb_frames) if str(nb_frames).isdigit() else 0,
+        "codec": video.get('codec_name'),
+        "pix_fmt": video.get('pix_fmt'),
+        "audio_codec": audio.get('codec_name') if audio else None,
+        "keyframes": keyframe_list,
+        "pts": pts,
+        "source": "ffprobe",
+    }
+
+
+# --- MP4 / MOV ---
+
+def _boxes(data: memoryview, start: int = 0, end: Optional[int] = None) -> Iterator[tuple]:
+    """data[start:end] のボックスを (種類, 中身の開始位置, 終了位置) で返す"""
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", data, pos)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            raise UnsupportedMedia("壊れたボックスがあります")
+        yield kind.decode("latin-1"), pos + header, pos + size
+        pos += size
+
+
+def _child(data: memoryview, start: int, end: int, kind: str) -> Optional[tuple]:
+    """指定した種類の最初の子ボックスの (中身の開始位置, 終了位置)"""
+    for child_kind, child_start, child_end in _boxes(data, start, end):
+        if child_kind == kind:
+            return child_start, child_end
+    return None
+
+
+def _read_moov(path: str) -> memoryview:
+    """ファイルの先頭からボックスをたどり、moov だけを読み込む（mdat は読み飛ばす）"""
+    with open(path, "rb") as f:
+        file_size = os.fstat(f.fileno()).st_size
+        pos = 0
+        first = True
+        while pos + 8 <= file_size:
+            f.seek(pos)
+            header = f.read(16)
+            size, kind = struct.unpack_from(">I4s", header)
+            header_size = 8
+            if size == 1:
+                size = struct.unpack_from(">Q", header, 8)[0]
+                header_size = 16
+            elif size == 0:
+                size = file_size - pos
+            kind = kind.decode("latin-1")
+            if first and kind not in ("ftyp", "moov", "mdat", "free", "skip", "wide", "pnot"):
+                raise UnsupportedMedia("MP4 / MOV ではありません")
+            first = False
+            if size < header_size:
+                raise UnsupportedMedia("壊れたボックスがあります")
+            if kind == "moov":
+                if size > MAX_MOOV_BYTES:
+                    raise UnsupportedMedia("moov が大きすぎます")
+                f.seek(pos + header_size)
+                return memoryview(f.read(size - header_size))
+            pos += size
+    raise UnsupportedMedia("moov が見つかりません")
+
+
+def _matrix(data: memoryview, offset: int) -> np.ndarray:
+    """表示行列（tkhd / mvhd）の回転・拡大縮小の 2x2 部分"""
+    a, b, _, c, d = struct.unpack_from(">iiiii", data, offset)
+    return np.array([[a, b], [c, d]], dtype=np.float64) / 65536.0
+
+
+def parse_mp4(path: str) -> dict:
+    """
+    MP4 / MOV の moov を解析して動画の情報を取得（戻り値は probe_media と同じ）
+
+    Raises:
+        UnsupportedMedia: 解析に対応していない（MP4 以外・断片化 MP4・可変フレームレートなど）、
+            または moov が壊れている（途中で切れた・長さの合わないボックスなど）
+    """
+    try:
+        return _parse_mp4(path)
+    except (struct.error, IndexError, ValueError, ZeroDivisionError, OverflowError) as e:
+        # 壊れた moov は長さの足りない読み込みなどで様々な例外になるため、まとめて ffprobe に任せる
+        raise UnsupportedMedia(f"moov を解析できません（{type(e).__name__}: {e}）") from e
+
+
+def _parse_mp4(path: str) -> dict:
+    """parse_mp4 の本体（壊れた moov による例外は parse_mp4 でまとめる）"""
+    moov = _read_moov(path)
+    if _child(moov, 0, len(moov), "mvex") is not None:
+        raise UnsupportedMedia("断片化 MP4 です")
+
+    movie_matrix = np.eye(2)
+    mvhd = _child(moov, 0, len(moov), "mvhd")
+    if mvhd is not None:
+        movie_matrix = _matrix(moov, mvhd[0] + (48 if moov[mvhd[0]] == 1 else 36))
+
+    video = None
+    audio_codec = None
+    for kind, start, end in _boxes(moov):
+        if kind != "trak":
+            continue
+        mdia = _child(moov, start, end, "mdia")
+        hdlr = _child(moov, *mdia, "hdlr") if mdia else None
+        if hdlr is None:
+            continue
+        handler = bytes(moov[hdlr[0] + 8:hdlr[0] + 12]).decode("latin-1")
+        if handler == "vide" and video is None:
+            video = _parse_video_trak(moov, start, end, mdia, movie_matrix)
+        elif handler == "soun" and audio_codec is None:
+            stsd = _find(moov, mdia, ("minf", "stbl", "stsd"))
+            audio_codec = _audio_codec(moov, stsd) if stsd else None
+    if video is None:
+        raise UnsupportedMedia("映像トラックがありません")
+    return {**video, "audio_codec": audio_codec, "source": "mp4"}
+
+
+def _find(data: memoryview, box: tuple, path: tuple) -> Optional[tuple]:
+    """子ボックスを順にたどる"""
+    for kind in path:
+        box = _child(data, *box, kind)
+        if box is None:
+            return None
+    return box
+
+
+def _parse_video_trak(data: memoryview, start: int, end: int, mdia: tuple, movie_matrix: np.ndarray) -> dict:
+    """映像トラックを解析"""
+    tkhd = _child(data, start, end, "tkhd")
+    mdhd = _child(data, *mdia, "mdhd")
+    stbl = _find(data, mdia, ("minf", "stbl"))
+    if tkhd is None or mdhd is None or stbl is None:
+        raise UnsupportedMedia("映像トラックの情報が足りません")
+
+    # 回転（ffmpeg と同じく tkhd と mvhd の表示行列を掛け合わせ、av_display_rotation_get の符号にそろえる）
+    matrix = _matrix(data, tkhd[0] + (52 if data[tkhd[0]] == 1 else 40)) @ movie_matrix
+    scale_x = math.hypot(matrix[0, 0], matrix[1, 0]) or 1.0
+    scale_y = math.hypot(matrix[0, 1], matrix[1, 1]) or 1.0
+    angle = -math.degrees(math.atan2(matrix[0, 1] / scale_y, matrix[0, 0] / scale_x))
+    rotation = int(round(angle)) % 360
+
+    version = data[mdhd[0]]
+    timescale = struct.unpack_from(">I", data, mdhd[0] + (20 if version == 1 else 12))[0]
+    if timescale == 0:
+        raise UnsupportedMedia("タイムスケールが0です")
+
+    stsd = _child(data, *stbl, "stsd")
+    if stsd is None:
+        raise UnsupportedMedia("stsd がありません")
+    entry = next(_boxes(data, stsd[0] + 8, stsd[1]), None)
+    if entry is None:
+        raise UnsupportedMedia("サンプルエントリがありません")
+    fourcc, entry_start, entry_end = entry
+    codec = VIDEO_CODECS.get(fourcc)
+    if codec is None:
+        raise UnsupportedMedia(f"対応していない映像コーデックです: {fourcc}")
+    width, height = struct.unpack_from(">HH", data, entry_start + 24)
+    pix_fmt = None
+    if codec == "h264":
+        # サイズ（クロップ後）と pix_fmt は ffprobe と同じく SPS から求める
+        width, height, pix_fmt = _h264_format(data, entry_start + 78, entry_end)
+
+    # サンプル（フレーム）の時刻: stts はデコード順の間隔、ctts は表示時刻とのずれ
+    deltas = _table(data, _child(data, *stbl, "stts"))
+    if deltas is None or not len(deltas):
+        raise UnsupportedMedia("stts がありません")
+    total_frames = _sample_count(data, stbl)
+    if total_frames == 0:
+        raise UnsupportedMedia("サンプルがありません")
+    if int(deltas[:, 0].sum()) != total_frames:
+        # 壊れた表からフレームごとの配列を作ると巨大になるため、ここで止める
+        raise UnsupportedMedia("stts と stsz のサンプル数が一致しません")
+    frame_delta = _constant_delta(deltas)
+    if frame_delta is None:
+        raise UnsupportedMedia("可変フレームレートです")
+    frame_rate = Fraction(timescale, frame_delta)
+
+    durations = np.repeat(deltas[:, 1], deltas[:, 0])[:total_frames]
+    dts = np.concatenate(([0], np.cumsum(durations[:-1], dtype=np.int64)))
+    ctts = _table(data, _child(data, *stbl, "ctts"), signed=True)
+    if ctts is not None and len(ctts):
+        if int(ctts[:, 0].sum()) > total_frames:
+            raise UnsupportedMedia("ctts のサンプル数が多すぎます")
+        offsets = np.repeat(ctts[:, 1], ctts[:, 0])[:total_frames]
+        dts[:len(offsets)] += offsets
+    pts = dts - _edit_media_time(data, start, end)
+
+    # キーフレーム（stss が無ければすべてのサンプルがキーフレーム）。番号はデコード順の1始まり
+    order = np.argsort(pts, kind="stable")
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    stss = _child(data, *stbl, "stss")
+    if stss is None:
+        keyframes = list(range(total_frames))
+    else:
+        count = struct.unpack_from(">I", data, stss[0] + 4)[0]
+        samples = np.frombuffer(data, dtype=">u4", count=count, offset=stss[0] + 8).astype(np.int64) - 1
+        keyframes = sorted(int(rank[s]) for s in samples if 0 <= s < total_frames)
+
+    return {
+        "width": int(width),
+        "height": int(height),
+        "rotation": rotation,
+        "fps": float(frame_rate),
+        "frame_rate": f"{frame_rate.numerator}/{frame_rate.denominator}",
+        "total_frames": total_frames,
+        "codec": codec,
+        "pix_fmt": pix_fmt,
+        "keyframes": keyframes,
+        "pts": (np.sort(pts) / timescale).tolist(),
+    }
+
+
+def _table(data: memoryview, box: Optional[tuple], signed: bool = False) -> Optional[np.ndarray]:
+    """stts / ctts の (サンプル数, 値) の表"""
+    if box is None:
+        return None
+    count = struct.unpack_from(">I", data, box[0] + 4)[0]
+    table = np.frombuffer(data, dtype=">i4" if signed else ">u4", count=count * 2, offset=box[0] + 8)
+    return table.reshape(-1, 2).astype(np.int64)
+
+
+def _sample_count(data: memoryview, stbl: tuple) -> int:
+    """サンプル数（stsz / stz2）"""
+    stsz = _child(data, *stbl, "stsz")
+    if stsz is not None:
+        sample_size, count = struct.unpack_from(">II", data, stsz[0] + 4)
+        # サンプルごとのサイズの表がボックスに収まらないものは壊れている
+        if sample_size == 0 and stsz[1] - stsz[0] < 12 + 4 * count:
+            raise UnsupportedMedia("stsz が壊れています")
+        return count
+    stz2 = _child(data, *stbl, "stz2")
+    if stz2 is not None:
+        field_size = data[stz2[0] + 7]
+        count = struct.unpack_from(">I", data, stz2[0] + 8)[0]
+        if stz2[1] - stz2[0] < 12 + (count * field_size + 7) // 8:
+            raise UnsupportedMedia("stz2 が壊れています")
+        return count
+    raise UnsupportedMedia("stsz がありません")
+
+
+def _constant_delta(deltas: np.ndarray) -> Optional[int]:
+    """フレームの間隔が一定ならその値（最後の1フレームだけ違うものは許容する）"""
+    body = deltas[:-1] if len(deltas) > 1 and deltas[-1, 0] == 1 else deltas
+    values = np.unique(body[:, 1])
+    if len(values) != 1 or values[0] <= 0:
+        return None
+    return int(values[0])
+
+
+def _edit_media_time(data: memoryview, start: int, end: int) -> int:
+    """編集リスト（elst）の最初の空でない編集の開始時刻（B フレームのずれの補正など）"""
+    elst = _find(data, (start, end), ("edts", "elst"))
+    if elst is None:
+        return 0
+    version = data[elst[0]]
+    count = struct.unpack_from(">I", data, elst[0] + 4)[0]
+    offset = elst[0] + 8
+    for _ in range(count):
+        if version == 1:
+            _, media_time = struct.unpack_from(">Qq", data, offset)
+            offset += 20
+        else:
+            _, media_time = struct.unpack_from(">Ii", data, offset)
+            offset += 12
+        if media_time != -1:
+            return media_time
+    return 0
+
+
+def _audio_codec(data: memoryview, stsd: tuple) -> Optional[str]:
+    """音声トラックのコーデック名"""
+    entry = next(_boxes(data, stsd[0] + 8, stsd[1]), None)
+    if entry is None:
+        return None
+    fourcc, entry_start, entry_end = entry
+    if fourcc != "mp4a":
+        return AUDIO_CODECS.get(fourcc, fourcc)
+    # QuickTime のサウンドサンプルエントリはバージョンによって長さが違う
+    version = struct.unpack_from(">H", data, entry_start + 8)[0]
+    children = entry_start + 28 + {1: 16, 2: 36}.get(version, 0)
+    esds = _find(data, (children, entry_end), ("esds",))
+    if esds is None:
+        wave = _child(data, children, entry_end, "wave")
+        esds = _child(data, *wave, "esds") if wave else None
+    object_type = _esds_object_type(data, esds) if esds else None
+    return MP4A_OBJECT_TYPES.get(object_type, "mp4a")
+
+
+def _esds_object_type(data: memoryview, esds: tuple) -> Optional[int]:
+    """esds の DecoderConfigDescriptor の objectTypeIndication"""
+    pos, end = esds[0] + 4, esds[1]
+
+    def descriptor(pos: int) -> tuple:
+        tag = data[pos]
+        length = 0
+        pos += 1
+        for _ in range(4):
+            byte = data[pos]
+            pos += 1
+            length = (length << 7) | (byte & 0x7F)
+            if not byte & 0x80:
+                break
+        return tag, pos, length
+
+    tag, pos, _ = descriptor(pos)
+    if tag != 0x03:
+        return None
+    flags = data[pos + 2]
+    pos += 3
+    if flags & 0x80:
+        pos += 2
+    if flags & 0x40:
+        pos += 1 + data[pos]
+    if flags & 0x20:
+        pos += 2
+    if pos >= end:
+        return None
+    tag, pos, _ = descriptor(pos)
+    return data[pos] if tag == 0x04 and pos < end else None
+
+
+# --- H.264 ---
+
+class _BitReader:
+    """SPS の RBSP を読む（エミュレーション防止バイトは除去済み）"""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def bits(self, n: int) -> int:
+        value = 0
+        for _ in range(n):
+            byte = self.data[self.pos >> 3]
+            value = (value << 1) | ((byte >> (7 - (self.pos & 7))) & 1)
+            self.pos += 1
+        return value
+
+    def ue(self) -> int:
+        zeros = 0
+        while self.bits(1) == 0:
+            zeros += 1
+            if zeros > 31:
+                raise UnsupportedMedia("SPS を読めません")
+        return (1 << zeros) - 1 + self.bits(zeros)
+
+    def se(self) -> int:
+        value = self.ue()
+        return (value + 1) // 2 if value & 1 else -(value // 2)
+
+
+def _h264_format(data: memoryview, start: int, end: int) -> tuple[int, int, str]:
+    """
+    avcC の SPS からクロップ後のサイズと pix_fmt を求める（ffmpeg の h264 デコーダと同じ判定）
+
+    Returns:
+        (width, height, pix_fmt)
+    """
+    avcc = _child(data, start, end, "avcC")
+    if avcc is None or data[avcc[0] + 5] & 0x1F == 0:
+        raise UnsupportedMedia("avcC に SPS がありません")
+    length = struct.unpack_from(">H", data, avcc[0] + 6)[0]
+    nal = bytes(data[avcc[0] + 8:avcc[0] + 8 + length])
+    # NAL ヘッダを除き、エミュレーション防止バイト（00 00 03）を取り除く
+    rbsp = nal[1:].replace(b"\x00\x00\x03", b"\x00\x00")
+    r = _BitReader(rbsp)
+
+    profile_idc = r.bits(8)
+    r.bits(16)  # constraint_set_flags, level_idc
+    r.ue()  # seq_parameter_set_id
+    chroma_format_idc, bit_depth = 1, 8
+    if profile_idc in H264_HIGH_PROFILES:
+        chroma_format_idc = r.ue()
+        if chroma_format_idc == 3 and r.bits(1):
+            # separate_colour_plane_flag
+            chroma_format_idc = 0
+        bit_depth = r.ue() + 8
+        r.ue()  # bit_depth_chroma_minus8
+        r.bits(1)  # qpprime_y_zero_transform_bypass_flag
+        if r.bits(1):  # seq_scaling_matrix_present_flag
+            for i in range(8 if chroma_format_idc != 3 else 12):
+                if r.bits(1):
+                    last = next_scale = 8
+                    for _ in range(16 if i < 6 else 64):
+                        if next_scale != 0:
+                            next_scale = (last + r.se() + 256) % 256
+                        last = next_scale or last
+    r.ue()  # log2_max_frame_num_minus4
+    poc_type = r.ue()
+    if poc_type == 0:
+        r.ue()
+    elif poc_type == 1:
+        r.bits(1)
+        r.se()
+        r.se()
+        for _ in range(r.ue()):
+            r.se()
+    r.ue()  # max_num_ref_frames
+    r.bits(1)  # gaps_in_frame_num_value_allowed_flag
+    width = (r.ue() + 1) * 16
+    height_units = r.ue() + 1
+    frame_mbs_only = r.bits(1)
+    if not frame_mbs_only:
+        r.bits(1)  # mb_adaptive_frame_field_flag
+    height = height_units * 16 * (2 - frame_mbs_only)
+    r.bits(1)  # direct_8x8_inference_flag
+    if r.bits(1):  # frame_cropping_flag
+        crop_x = 1 if chroma_format_idc in (0, 3) else 2
+        crop_y = (2 if chroma_format_idc == 1 else 1) * (2 - frame_mbs_only)
+        left, right, top, bottom = r.ue(), r.ue(), r.ue(), r.ue()
+        width -= (left + right) * crop_x
+        height -= (top + bottom) * crop_y
+
+    # 色範囲: SPS の video_full_range_flag、SPS に無ければコンテナの colr
+    full_range = None
+    if r.bits(1):  # vui_parameters_present_flag
+        if r.bits(1) and r.bits(8) == 255:  # aspect_ratio_info
+            r.bits(32)
+        if r.bits(1):  # overscan_info_present_flag
+            r.bits(1)
+        if r.bits(1):  # video_signal_type_present_flag
+            r.bits(3)
+            full_range = bool(r.bits(1))
+    if full_range is None:
+        colr = _child(data, start, end, "colr")
+        if colr is not None and bytes(data[colr[0]:colr[0] + 4]) == b"nclx" and colr[1] - colr[0] >= 11:
+            full_range = bool(data[colr[0] + 10] & 0x80)
+
+    if bit_depth == 8:
+        pix_fmt = H264_PIX_FMTS.get(chroma_format_idc, "yuv420p")
+        if full_range and chroma_format_idc != 0:
+            pix_fmt = pix_fmt.replace("yuv", "yuvj")
+    else:
+        pix_fmt = f"{H264_PIX_FMTS.get(chroma_format_idc, 'yuv420p')}{bit_depth}le"
+    return width, height, pix_fmt
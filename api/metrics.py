@@ -0,0 +1,214 @@
+"""
+処理時間・件数のメトリクス
+処理段階ごとの所要時間をヒストグラムとして集計し、Prometheus のテキスト形式で出力する。
+ワーカープロセスでは StageMetrics に記録して統計情報と一緒に返し、親プロセスの REGISTRY にまとめる
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from typing import Optional
+
+# 処理時間のヒストグラムの上限（秒）。1フレーム（ミリ秒単位）から動画全体（分単位）まで
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0
+)
+# 1フレームあたりの顔の数のヒストグラムの上限
+FACE_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 20, 50)
+
+
+class Histogram:
+    """バケットごとの件数（累積しない）と合計・件数を持つヒストグラム。累積は出力時に行う"""
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, state: dict) -> None:
+        """state() の値を加算（別プロセスの集計をまとめる）"""
+        for i, n in enumerate(state["counts"]):
+            self.counts[i] += n
+        self.sum += state["sum"]
+        self.count += state["count"]
+
+    def state(self) -> dict:
+        """プロセス間で受け渡せる形式"""
+        return {"counts": list(self.counts), "sum": self.sum, "count": self.count}
+
+
+class StageMetrics:
+    """
+    1リクエスト（1ジョブ）分の処理段階ごとの所要時間と、フレームごとの顔の数
+
+    計測する側は time.perf_counter() の差を observe に渡すだけにし、
+    ホットパスでのオーバーヘッドをバケットの二分探索程度に抑える。
+    """
+
+    def __init__(self):
+        self.stages: dict[str, Histogram] = {}
+        self.faces = Histogram(FACE_BUCKETS)
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """段階の所要時間（秒）を記録"""
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = Histogram()
+        histogram.observe(seconds)
+
+    def since(self, stage: str, start: float) -> float:
+        """start（time.perf_counter()）からの経過時間を記録し、現在時刻を返す"""
+        now = time.perf_counter()
+        self.observe(stage, now - start)
+        return now
+
+    def observe_faces(self, count: int) -> None:
+        """1フレームの顔の数を記録"""
+        self.faces.observe(count)
+
+    def merge(self, state: dict) -> None:
+        """state() の値を加算（セグメントごとのワーカーの集計をまとめる）"""
+        for stage, histogram_state in state["stages"].items():
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram()
+            histogram.merge(histogram_state)
+        self.faces.merge(state["faces"])
+
+    def state(self) -> dict:
+        """プロセス間で受け渡せる形式"""
+        return {
+            "stages": {stage: h.state() for stage, h in self.stages.items()},
+            "faces": self.faces.state()
+        }
+
+    def breakdown(self) -> dict:
+        """レスポンスに含める段階ごとの内訳（回数・合計・平均）"""
+        return {
+            stage: {
+                "count": h.count,
+                "total_ms": round(h.sum * 1000, 3),
+                "mean_ms": round(h.sum * 1000 / h.count, 3) if h.count else 0.0
+            }
+            for stage, h in self.stages.items()
+        }
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in sorted(labels.items())) + "}"
+
+
+def _format_value(value: float) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class MetricsRegistry:
+    """
+    親プロセスのメトリクス（/metrics で出力）
+
+    - mosaic_stage_seconds{stage=...}: 処理段階ごとの所要時間
+    - mosaic_faces_per_frame: 1フレームあたりの顔の数
+    - その他のカウンタ（inc で任意の名前・ラベルを加算）
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: dict[str, Histogram] = {}
+        self._faces = Histogram(FACE_BUCKETS)
+        self._counters: dict[tuple, float] = {}
+        self._help: dict[str, str] = {}
+
+    def describe(self, name: str, help_text: str) -> None:
+        """カウンタの説明（# HELP）を登録"""
+        self._help[name] = help_text
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        """カウンタを加算"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """親プロセスで計測した段階の所要時間を記録"""
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def merge(self, state: Optional[dict]) -> None:
+        """StageMetrics.state() の値を加算"""
+        if not state:
+            return
+        with self._lock:
+            for stage, histogram_state in state["stages"].items():
+                histogram = self._stages.get(stage)
+                if histogram is None:
+                    histogram = self._stages[stage] = Histogram()
+                histogram.merge(histogram_state)
+            self._faces.merge(state["faces"])
+
+    def render(self, gauges: Optional[dict] = None) -> str:
+        """
+        Prometheus のテキスト形式で出力
+
+        Args:
+            gauges: 出力時点の値をそのまま出すもの {名前: (説明, 値)}
+        """
+        lines = []
+        with self._lock:
+            lines.append("# HELP mosaic_stage_seconds Time spent in each processing stage")
+            lines.append("# TYPE mosaic_stage_seconds histogram")
+            for stage in sorted(self._stages):
+                self._render_histogram(lines, "mosaic_stage_seconds", self._stages[stage], {"stage": stage})
+
+            lines.append("# HELP mosaic_faces_per_frame Number of faces mosaicked per frame")
+            lines.append("# TYPE mosaic_faces_per_frame histogram")
+            self._render_histogram(lines, "mosaic_faces_per_frame", self._faces, {})
+
+            names = sorted({name for name, _ in self._counters})
+            for name in names:
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for (counter, labels), value in sorted(self._counters.items()):
+                    if counter == name:
+                        lines.append(f"{name}{_format_labels(dict(labels))} {_format_value(value)}")
+
+        for name, (help_text, value) in (gauges or {}).items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_histogram(lines: list, name: str, histogram: Histogram, labels: dict) -> None:
+        cumulative = 0
+        for bound, n in zip(histogram.buckets, histogram.counts):
+            cumulative += n
+            lines.append(f"{name}_bucket{_format_labels({**labels, 'le': _format_value(bound)})} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {histogram.count}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}")
+        lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+
+
+# 親プロセス全体で共有する集計
+REGISTRY = MetricsRegistry()
+REGISTRY.describe("mosaic_requests_total", "Processing requests by endpoint and whether the result cache was used")
+REGISTRY.describe("mosaic_jobs_total", "Finished video jobs by status")
+REGISTRY.describe("mosaic_rejected_total", "Video jobs rejected by admission control, by reason")
+REGISTRY.describe("mosaic_live_frames_total", "Frames received in live mode, by status (processed, dropped, invalid)")
+REGISTRY.describe("mosaic_live_rejected_total", "Live mode connections rejected, by reason (starting, too_many_sessions)")
+REGISTRY.describe("mosaic_input_bytes_total", "Bytes received in uploads")
+REGISTRY.describe("mosaic_output_bytes_total", "Bytes of processed output files")
@@ -0,0 +1,376 @@
+"""
+顔の無い GOP の再エンコードの省略（スマートリマックス）
+先に全フレームの顔検出だけを行い、顔を含まない区間は元動画のキーフレーム単位（GOP）で
+ストリームコピーし、モザイクが必要な GOP だけをデコード・モザイク処理・再エンコードして結合する
+"""
+
+import math
+import subprocess
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+
+from ffmpeg_pipe import FFmpegReader, FFmpegWriter, probe_video
+from media_probe import probe_media
+from metrics import StageMetrics
+from segments import concat_segments
+from sidecar import DetectionRecorder, DetectionReplay
+from tracking import FaceTracker
+
+# 顔が検出されたフレームの前後で、コピーせずにモザイク処理する範囲（秒）。検出漏れのフレームを補う
+REMUX_MARGIN_SEC = 0.5
+# コピーした GOP と再エンコードした GOP を1本のストリームとして結合できる映像
+REMUX_CODECS = ("h264",)
+REMUX_PIX_FMTS = ("yuv420p",)
+# 再エンコードせずに MP4 に格納できる音声コーデック
+MP4_AUDIO_CODECS = ("aac", "mp3", "alac", "ac3", "eac3")
+
+
+def probe_gops(input_path: str) -> dict:
+    """
+    キーフレームの位置とコーデックを取得（media_probe。MP4 は moov の解析のみでデコードはしない）
+
+    Returns:
+        codec, pix_fmt, audio_codec（音声が無ければ None）, total_frames,
+        keyframes（キーフレームの表示順のフレーム番号）, pts（表示順の各フレームの時刻）
+    """
+    info = probe_media(input_path, keyframes=True)
+    return {
+        "codec": info["codec"],
+        "pix_fmt": info["pix_fmt"],
+        "audio_codec": info["audio_codec"],
+        "total_frames": len(info["pts"]),
+        "keyframes": info["keyframes"],
+        "pts": info["pts"],
+    }
+
+
+def remux_unsupported_reason(info: dict, layout: dict, rotation: int) -> Optional[str]:
+    """
+    スマートリマックスができない理由（できる場合は None）
+
+    Args:
+        info: probe_video の結果
+        layout: probe_gops の結果
+        rotation: 回転メタデータ（コピーした GOP は回転を焼き付けられないため 0 のみ）
+    """
+    if layout["codec"] not in REMUX_CODECS or layout["pix_fmt"] not in REMUX_PIX_FMTS:
+        return f"コピーと再エンコードを結合できない形式です（{layout['codec']}, {layout['pix_fmt']}）"
+    if rotation != 0:
+        return "回転メタデータ付きの動画です"
+    if info["width"] % 2 or info["height"] % 2:
+        return "幅・高さが奇数です"
+    if layout["total_frames"] == 0 or not layout["keyframes"] or layout["keyframes"][0] != 0:
+        return "先頭がキーフレームではありません"
+    if info["total_frames"] and info["total_frames"] != layout["total_frames"]:
+        return "フレーム数が一致しません"
+    # 再エンコードする区間はフレーム番号から時刻を求めてシークするため、固定フレームレートが前提
+    pts = np.asarray(layout["pts"])
+    expected = pts[0] + np.arange(len(pts)) / info["fps"]
+    if np.abs(pts - expected).max() > 0.5 / info["fps"]:
+        return "可変フレームレートの動画です"
+    return None
+
+
+def plan_remux(keyframes: list, total_frames: int, face_frames: np.ndarray, margin: int) -> list:
+    """
+    GOP ごとにコピーするか再エンコードするかを決め、連続する同じ扱いの GOP をまとめる
+
+    Args:
+        keyframes: キーフレームのフレーム番号（先頭は 0）
+        total_frames: 総フレーム数
+        face_frames: 顔が検出されたフレーム番号
+        margin: 顔が検出されたフレームの前後で再エンコードの対象にするフレーム数
+
+    Returns:
+        (開始フレーム, 終了フレーム, 再エンコードするか) のリスト
+    """
+    delta = np.zeros(total_frames + 1, dtype=np.int32)
+    face_frames = np.unique(face_frames)
+    np.add.at(delta, np.clip(face_frames - margin, 0, total_frames), 1)
+    np.add.at(delta, np.clip(face_frames + margin + 1, 0, total_frames), -1)
+    covered = np.cumsum(delta[:-1]) > 0
+
+    spans = []
+    bounds = list(keyframes) + [total_frames]
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        encode = bool(covered[start:end].any())
+        if spans and spans[-1][2] == encode:
+            spans[-1] = (spans[-1][0], end, encode)
+        else:
+            spans.append((start, end, encode))
+    return spans
+
+
+def detect_all_frames(
+    reader,
+    face_detector,
+    total_frames: int,
+    recorder: DetectionRecorder,
+    detect_stride: int = 1,
+    detect_size: int = 0,
+    motion_threshold: float = 0.0,
+    roi_full_scan_interval: int = 0,
+    tile_size: int = 0,
+    tile_overlap: float = 0.2,
+    progress_callback: Optional[Callable[..., None]] = None,
+    metrics: Optional[StageMetrics] = None
+) -> tuple[int, FaceTracker]:
+    """
+    全フレームの顔検出だけを行い（モザイク・エンコードはしない）、結果を recorder に記録
+
+    Returns:
+        読み込んだフレーム数、使用したトラッカー（検出・追従の回数の集計用）
+    """
+    import main
+
+    if metrics is None:
+        metrics = StageMetrics()
+    tracker = FaceTracker(detect_stride, motion_threshold, roi_full_scan_interval)
+    detect_time = 0.0
+
+    def detect(frame: np.ndarray) -> list:
+        nonlocal detect_time
+        start = time.perf_counter()
+        if tile_size:
+            faces = main.detect_faces_tiled(frame, tile_size, tile_overlap, detect_size, metrics, face_detector.name)
+        else:
+            faces = main.detect_faces(frame, face_detector, detect_size, metrics)
+        detect_time += time.perf_counter() - start
+        return faces
+
+    frame_index = 0
+    while True:
+        start = time.perf_counter()
+        ret, frame = reader.read()
+        if not ret:
+            break
+        start = metrics.since("decode", start)
+        detect_time = 0.0
+        recorder.add(frame_index, tracker.update(frame, detect))
+        metrics.observe("track", time.perf_counter() - start - detect_time)
+        frame_index += 1
+        if progress_callback is not None:
+            progress_callback(frame_index, total_frames)
+    return frame_index, tracker
+
+
+def split_gops(input_path: str, boundaries: list, pattern: str) -> None:
+    """
+    元動画の映像をキーフレームの位置で再エンコードせずに分割
+
+    SPS/PPS をキーフレームごとにストリーム内にも入れ、別のエンコーダの GOP と結合しても
+    デコーダが切り替えられるようにする。
+
+    Args:
+        boundaries: 分割するフレーム番号（キーフレーム）
+        pattern: 出力パス（"%03d" を含む）
+    """
+    command = [
+        'ffmpeg', '-y', '-v', 'error',
+        '-i', input_path,
+        '-map', '0:v:0',
+        '-c:v', 'copy',
+        '-bsf:v', 'h264_mp4toannexb',
+        '-f', 'segment',
+        '-segment_format', 'mp4',
+        '-reset_timestamps', '1',
+    ]
+    if boundaries:
+        command += ['-segment_frames', ",".join(map(str, boundaries))]
+    command.append(pattern)
+    try:
+        subprocess.run(command, check=True, capture_output=True)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"ffmpeg split error: {e.stderr.decode(errors='replace')}")
+
+
+def count_video_packets(path: str) -> int:
+    """映像ストリームのパケット数（= フレーム数）を数える（デコードはしない）"""
+    result = subprocess.run([
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'v:0',
+        '-count_packets',
+        '-show_entries', 'stream=nb_read_packets',
+        '-of', 'csv=p=0',
+        path
+    ], capture_output=True, text=True)
+    value = result.stdout.strip()
+    return int(value) if value.isdigit() else -1
+
+
+def process_video_remux(
+    input_path: str,
+    output_path: str,
+    face_detector,
+    rotation: int,
+    frame_options: dict,
+    fragmented: bool = False
+) -> Optional[dict]:
+    """
+    顔を含む GOP だけを再エンコードし、それ以外はストリームコピーして動画を処理
+
+    保存済みの検出結果（frame_options の replay）があれば検出のためのデコードも省略する。
+    スマートリマックスできない動画（H.264 以外・回転あり・可変フレームレートなど）では None を返し、
+    通常の処理に任せる。検出を済ませた後に失敗した場合も None を返すが、その際は frame_options の
+    replay を検出結果に置き換えて検出をやり直さないようにする。
+
+    Args:
+        frame_options: mosaic_frames に渡すパラメータ
+        fragmented: 断片化 MP4 で書き出す
+
+    Returns:
+        処理結果の統計情報（copied_frames / encoded_frames を含む）。通常の処理に任せる場合は None
+    """
+    import main
+
+    metrics = frame_options["metrics"]
+    progress_callback = frame_options.get("progress_callback")
+    replay = frame_options.get("replay")
+    recorder = frame_options.get("recorder")
+
+    start = time.perf_counter()
+    try:
+        info = probe_video(input_path)
+        layout = probe_gops(input_path)
+    except Exception as e:
+        print(f"Smart remux skipped: {e}")
+        return None
+    metrics.since("ffprobe", start)
+
+    reason = remux_unsupported_reason(info, layout, rotation)
+    if reason is not None:
+        print(f"Smart remux skipped: {reason}")
+        return None
+    total_frames = layout["total_frames"]
+
+    tracker = None
+    if replay is None or replay.frame_count != total_frames:
+        # 1. 顔検出だけを行う（結果はサイドカーの記録先にもそのまま残る）
+        if recorder is None:
+            recorder = DetectionRecorder()
+        reader = FFmpegReader(input_path, info["width"], info["height"])
+        try:
+            decoded, tracker = detect_all_frames(
+                reader, face_detector, total_frames, recorder,
+                detect_stride=frame_options.get("detect_stride", 1),
+                detect_size=frame_options.get("detect_size", 0),
+                motion_threshold=frame_options.get("motion_threshold", 0.0),
+                roi_full_scan_interval=frame_options.get("roi_full_scan_interval", 0),
+                tile_size=frame_options.get("tile_size", 0),
+                tile_overlap=frame_options.get("tile_overlap", 0.2),
+                progress_callback=progress_callback,
+                metrics=metrics
+            )
+        finally:
+            reader.release()
+        replay = DetectionReplay.from_recorder(recorder, decoded)
+        # 通常の処理に切り替える場合も検出をやり直さない
+        frame_options["replay"] = replay
+        frame_options["recorder"] = None
+        if decoded != total_frames:
+            print(f"Smart remux skipped: デコードしたフレーム数が一致しません（{decoded} / {total_frames}）")
+            return None
+
+    # 2. GOP ごとにコピーするか再エンコードするかを決める
+    margin = math.ceil(info["fps"] * REMUX_MARGIN_SEC)
+    spans = plan_remux(layout["keyframes"], total_frames, replay.frames, margin)
+    if progress_callback is not None:
+        progress_callback(total_frames, total_frames, "encoding")
+
+    output = Path(output_path)
+    copy_pattern = str(output.with_suffix(".part%03d.mp4"))
+    piece_paths = [copy_pattern % i for i in range(len(spans))]
+    encoded_paths = [str(output.with_suffix(f".part{i:03d}e.mp4")) for i in range(len(spans))]
+    mosaic_options = {
+        k: v for k, v in frame_options.items()
+        if k not in ("replay", "recorder", "progress_callback", "metrics")
+    }
+    vf_filter = main.get_rotation_filter(0)
+    encoded_frames = 0
+
+    try:
+        # 3. 元動画を GOP の境界で分割（コピーする区間はそのまま使う）
+        if not all(encode for _, _, encode in spans):
+            start = time.perf_counter()
+            split_gops(input_path, [s for s, _, _ in spans[1:]], copy_pattern)
+            metrics.since("remux", start)
+
+        # 4. 顔を含む区間だけデコードしてモザイク処理・再エンコード
+        for i, (span_start, span_end, encode) in enumerate(spans):
+            if not encode:
+                continue
+            reader = FFmpegReader(
+                input_path, info["width"], info["height"],
+                start_time=max(0.0, (span_start - 0.5) / info["fps"]) if span_start > 0 else None,
+                max_frames=span_end - span_start
+            )
+            writer = FFmpegWriter(
+                encoded_paths[i], info["width"], info["height"], info["frame_rate"],
+                vf_filter, faststart=False, inband_headers=True
+            )
+            try:
+                stats = main.mosaic_frames(
+                    reader, writer, face_detector, span_end - span_start,
+                    frame_offset=span_start,
+                    replay=replay,
+                    metrics=metrics,
+                    # キャンセルの確認用（進捗はエンコード中のまま）
+                    progress_callback=(
+                        (lambda *_: progress_callback(total_frames, total_frames, "encoding"))
+                        if progress_callback is not None else None
+                    ),
+                    **mosaic_options
+                )
+            except BaseException:
+                reader.release()
+                writer.kill()
+                raise
+            reader.release()
+            start = time.perf_counter()
+            writer.release()
+            metrics.since("finalize", start)
+            if stats["processed_frames"] != span_end - span_start:
+                raise RuntimeError(
+                    f"再エンコードしたフレーム数が一致しません（{stats['processed_frames']} / {span_end - span_start}）"
+                )
+            encoded_frames += stats["processed_frames"]
+            piece_paths[i] = encoded_paths[i]
+
+        # 5. 結合（音声は MP4 に格納できるコーデックならコピー）
+        start = time.perf_counter()
+        concat_segments(
+            piece_paths, input_path, output_path, fragmented,
+            copy_audio=layout["audio_codec"] in MP4_AUDIO_CODECS
+        )
+        metrics.since("transcode", start)
+
+        written = count_video_packets(output_path)
+        if written != total_frames:
+            raise RuntimeError(f"結合後のフレーム数が一致しません（{written} / {total_frames}）")
+    except RuntimeError as e:
+        print(f"Smart remux failed, falling back to full encode: {e}")
+        output.unlink(missing_ok=True)
+        return None
+    except BaseException:
+        output.unlink(missing_ok=True)
+        raise
+    finally:
+        for path in [copy_pattern % i for i in range(len(spans))] + encoded_paths:
+            Path(path).unlink(missing_ok=True)
+
+    return {
+        "processed_frames": total_frames,
+        "total_faces_detected": len(replay.frames),
+        "detector_calls": tracker.detector_calls if tracker is not None else 0,
+        "tracked_frames": tracker.tracked_frames if tracker is not None else 0,
+        "skipped_detections": tracker.skipped_detections if tracker is not None else 0,
+        "roi_scans": tracker.regions.roi_scans if tracker is not None and tracker.regions is not None else 0,
+        "copied_frames": total_frames - encoded_frames,
+        "encoded_frames": encoded_frames,
+        "rotation_fixed": rotation,
+        "pipeline": "pipe",
+        "status": "Success with smart remux"
+    }
@@ -0,0 +1,194 @@
+"""
+処理結果のキャッシュ
+アップロードされたファイルの内容のハッシュと処理パラメータをキーに、
+処理済みファイルを再利用する。OUTPUT_DIR の容量と保存期間は LRU 順の削除で制限する
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+# OUTPUT_DIR に保持する処理結果の合計サイズの上限（バイト）
+CACHE_MAX_BYTES = int(os.environ.get("MOSAIC_CACHE_MAX_BYTES", 5 * 1024 ** 3))
+# 最後に使われてからこの秒数を過ぎたファイルは削除する
+CACHE_MAX_AGE_SEC = int(os.environ.get("MOSAIC_CACHE_MAX_AGE_SEC", 24 * 3600))
+# 削除処理を実行する間隔（秒）
+CACHE_EVICT_INTERVAL_SEC = int(os.environ.get("MOSAIC_CACHE_EVICT_INTERVAL_SEC", 60))
+
+# 処理結果の拡張子（main では動画の .mp4 と画像の出力形式すべてを渡す）
+OUTPUT_EXTENSIONS = (".mp4", ".png")
+# 容量・保存期間で削除する処理結果以外のファイル（入力・一時ファイル・セグメントは処理中のため対象外）
+EVICTABLE_EXTRA_PATTERNS = ("detections/*.npz",)
+# 保存期間を過ぎた場合だけ削除するファイル（異常終了で残った入力・一時ファイル）
+STALE_PATTERNS = ("*_input.*", "*_temp.mp4", "*.part*.mp4")
+
+
+def content_sha256(content: bytes) -> str:
+    """アップロードされた内容の SHA-256 を計算"""
+    return hashlib.sha256(content).hexdigest()
+
+
+class ResultCache:
+    """
+    内容のハッシュ＋処理パラメータ → 処理済みファイルの対応を保持する
+
+    最終利用時刻はファイルの更新時刻で管理する（キャッシュヒット時に更新）。
+    そのためサーバーを再起動しても削除の順序は保たれる。
+    """
+
+    def __init__(
+        self,
+        output_dir: Path,
+        max_bytes: int = CACHE_MAX_BYTES,
+        max_age_sec: int = CACHE_MAX_AGE_SEC,
+        output_extensions: tuple = OUTPUT_EXTENSIONS
+    ):
+        self.output_dir = output_dir
+        # 容量・保存期間で削除するファイル
+        self.evictable_patterns = tuple(f"*_output{ext}" for ext in output_extensions) + EVICTABLE_EXTRA_PATTERNS
+        self.max_bytes = max_bytes
+        self.max_age_sec = max_age_sec
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._pending: dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+
+    @staticmethod
+    def make_key(content_hash: str, endpoint: str, **params) -> str:
+        """
+        キャッシュキーを作成
+
+        Args:
+            content_hash: 入力ファイルの内容のハッシュ
+            endpoint: "video" / "image" など
+            **params: 出力に影響するパラメータ
+        """
+        suffix = ",".join(f"{k}={params[k]}" for k in sorted(params))
+        return f"{endpoint}:{content_hash}:{suffix}"
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        キャッシュされた処理結果を取得
+
+        Returns:
+            {"file_id", "path", "stats"}。無い場合や削除済みの場合は None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not Path(entry["path"]).exists():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+
+        # 最終利用時刻を更新（LRU）
+        try:
+            os.utime(entry["path"])
+        except OSError:
+            pass
+        return entry
+
+    def pending(self, key: str) -> Optional[str]:
+        """同じ内容・パラメータで処理中のファイルIDを取得"""
+        with self._lock:
+            file_id = self._pending.get(key)
+            if file_id is not None:
+                self.hits += 1
+            return file_id
+
+    def begin(self, key: str, file_id: str) -> None:
+        """処理の開始を記録（同時に届いた重複アップロードを同じ処理にまとめるため）"""
+        with self._lock:
+            self._pending[key] = file_id
+
+    def put(self, key: str, file_id: str, path: Path, stats: dict) -> None:
+        """処理結果を登録"""
+        with self._lock:
+            self._pending.pop(key, None)
+            self._entries[key] = {"file_id": file_id, "path": str(path), "stats": stats}
+            self._entries.move_to_end(key)
+
+    def abort(self, key: str) -> None:
+        """処理が失敗・キャンセルされた場合に処理中の記録を消す"""
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def forget_file(self, file_id: str) -> None:
+        """ファイルIDに対応するキャッシュを削除（クリーンアップ時）"""
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if e["file_id"] == file_id]:
+                del self._entries[key]
+
+    def evict(self) -> int:
+        """
+        保存期間を過ぎたファイルと、容量の上限を超えた分の古いファイルを削除
+
+        Returns:
+            削除したファイル数
+        """
+        with self._lock:
+            busy = set(self._pending.values())
+
+        files = []
+        for pattern in self.evictable_patterns:
+            for path in self.output_dir.glob(pattern):
+                if path.name.split("_")[0] in busy:
+                    continue
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+
+        # 最後に使われた時刻が古い順
+        files.sort(key=lambda f: f[0])
+        total = sum(size for _, size, _ in files)
+        now = time.time()
+        removed = 0
+
+        for mtime, size, path in files:
+            if total <= self.max_bytes and now - mtime <= self.max_age_sec:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+            with self._lock:
+                self.evictions += 1
+                self.evicted_bytes += size
+                for key in [k for k, e in self._entries.items() if e["path"] == str(path)]:
+                    del self._entries[key]
+
+        for pattern in STALE_PATTERNS:
+            for path in self.output_dir.glob(pattern):
+                try:
+                    if now - path.stat().st_mtime > self.max_age_sec:
+                        path.unlink(missing_ok=True)
+                        removed += 1
+                except OSError:
+                    continue
+
+        return removed
+
+    def stats(self) -> dict:
+        """ヒット・ミス・削除の件数"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "pending": len(self._pending),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "evicted_bytes": self.evicted_bytes,
+                "max_bytes": self.max_bytes,
+                "max_age_sec": self.max_age_sec
+            }
@@ -0,0 +1,273 @@
+"""
+動画の分割並列処理
+1本の動画をフレーム範囲ごとのセグメントに分け、別々のワーカープロセスで
+モザイク処理・エンコードしてから ffmpeg の concat demuxer で無劣化結合する。
+API のジョブではセグメントを動画処理ジョブのワーカープロセス（JobManager のプール）で処理する
+"""
+
+import multiprocessing
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, Executor, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Optional
+
+from ffmpeg_pipe import FFmpegReader, FFmpegWriter, movflags
+from jobs import MAX_WORKERS, CancelFlag
+from metrics import StageMetrics
+from sidecar import DetectionRecorder, load_replay
+
+# セグメント開始前に読み込んでトラッキング状態を温めるフレーム数（出力には含めない）
+SEGMENT_OVERLAP_FRAMES = 15
+# これより短いセグメントは作らない（分割のオーバーヘッドが勝つため）
+MIN_SEGMENT_FRAMES = 60
+# 1ジョブの分割数の上限（セグメントはジョブのワーカープロセスで処理するため、ワーカー数より多く分けても並列にならない）
+MAX_SEGMENT_WORKERS = int(os.environ.get("MOSAIC_MAX_SEGMENT_WORKERS", MAX_WORKERS))
+
+
+def plan_segments(total_frames: int, segments: int, overlap: int = SEGMENT_OVERLAP_FRAMES) -> list:
+    """
+    フレーム範囲でセグメントを分割
+
+    Args:
+        total_frames: 総フレーム数
+        segments: 分割数（短い動画では減らす）
+        overlap: 各セグメントの前に読み込むウォームアップのフレーム数
+
+    Returns:
+        (読み込み開始フレーム, 出力開始フレーム, 出力終了フレーム) のリスト
+    """
+    segments = max(1, min(segments, total_frames // MIN_SEGMENT_FRAMES))
+    bounds = [total_frames * i // segments for i in range(segments + 1)]
+    return [
+        (max(0, start - overlap), start, end)
+        for start, end in zip(bounds[:-1], bounds[1:])
+    ]
+
+
+def effective_segments(total_frames: int, segments: int) -> int:
+    """実際の分割数（MAX_SEGMENT_WORKERS で制限し、短い動画では減らす）"""
+    return len(plan_segments(total_frames, min(segments, MAX_SEGMENT_WORKERS)))
+
+
+def process_segment(
+    input_path: str,
+    segment_path: str,
+    segment: tuple,
+    info: dict,
+    vf_filter: str,
+    frame_options: dict,
+    replay_path: Optional[str] = None,
+    record: bool = False,
+    detector: Optional[str] = None,
+    cancel_flag: Optional[CancelFlag] = None
+) -> tuple[dict, Optional[tuple], dict]:
+    """
+    ワーカープロセスで1セグメントを処理（映像のみ、音声は結合時に付ける）
+
+    Args:
+        input_path: 入力動画パス
+        segment_path: セグメントの出力パス
+        segment: plan_segments が返す (読み込み開始, 出力開始, 出力終了) フレーム
+        info: probe_video の結果
+        vf_filter: 回転フィルタ
+        frame_options: mosaic_frames に渡すパラメータ
+        replay_path: 保存済みの検出結果（サイドカー）のパス
+        record: 検出結果を記録して返す
+        detector: 顔検出のバックエンド
+        cancel_flag: ジョブのキャンセル要求（フレームごとに確認し、キャンセルされたら JobCancelled で中断する）
+
+    Returns:
+        mosaic_frames の統計情報、記録した検出結果 (フレーム番号, ボックス) の配列（record 時のみ）、
+        処理時間の集計（StageMetrics.state()）
+    """
+    import main
+
+    read_start, start, end = segment
+    # フレームの表示時刻の半フレーム手前にシークし、read_start 番目のフレームから読み始める
+    start_time = max(0.0, (read_start - 0.5) / info["fps"])
+
+    reader = FFmpegReader(
+        input_path, info["width"], info["height"],
+        start_time=start_time if read_start > 0 else None,
+        max_frames=end - read_start
+    )
+    writer = FFmpegWriter(
+        segment_path, info["width"], info["height"], info["frame_rate"],
+        vf_filter, faststart=False
+    )
+    replay = load_replay(Path(replay_path)) if replay_path else None
+    recorder = DetectionRecorder() if record else None
+    metrics = StageMetrics()
+    try:
+        stats = main.mosaic_frames(
+            reader, writer, main.get_detector(detector), end - start,
+            warmup_frames=start - read_start,
+            frame_offset=read_start,
+            replay=replay,
+            recorder=recorder,
+            metrics=metrics,
+            progress_callback=(lambda *_: cancel_flag.check()) if cancel_flag is not None else None,
+            **frame_options
+        )
+    except BaseException:
+        reader.release()
+        writer.kill()
+        Path(segment_path).unlink(missing_ok=True)
+        raise
+
+    reader.release()
+    start = time.perf_counter()
+    writer.release()
+    metrics.since("finalize", start)
+    return stats, recorder.arrays() if recorder is not None else None, metrics.state()
+
+
+def concat_segments(
+    segment_paths: list,
+    audio_source: str,
+    output_path: str,
+    fragmented: bool = False,
+    copy_audio: bool = False
+) -> None:
+    """
+    エンコード済みのセグメントを再エンコードせずに結合し、元動画の音声を付ける
+
+    Args:
+        fragmented: 断片化 MP4 で書き出す
+        copy_audio: 音声を再エンコードせずにコピーする（MP4 に格納できるコーデックの場合）
+    """
+    list_path = Path(output_path).with_suffix(".segments.txt")
+    list_path.write_text("".join(f"file '{Path(p).resolve()}'\n" for p in segment_paths))
+    try:
+        subprocess.run([
+            'ffmpeg', '-y', '-v', 'error',
+            '-f', 'concat', '-safe', '0',
+            '-i', str(list_path),
+            '-i', audio_source,
+            '-map', '0:v:0',
+            '-map', '1:a:0?',
+            '-c:v', 'copy',
+            '-c:a', 'copy' if copy_audio else 'aac',
+            '-metadata:s:v', 'rotate=0',
+            *movflags(fragmented),
+            output_path
+        ], check=True, capture_output=True)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"ffmpeg concat error: {e.stderr.decode(errors='replace')}")
+    finally:
+        list_path.unlink(missing_ok=True)
+
+
+def process_video_segments(
+    input_path: str,
+    output_path: str,
+    info: dict,
+    vf_filter: str,
+    segments: int,
+    frame_options: dict,
+    detector: Optional[str] = None,
+    replay_path: Optional[str] = None,
+    recorder: Optional[DetectionRecorder] = None,
+    progress_callback: Optional[Callable[..., None]] = None,
+    metrics: Optional[StageMetrics] = None,
+    fragmented: bool = False,
+    cancel_flag: Optional[CancelFlag] = None,
+    executor: Optional[Executor] = None
+) -> dict:
+    """
+    動画をセグメントに分けて並列に処理し、結合する
+
+    各ワーカーは独自の Face Detector を持ち、セグメント開始前のフレームを
+    SEGMENT_OVERLAP_FRAMES だけ読み込んで前フレームの顔位置・トラッキング状態を引き継ぐ。
+    フレーム位置は固定フレームレートを前提に時刻へ換算する。
+    分割数は MAX_SEGMENT_WORKERS までに制限する（制限した場合はログに出す）。
+
+    Args:
+        info: probe_video の結果（total_frames が必要）
+        segments: 分割数（ワーカープロセス数）
+        frame_options: mosaic_frames に渡すパラメータ（progress_callback・replay・recorder・metrics を除く）
+        detector: 顔検出のバックエンド（各ワーカーがそれぞれ作成する）
+        replay_path: 保存済みの検出結果（サイドカー）のパス
+        recorder: 各セグメントの検出結果をまとめる記録先
+        progress_callback: セグメントが完了するたびに (処理済みフレーム数, 総フレーム数) で呼ばれ、
+            結合の前に (処理済みフレーム数, 総フレーム数, "encoding") で呼ばれる
+        metrics: 各セグメントの処理時間をまとめる記録先
+        fragmented: 結合した動画を断片化 MP4 で書き出す（結合が始まるまで出力は作られない）
+        cancel_flag: ジョブのキャンセル要求。各セグメントのワーカーがフレームごとに確認する。
+            セグメントが失敗・キャンセルされた場合は残りのセグメントにも中断を伝え、終了を待たずに戻る
+        executor: セグメントを処理するプロセスプール（JobManager のワーカー。Face Detector を作成済みのものを
+            使い回す）。None なら分割数のプロセスをこの呼び出しの間だけ起動する（一括処理など）
+
+    Returns:
+        セグメントの統計情報を合算したもの
+    """
+    plan = plan_segments(info["total_frames"], min(segments, MAX_SEGMENT_WORKERS))
+    if len(plan) < segments:
+        print(
+            f"Segments limited: {segments} -> {len(plan)} "
+            f"(MOSAIC_MAX_SEGMENT_WORKERS={MAX_SEGMENT_WORKERS}, {info['total_frames']} frames)"
+        )
+    segment_paths = [
+        str(Path(output_path).with_suffix(f".part{i:03d}.mp4")) for i in range(len(plan))
+    ]
+
+    own_executor = executor is None
+    if own_executor:
+        ctx = multiprocessing.get_context("spawn")
+        executor = ProcessPoolExecutor(max_workers=len(plan), mp_context=ctx)
+    futures = []
+    try:
+        futures = [
+            executor.submit(
+                process_segment, input_path, path, segment, info, vf_filter, frame_options,
+                replay_path, recorder is not None, detector, cancel_flag
+            )
+            for path, segment in zip(segment_paths, plan)
+        ]
+        pending = set(futures)
+        processed = 0
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_EXCEPTION)
+            for future in done:
+                processed += future.result()[0]["processed_frames"]
+            if progress_callback is not None:
+                progress_callback(processed, info["total_frames"])
+
+        results = []
+        for future in futures:
+            stats, detections, segment_metrics = future.result()
+            results.append(stats)
+            if recorder is not None:
+                recorder.extend(*detections)
+            if metrics is not None:
+                metrics.merge(segment_metrics)
+        if progress_callback is not None:
+            progress_callback(processed, info["total_frames"], "encoding")
+        start = time.perf_counter()
+        concat_segments(segment_paths, input_path, output_path, fragmented)
+        if metrics is not None:
+            metrics.since("transcode", start)
+    except BaseException:
+        # まだ始まっていないセグメントは取り消す
+        for future in futures:
+            future.cancel()
+        if cancel_flag is not None:
+            # 実行中のセグメントは次のフレームで中断するため、終了を待たずに戻る
+            cancel_flag.set()
+            if own_executor:
+                # shutdown(wait=False) ではワーカーに終了が伝わらずに残ることがあるため、別のスレッドで待つ
+                threading.Thread(target=executor.shutdown, kwargs={"cancel_futures": True}).start()
+                own_executor = False
+        raise
+    finally:
+        if own_executor:
+            executor.shutdown(wait=True, cancel_futures=True)
+        for path in segment_paths:
+            Path(path).unlink(missing_ok=True)
+
+    stats = {key: sum(r[key] for r in results) for key in results[0]}
+    stats["segments"] = len(plan)
+    return stats
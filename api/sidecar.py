@@ -0,0 +1,116 @@
+"""
+顔検出結果のサイドカー
+動画ごと（ファイルのハッシュ＋検出パラメータ）に、フレームごとの検出結果を
+NumPy 配列として保存し、モザイクの粗さや余白だけを変えた再処理では検出を省略する
+"""
+
+import hashlib
+import os
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+# 保存形式を変えた場合に古いサイドカーを無視するためのバージョン
+SIDECAR_VERSION = 1
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    """ファイルの SHA-256 を計算"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def sidecar_key(file_hash: str, **params) -> str:
+    """
+    サイドカーのファイル名を作成
+
+    Args:
+        file_hash: 入力動画のハッシュ
+        **params: 検出結果に影響するパラメータ（検出間隔・検出解像度など）
+    """
+    suffix = "_".join(f"{k}-{params[k]}" for k in sorted(params))
+    return f"{file_hash}_v{SIDECAR_VERSION}_{suffix}"
+
+
+class DetectionRecorder:
+    """フレームごとの検出結果 (x, y, w, h) を記録する"""
+
+    def __init__(self):
+        self._frames: list = []
+        self._boxes: list = []
+
+    def add(self, frame_index: int, boxes: list) -> None:
+        """1フレーム分の検出結果を追加"""
+        for box in boxes:
+            self._frames.append(frame_index)
+            self._boxes.append(box)
+
+    def extend(self, frames: np.ndarray, boxes: np.ndarray) -> None:
+        """別のレコーダーの配列をまとめて追加（セグメントの結果の結合用）"""
+        self._frames.extend(frames.tolist())
+        self._boxes.extend(map(tuple, boxes.tolist()))
+
+    def arrays(self) -> tuple[np.ndarray, np.ndarray]:
+        """(フレーム番号 [N], バウンディングボックス [N, 4]) の配列を取得"""
+        frames = np.asarray(self._frames, dtype=np.int32)
+        boxes = np.asarray(self._boxes, dtype=np.int32).reshape(-1, 4)
+        return frames, boxes
+
+    def save(self, path: Path, frame_count: int) -> None:
+        """
+        サイドカーとして保存
+
+        同じ動画を並行して処理している場合に壊れたファイルを読まないよう、
+        一時ファイルに書いてから置き換える。
+        """
+        frames, boxes = self.arrays()
+        order = np.argsort(frames, kind="stable")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, frames=frames[order], boxes=boxes[order], frame_count=np.int64(frame_count))
+        os.replace(tmp_path, path)
+
+
+class DetectionReplay:
+    """保存された検出結果をフレーム番号で引く"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        with np.load(path) as data:
+            self.frames = data["frames"]
+            self.boxes = data["boxes"]
+            self.frame_count = int(data["frame_count"])
+
+    @classmethod
+    def from_recorder(cls, recorder: DetectionRecorder, frame_count: int) -> "DetectionReplay":
+        """記録したばかりの検出結果から作成（ファイルを介さない。path は None）"""
+        replay = cls.__new__(cls)
+        frames, boxes = recorder.arrays()
+        order = np.argsort(frames, kind="stable")
+        replay.path = None
+        replay.frames = frames[order]
+        replay.boxes = boxes[order]
+        replay.frame_count = frame_count
+        return replay
+
+    def boxes_for(self, frame_index: int) -> list:
+        """フレームの検出結果 (x, y, w, h) のリストを取得"""
+        lo = np.searchsorted(self.frames, frame_index, side="left")
+        hi = np.searchsorted(self.frames, frame_index, side="right")
+        return [tuple(box) for box in self.boxes[lo:hi].tolist()]
+
+
+def load_replay(path: Path) -> Optional[DetectionReplay]:
+    """サイドカーがあれば読み込む（壊れている場合は None）"""
+    if not path.exists():
+        return None
+    try:
+        return DetectionReplay(path)
+    except Exception as e:
+        print(f"Detection sidecar load error: {e}")
+        return None
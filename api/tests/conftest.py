@@ -0,0 +1,29 @@
+"""
+テストの共通設定
+api 直下のモジュールはフラットに import されるため（from detectors import ... など）、api をパスに追加する
+"""
+
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def make_video(tmp_path):
+    """単色のフレームの短い MP4 を作成"""
+
+    def make(name: str = "clip.mp4", frames: int = 5, size: tuple = (160, 120)) -> Path:
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), 30, size)
+        for i in range(frames):
+            writer.write(np.full((size[1], size[0], 3), i * 20 % 256, dtype=np.uint8))
+        writer.release()
+        return path
+
+    return make
@@ -0,0 +1,75 @@
+import pytest
+from fastapi import HTTPException
+
+import admission
+import main
+from admission import AdmissionController, AdmissionRejected, Workload, estimate_video_cost
+
+
+def test_estimate_video_cost_from_frames_and_resolution(make_video, monkeypatch):
+    monkeypatch.setattr(admission, "WORKER_MPIX_PER_SEC", 1.0)
+    path = make_video(frames=30, size=(160, 120))
+    assert estimate_video_cost(str(path)) == pytest.approx(30 * 160 * 120 / 1e6)
+
+
+def test_estimate_video_cost_unreadable(tmp_path):
+    path = tmp_path / "broken.mp4"
+    path.write_bytes(b"not a video")
+    assert estimate_video_cost(str(path)) == 0.0
+
+
+def test_free_worker_means_no_wait():
+    controller = AdmissionController(workers=2, max_queued=4, max_wait_sec=10)
+    workload = [Workload(cost_sec=1000, running=True)]
+    assert controller.estimated_wait(workload) == 0.0
+    controller.check(workload)
+
+
+def test_wait_uses_remaining_cost():
+    controller = AdmissionController(workers=2)
+    workload = [
+        Workload(cost_sec=100, running=True, done_ratio=0.5),
+        Workload(cost_sec=40, running=True),
+        Workload(cost_sec=20, running=False),
+    ]
+    assert controller.estimated_wait(workload) == pytest.approx((50 + 40 + 20) / 2)
+
+
+def test_queue_full_retry_after_first_running_job():
+    controller = AdmissionController(workers=1, max_queued=2, max_wait_sec=1e9)
+    workload = [
+        Workload(cost_sec=30, running=True, done_ratio=0.5),
+        Workload(cost_sec=10, running=False),
+        Workload(cost_sec=10, running=False),
+    ]
+    with pytest.raises(AdmissionRejected) as excinfo:
+        controller.check(workload, queue_only=True)
+    rejected = excinfo.value
+    assert rejected.reason == "queue_full"
+    assert rejected.retry_after_sec == 15
+    assert rejected.queue_position == 3
+
+
+def test_overloaded_retry_after_excess_wait():
+    controller = AdmissionController(workers=1, max_queued=10, max_wait_sec=60)
+    workload = [Workload(cost_sec=100.2, running=True), Workload(cost_sec=50, running=False)]
+    # 待ち行列の長さだけを見る場合は受け付ける
+    controller.check(workload, queue_only=True)
+    with pytest.raises(AdmissionRejected) as excinfo:
+        controller.check(workload)
+    assert excinfo.value.reason == "overloaded"
+    # 見積もり待ち時間が上限に収まるまで（切り上げ）
+    assert excinfo.value.retry_after_sec == 91
+    assert excinfo.value.estimated_wait_sec == 150.2
+
+
+def test_check_admission_returns_429_with_retry_after(monkeypatch):
+    monkeypatch.setattr(main, "admission", AdmissionController(workers=1, max_queued=1))
+    monkeypatch.setattr(main.job_manager, "workload", lambda: [
+        Workload(cost_sec=8, running=True), Workload(cost_sec=8, running=False)
+    ])
+    with pytest.raises(HTTPException) as excinfo:
+        main.check_admission(queue_only=True)
+    assert excinfo.value.status_code == 429
+    assert excinfo.value.headers == {"Retry-After": "8"}
+    assert excinfo.value.detail["reason"] == "queue_full"
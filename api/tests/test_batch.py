@@ -0,0 +1,56 @@
+import inspect
+import sys
+
+import pytest
+
+import batch
+import main
+from compositor import DEFAULT_PADDING
+
+
+def touch(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x")
+    return path
+
+
+def test_glob_keeps_relative_paths(tmp_path):
+    touch(tmp_path / "in" / "a" / "x.mp4")
+    touch(tmp_path / "in" / "b" / "x.mp4")
+    out = tmp_path / "out"
+
+    items = batch.find_media([str(tmp_path / "in" / "*" / "*.mp4")], out)
+    assert sorted(output for _, output, _ in items) == [
+        str(out / "a" / "x.mp4"), str(out / "b" / "x.mp4")
+    ]
+
+
+def test_colliding_outputs_fail(tmp_path):
+    first = touch(tmp_path / "a" / "x.mp4")
+    second = touch(tmp_path / "b" / "x.mov")
+
+    with pytest.raises(ValueError, match="出力先が重複"):
+        batch.find_media([str(first), str(second)], tmp_path / "out")
+
+
+def test_glob_root():
+    assert batch.glob_root("archive/2024-*/*.mp4") == batch.Path("archive")
+    assert batch.glob_root("*.mp4") == batch.Path(".")
+    assert batch.glob_root("videos/clip.mp4") == batch.Path("videos")
+
+
+def test_cli_padding_matches_api_default(tmp_path, monkeypatch):
+    parsed = []
+    parse_args = batch.argparse.ArgumentParser.parse_args
+
+    def capture(self, *args, **kwargs):
+        parsed.append(parse_args(self, *args, **kwargs))
+        return parsed[-1]
+
+    monkeypatch.setattr(batch.argparse.ArgumentParser, "parse_args", capture)
+    monkeypatch.setattr(sys, "argv", ["batch.py", str(tmp_path / "in"), "-o", str(tmp_path / "out")])
+    batch.main()
+
+    assert parsed[0].padding == DEFAULT_PADDING
+    assert inspect.signature(main.process_video).parameters["padding"].default == DEFAULT_PADDING
+    assert inspect.signature(main.VideoOptions).parameters["padding"].default.default == DEFAULT_PADDING
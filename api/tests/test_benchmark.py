@@ -0,0 +1,49 @@
+import cv2
+import numpy as np
+
+import benchmark
+
+
+def case(path, **overrides):
+    return {
+        "path": str(path), "pipeline": "pipe", "detector": "haar", "detect_stride": 1, "detect_size": 0,
+        "motion_threshold": 0.0, "roi_full_scan_interval": 0, "tile_size": 0, **overrides
+    }
+
+
+def test_video_case_reports_stage_metrics(make_video):
+    result = benchmark.run_video_case(case(make_video(frames=10)))
+
+    stages = result["stages"]
+    assert set(stages) == set(benchmark.STAGES) | {"other"}
+    for stage in ("decode", "detect", "encode"):
+        assert stages[stage]["total_sec"] > 0, stage
+    assert result["frames"] == 10
+
+
+def test_image_case_reports_stage_metrics(tmp_path):
+    path = tmp_path / "frame.jpg"
+    cv2.imwrite(str(path), np.full((120, 160, 3), 128, np.uint8))
+
+    result = benchmark.run_image_case({"path": str(path), "repeat": 3, "detector": "haar", "detect_size": 0})
+
+    for stage in ("decode", "detect", "encode"):
+        assert result["stages"][stage]["total_sec"] > 0, stage
+    assert result["stages"]["track"]["total_sec"] == 0
+
+
+def test_stage_report_merges_stage_metrics():
+    breakdown = {
+        "cvt_color": {"count": 2, "total_ms": 10.0, "mean_ms": 5.0},
+        "detect": {"count": 2, "total_ms": 30.0, "mean_ms": 15.0},
+        "write": {"count": 2, "total_ms": 20.0, "mean_ms": 10.0},
+        "finalize": {"count": 1, "total_ms": 20.0, "mean_ms": 20.0},
+        "ffprobe": {"count": 1, "total_ms": 5.0, "mean_ms": 5.0},
+    }
+    stages = benchmark._stage_report(breakdown, wall=0.1, frames=2)
+
+    assert stages["detect"] == {"total_sec": 0.04, "ms_per_frame": 20.0}
+    assert stages["encode"] == {"total_sec": 0.04, "ms_per_frame": 20.0}
+    assert stages["decode"]["total_sec"] == 0
+    # ffprobe など対応の無い段階は other に入る
+    assert stages["other"]["total_sec"] == 0.02
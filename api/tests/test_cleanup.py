@@ -0,0 +1,21 @@
+from fastapi.testclient import TestClient
+
+import main
+
+
+def test_cleanup_removes_every_output_format():
+    file_id = "cleanup-test"
+    paths = [main.OUTPUT_DIR / f"{file_id}_output{ext}" for ext in main.OUTPUT_EXTENSIONS]
+    for path in paths:
+        path.write_bytes(b"x")
+
+    # 起動時の準備（lifespan）は不要なため with を使わない
+    response = TestClient(main.app).delete(f"/api/mosaic/cleanup/{file_id}")
+    assert response.status_code == 200
+    assert not any(path.exists() for path in paths)
+
+
+def test_result_cache_evicts_image_outputs():
+    patterns = main.result_cache.evictable_patterns
+    for ext, _, _ in main.IMAGE_ENCODINGS.values():
+        assert f"*_output{ext}" in patterns
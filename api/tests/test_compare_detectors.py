@@ -0,0 +1,33 @@
+import pytest
+
+import compare_detectors
+
+
+def test_run_backend_reports_stage_timings(make_video):
+    clip = str(make_video())
+    result = compare_detectors.run_backend("haar", [clip], max_frames=3, step=1, detect_size=0)
+
+    assert result["frames_processed"] == 3
+    assert result["prepare_ms"] is not None
+    assert result["detect_ms"] is not None
+
+
+def test_run_backend_fails_when_stage_missing(make_video, monkeypatch):
+    import main
+
+    # 計測を記録しない検出に差し替える
+    monkeypatch.setattr(main, "detect_faces_scored", lambda frame, detector, *args, **kwargs: [])
+    with pytest.raises(RuntimeError, match="cvt_color"):
+        compare_detectors.run_backend("haar", [str(make_video())], max_frames=2, step=1, detect_size=0)
+
+
+def test_consensus_faces_splits_confirmed_and_unconfirmed():
+    detections = {
+        "a": [(0, 0, 10, 10, 0.9), (100, 100, 10, 10, 0.8)],
+        "b": [(1, 1, 10, 10, 0.9)],
+    }
+    reference, unconfirmed = compare_detectors.consensus_faces(detections, consensus=2)
+
+    assert len(reference) == 1
+    assert reference[0][1] == {"a", "b"}
+    assert unconfirmed == {"a": 1, "b": 0}
@@ -0,0 +1,125 @@
+import inspect
+
+import numpy as np
+import pytest
+
+import main
+from compositor import DEFAULT_PADDING, GROUP_CELL_SIZE, MosaicCompositor
+
+
+def random_frame(height: int = 240, width: int = 320) -> np.ndarray:
+    return np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+
+def per_box_mosaic(frame: np.ndarray, box: tuple, ratio: float = 0.05) -> np.ndarray:
+    """以前の顔ごとの apply_mosaic による結果"""
+    x1, y1, x2, y2 = box
+    return main.apply_mosaic(frame.copy(), x1, y1, x2 - x1, y2 - y1, ratio)
+
+
+def groups(boxes: list, shape: tuple = (240, 320, 3)) -> list:
+    compositor = MosaicCompositor()
+    compositor._prepare(shape)
+    return sorted(compositor._groups(boxes))
+
+
+def test_single_face_matches_per_box_mosaic():
+    frame = random_frame()
+    box = (40, 30, 140, 150)
+
+    result = MosaicCompositor(0.05).apply(frame.copy(), [box])
+    np.testing.assert_array_equal(result, per_box_mosaic(frame, box))
+
+
+def test_separate_faces_match_per_box_mosaic():
+    frame = random_frame()
+    boxes = [(10, 10, 60, 70), (200, 100, 300, 220)]
+
+    expected = per_box_mosaic(per_box_mosaic(frame, boxes[0]), boxes[1])
+    result = MosaicCompositor(0.05).apply(frame.copy(), boxes)
+    np.testing.assert_array_equal(result, expected)
+    assert groups(boxes) == [(box, [box]) for box in sorted(boxes)]
+
+
+def test_overlapping_faces_are_mosaicked_once_as_one_region():
+    frame = random_frame()
+    boxes = [(10, 10, 100, 100), (60, 60, 160, 160)]
+
+    assert groups(boxes) == [((10, 10, 160, 160), boxes)]
+    # 外接矩形を1回だけモザイク化し、各顔の領域にだけ書き戻す（外接矩形の残りは元のまま）
+    union = per_box_mosaic(frame, (10, 10, 160, 160))
+    expected = frame.copy()
+    for (x1, y1, x2, y2) in boxes:
+        expected[y1:y2, x1:x2] = union[y1:y2, x1:x2]
+    result = MosaicCompositor(0.05).apply(frame.copy(), boxes)
+    np.testing.assert_array_equal(result, expected)
+    np.testing.assert_array_equal(result[100:160, 10:60], frame[100:160, 10:60])
+
+
+@pytest.mark.parametrize("second", [
+    # 同じセルにかかる（ピクセルでは重ならない）
+    (GROUP_CELL_SIZE * 2 - 4, 10, 80, 40),
+    # 隣のセル（セル単位で接する）
+    (GROUP_CELL_SIZE * 2, 10, 80, 40),
+    # 斜めに接するセル（8近傍）
+    (GROUP_CELL_SIZE * 2, GROUP_CELL_SIZE * 2, 80, 80),
+])
+def test_adjacent_faces_are_grouped(second):
+    first = (0, 0, GROUP_CELL_SIZE * 2 - 6, GROUP_CELL_SIZE * 2 - 6)
+    result = groups([first, second])
+
+    assert len(result) == 1
+    rect, members = result[0]
+    assert sorted(members) == sorted([first, second])
+    assert rect == (0, 0, max(first[2], second[2]), max(first[3], second[3]))
+
+
+def test_faces_one_cell_apart_are_not_grouped():
+    first = (0, 0, GROUP_CELL_SIZE, GROUP_CELL_SIZE)
+    second = (GROUP_CELL_SIZE * 2, 0, GROUP_CELL_SIZE * 3, GROUP_CELL_SIZE)
+    assert len(groups([first, second])) == 2
+
+
+def test_groups_with_overlapping_bounding_rects_are_merged():
+    # 斜めに並んだ2つのまとまりの外接矩形が重なる場合は1つにまとめる
+    boxes = [(0, 0, 100, 20), (80, 0, 100, 100), (0, 60, 40, 100), (30, 60, 50, 70)]
+    result = groups(boxes)
+
+    assert len(result) == 1
+    assert result[0][0] == (0, 0, 100, 100)
+    assert sorted(result[0][1]) == sorted(boxes)
+
+
+def test_cells_are_cleared_between_frames():
+    compositor = MosaicCompositor()
+    frame = random_frame()
+    compositor.apply(frame.copy(), [(10, 10, 100, 100), (60, 60, 160, 160)])
+    # 前のフレームの顔のセルが残っていれば、このフレームの顔もまとめられてしまう
+    assert len(compositor._groups([(10, 10, 40, 40), (120, 120, 160, 160)])) == 2
+
+
+def test_buffers_follow_frame_size():
+    compositor = MosaicCompositor(0.05)
+    for shape in ((240, 320, 3), (480, 640, 3), (240, 320, 3)):
+        frame = random_frame(*shape[:2])
+        box = (0, 0, shape[1], shape[0])
+        np.testing.assert_array_equal(compositor.apply(frame.copy(), [box]), per_box_mosaic(frame, box))
+
+
+def test_default_padding_is_applied():
+    assert inspect.signature(main.process_frame).parameters["padding"].default == DEFAULT_PADDING
+    frame = random_frame()
+    x, y, w, h = 100, 80, 50, 40
+
+    result, count, faces = main.process_frame(frame.copy(), None, detections=[(x, y, w, h)])
+    pad_x, pad_y = int(w * DEFAULT_PADDING), int(h * DEFAULT_PADDING)
+    box = (x - pad_x, y - pad_y, x + w + pad_x, y + h + pad_y)
+    assert count == 1
+    assert faces == [box]
+    np.testing.assert_array_equal(result, per_box_mosaic(frame, box))
+
+
+def test_padding_is_clipped_to_frame():
+    frame = random_frame()
+    _, _, faces = main.process_frame(frame.copy(), None, padding=0.5, detections=[(0, 200, 100, 40)])
+    assert faces == [(0, 180, 150, 240)]
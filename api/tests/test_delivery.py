@@ -0,0 +1,172 @@
+import threading
+import time
+
+import pytest
+from fastapi import FastAPI, Header
+from fastapi.testclient import TestClient
+
+import delivery
+from delivery import file_response, growing_file_response, parse_range_spec, resolve_range
+
+CONTENT = bytes(range(256)) * 4
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, None)),
+    ("bytes=-100", (None, 100)),
+    (None, None),
+    ("bytes=5-1", None),
+    ("bytes=-", None),
+    ("bytes=0-1,4-5", None),
+    ("items=0-1", None),
+    ("bytes=a-b", None),
+])
+def test_parse_range_spec(header, expected):
+    assert parse_range_spec(header) == expected
+
+
+@pytest.mark.parametrize("spec, expected", [
+    ((0, 99), (0, 99)),
+    ((100, None), (100, 1023)),
+    # 終了がファイルの外でも末尾までに切り詰める
+    ((1000, 5000), (1000, 1023)),
+    # 末尾 N バイト（ファイルより大きければ全体）
+    ((None, 24), (1000, 1023)),
+    ((None, 5000), (0, 1023)),
+    ((1024, None), None),
+    ((None, 0), None),
+])
+def test_resolve_range(spec, expected):
+    assert resolve_range(spec, len(CONTENT)) == expected
+
+
+def test_resolve_range_of_empty_file():
+    assert resolve_range((None, 10), 0) is None
+    assert resolve_range((0, None), 0) is None
+
+
+@pytest.fixture
+def served(tmp_path, monkeypatch):
+    """file_response / growing_file_response を返すだけのアプリ"""
+    monkeypatch.setattr(delivery, "TAIL_POLL_INTERVAL_SEC", 0.01)
+    path = tmp_path / "out.mp4"
+    writing = threading.Event()
+    app = FastAPI()
+
+    @app.get("/file")
+    def get_file(range: str = Header(None)):
+        return file_response(path, range, "video/mp4", filename="out.mp4")
+
+    @app.get("/growing")
+    def get_growing(range: str = Header(None)):
+        return growing_file_response(path, range, writing.is_set, "video/mp4")
+
+    return TestClient(app), path, writing
+
+
+def test_file_without_range_returns_whole_file(served):
+    client, path, _ = served
+    path.write_bytes(CONTENT)
+
+    response = client.get("/file")
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["content-length"] == str(len(CONTENT))
+    assert response.headers["content-disposition"] == 'attachment; filename="out.mp4"'
+
+
+@pytest.mark.parametrize("header, start, end", [
+    ("bytes=10-19", 10, 19),
+    ("bytes=1000-", 1000, 1023),
+    ("bytes=-24", 1000, 1023),
+    ("bytes=1000-5000", 1000, 1023),
+])
+def test_file_range_returns_partial_content(served, header, start, end):
+    client, path, _ = served
+    path.write_bytes(CONTENT)
+
+    response = client.get("/file", headers={"Range": header})
+    assert response.status_code == 206
+    assert response.content == CONTENT[start:end + 1]
+    assert response.headers["content-range"] == f"bytes {start}-{end}/{len(CONTENT)}"
+    assert response.headers["content-length"] == str(end - start + 1)
+
+
+def test_file_range_outside_file_returns_416(served):
+    client, path, _ = served
+    path.write_bytes(CONTENT)
+
+    response = client.get("/file", headers={"Range": "bytes=1024-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(CONTENT)}"
+
+
+def test_file_invalid_range_is_ignored(served):
+    client, path, _ = served
+    path.write_bytes(CONTENT)
+
+    response = client.get("/file", headers={"Range": "bytes=20-10"})
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+def test_growing_file_is_tailed_until_writing_ends(served):
+    client, path, writing = served
+    writing.set()
+
+    def write_chunks():
+        # ファイルが作られる前から待たせ、少しずつ追記してから書き込みを終える
+        time.sleep(0.05)
+        with open(path, "wb") as f:
+            for i in range(0, len(CONTENT), 256):
+                f.write(CONTENT[i:i + 256])
+                f.flush()
+                time.sleep(0.05)
+        writing.clear()
+
+    writer = threading.Thread(target=write_chunks)
+    writer.start()
+    try:
+        response = client.get("/growing", headers={"Range": "bytes=0-"})
+    finally:
+        writer.join()
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers["cache-control"] == "no-store"
+    assert "content-length" not in response.headers
+
+
+def test_growing_file_range_returns_written_part(served):
+    client, path, writing = served
+    writing.set()
+    path.write_bytes(CONTENT[:512])
+
+    response = client.get("/growing", headers={"Range": "bytes=100-"})
+    assert response.status_code == 206
+    assert response.content == CONTENT[100:512]
+    # 全体のサイズはまだ決まっていない
+    assert response.headers["content-range"] == "bytes 100-511/*"
+
+    response = client.get("/growing", headers={"Range": "bytes=-12"})
+    assert response.status_code == 206
+    assert response.content == CONTENT[500:512]
+
+
+def test_growing_file_range_not_yet_written_returns_416(served):
+    client, path, writing = served
+    writing.set()
+    path.write_bytes(CONTENT[:512])
+
+    assert client.get("/growing", headers={"Range": "bytes=512-"}).status_code == 416
+    path.unlink()
+    assert client.get("/growing", headers={"Range": "bytes=-10"}).status_code == 416
+
+
+def test_growing_file_that_is_never_written_ends_empty(served):
+    client, _, _ = served
+
+    response = client.get("/growing")
+    assert response.status_code == 200
+    assert response.content == b""
@@ -0,0 +1,88 @@
+import cv2
+import numpy as np
+import pytest
+
+import main
+from detectors import DetectorBackend
+from metrics import StageMetrics
+
+
+class FixedBackend(DetectorBackend):
+    """渡された画像のサイズを記録し、決まった位置の顔を返す"""
+
+    name = "fixed"
+
+    def __init__(self, boxes):
+        self.boxes = boxes
+        self.shapes = []
+
+    def detect(self, image):
+        self.shapes.append(image.shape[:2])
+        return list(self.boxes)
+
+
+class SquareBackend(FixedBackend):
+    """白い正方形を顔として返す（縮小した画像ではその画像の座標）"""
+
+    def __init__(self):
+        super().__init__([])
+
+    def detect(self, image):
+        self.shapes.append(image.shape[:2])
+        points = cv2.findNonZero((image[:, :, 0] > 127).astype(np.uint8))
+        return [(*cv2.boundingRect(points), 0.9)]
+
+
+def blank(height: int, width: int) -> np.ndarray:
+    return np.zeros((height, width, 3), np.uint8)
+
+
+def test_boxes_are_scaled_back_to_full_resolution():
+    backend = FixedBackend([(100, 50, 40, 30, 0.9)])
+
+    boxes = main.detect_faces(blank(1080, 1920), backend, detect_size=640)
+    # 長辺を detect_size にした画像で検出し、座標を元の解像度（3倍）に戻す
+    assert backend.shapes == [(360, 640)]
+    assert boxes == [(300, 150, 120, 90)]
+
+
+def test_portrait_frames_scale_by_height():
+    backend = FixedBackend([(10, 100, 20, 40, 0.9)])
+
+    boxes = main.detect_faces(blank(1920, 1080), backend, detect_size=480)
+    assert backend.shapes == [(480, 270)]
+    assert boxes == [(40, 400, 80, 160)]
+
+
+def test_scores_are_kept():
+    backend = FixedBackend([(10, 10, 10, 10, 0.75)])
+    assert main.detect_faces_scored(blank(800, 800), backend, detect_size=400) == [(20, 20, 20, 20, 0.75)]
+
+
+@pytest.mark.parametrize("detect_size", [0, 640, 1280])
+def test_small_frames_are_not_resized(detect_size):
+    backend = FixedBackend([(100, 50, 40, 30, 0.9)])
+
+    assert main.detect_faces(blank(480, 640), backend, detect_size=detect_size) == [(100, 50, 40, 30)]
+    assert backend.shapes == [(480, 640)]
+
+
+@pytest.mark.parametrize("height, width, detect_size", [(1080, 1920, 640), (720, 1280, 300), (700, 1000, 333)])
+def test_detected_face_maps_onto_original_face(height, width, detect_size):
+    frame = blank(height, width)
+    x, y, size = width // 2, height // 3, 160
+    frame[y:y + size, x:x + size] = 255
+    backend = SquareBackend()
+
+    (fx, fy, fw, fh), = main.detect_faces(frame, backend, detect_size=detect_size)
+    assert max(backend.shapes[0]) == detect_size
+    # 縮小による誤差は縮小率の1〜2画素分に収まる
+    tolerance = 2 * max(height, width) / detect_size
+    assert abs(fx - x) <= tolerance and abs(fy - y) <= tolerance
+    assert abs(fx + fw - (x + size)) <= tolerance and abs(fy + fh - (y + size)) <= tolerance
+
+
+def test_downscale_is_recorded_as_cvt_color():
+    metrics = StageMetrics()
+    main.detect_faces(blank(1080, 1920), FixedBackend([]), detect_size=640, metrics=metrics)
+    assert set(metrics.breakdown()) == {"cvt_color", "detect"}
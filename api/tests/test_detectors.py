@@ -0,0 +1,26 @@
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import detectors
+import main
+
+
+def test_registered_backends_document_their_model():
+    # 同梱のモデル（mediapipe・haar）は常に使える。それ以外は README にモデルの入手先を書く
+    assert {"mediapipe", "haar"} <= set(detectors.available_backends())
+    readme = (detectors.Path(__file__).parent.parent / "README.md").read_text()
+    for name in detectors.BACKENDS:
+        assert f"| `{name}` |" in readme
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(HTTPException) as excinfo:
+        detectors.create_backend("mediapipe_full")
+    assert excinfo.value.status_code == 400
+
+    # 起動時の準備（lifespan）は不要なため with を使わない
+    response = TestClient(main.app).post(
+        "/api/mosaic/image?detector=mediapipe_full", files={"file": ("a.png", b"\x89PNG\r\n\x1a\n")}
+    )
+    assert response.status_code == 422
@@ -0,0 +1,152 @@
+import random
+import threading
+import time
+
+import pytest
+
+from frame_pipeline import FramePipeline
+
+FRAMES = 200
+
+
+class Boom(Exception):
+    pass
+
+
+def make_reader(count: int = FRAMES, fail_at: int = -1, delay: float = 0.0):
+    """0, 1, 2, ... を返す read（fail_at 番目で例外）"""
+    state = {"next": 0}
+
+    def read():
+        if delay:
+            time.sleep(random.random() * delay)
+        i = state["next"]
+        if i == fail_at:
+            raise Boom("read")
+        if i >= count:
+            return False, None
+        state["next"] += 1
+        return True, i
+
+    return read
+
+
+def run(read, consume, detect=lambda frame: frame, queue_size: int = 2) -> FramePipeline:
+    """パイプラインを最後まで回す（デッドロックした場合は失敗させる）"""
+    result = {}
+
+    def target():
+        try:
+            with FramePipeline(read, consume, queue_size) as pipeline:
+                result["pipeline"] = pipeline
+                for frame in pipeline.frames():
+                    pipeline.submit(detect(frame))
+        except BaseException as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout=30)
+    assert not thread.is_alive(), "pipeline deadlocked"
+    # 例外で終わった場合もデコード・エンコードのスレッドが残らない
+    for worker in result["pipeline"]._threads:
+        assert not worker.is_alive()
+    if "error" in result:
+        raise result["error"]
+    return result["pipeline"]
+
+
+@pytest.mark.parametrize("queue_size", [0, 1, 4])
+def test_frame_order_is_preserved(queue_size):
+    random.seed(0)
+    consumed = []
+
+    def consume(item):
+        time.sleep(random.random() * 0.001)
+        consumed.append(item)
+
+    def detect(frame):
+        time.sleep(random.random() * 0.001)
+        return frame * 10
+
+    run(make_reader(delay=0.001), consume, detect, queue_size)
+    assert consumed == [i * 10 for i in range(FRAMES)]
+
+
+def test_queues_are_bounded():
+    gate = threading.Event()
+    consumed = []
+
+    def consume(item):
+        gate.wait(10)
+        consumed.append(item)
+
+    with FramePipeline(make_reader(), consume, queue_size=2) as pipeline:
+        frames = pipeline.frames()
+        for _ in range(3):
+            pipeline.submit(next(frames))
+        time.sleep(0.3)
+        # エンコードが止まっている間、デコードはキューの上限までしか先に進まない
+        assert pipeline._decoded.qsize() <= 2
+        assert pipeline._pending.qsize() <= 2
+        gate.set()
+        for frame in frames:
+            pipeline.submit(frame)
+    assert consumed == list(range(FRAMES))
+
+
+def test_reader_error_reaches_caller():
+    consumed = []
+    with pytest.raises(Boom, match="read"):
+        run(make_reader(fail_at=50), consumed.append)
+    assert consumed == list(range(len(consumed)))
+
+
+def test_worker_error_reaches_caller():
+    def detect(frame):
+        if frame == 50:
+            raise Boom("detect")
+        return frame
+
+    with pytest.raises(Boom, match="detect"):
+        run(make_reader(), lambda item: None, detect)
+
+
+def test_worker_error_stops_blocked_reader():
+    # デコードの方が速く、キューが一杯で待っている間に失敗する
+    def detect(frame):
+        time.sleep(0.05)
+        raise Boom("detect")
+
+    with pytest.raises(Boom, match="detect"):
+        run(make_reader(count=10_000), lambda item: None, detect)
+
+
+def test_writer_error_reaches_caller():
+    def consume(item):
+        if item == 50:
+            raise Boom("write")
+
+    with pytest.raises(Boom, match="write"):
+        run(make_reader(), consume)
+
+
+def test_writer_error_on_last_frame_reaches_caller():
+    def consume(item):
+        if item == FRAMES - 1:
+            time.sleep(0.2)
+            raise Boom("write")
+
+    with pytest.raises(Boom, match="write"):
+        run(make_reader(), consume)
+
+
+def test_errors_without_threads_reach_caller():
+    with pytest.raises(Boom, match="read"):
+        run(make_reader(fail_at=5), lambda item: None, queue_size=0)
+
+    def consume(item):
+        raise Boom("write")
+
+    with pytest.raises(Boom, match="write"):
+        run(make_reader(), consume, queue_size=0)
@@ -0,0 +1,65 @@
+import asyncio
+import hashlib
+
+import pytest
+from fastapi import HTTPException
+
+from ingest import IMAGE_FORMATS, VIDEO_FORMATS, read_upload, save_upload, sniff_format
+
+MP4_HEAD = b"\x00\x00\x00\x18ftypisom\x00\x00\x02\x00"
+PNG_HEAD = b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR"
+
+
+async def chunked(data: bytes, size: int):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+@pytest.mark.parametrize("head, expected", [
+    (MP4_HEAD, "mp4"),
+    (b"\x00\x00\x00\x08wide\x00\x00\x00\x00", "mp4"),
+    (b"\x1a\x45\xdf\xa3\x9f\x42\x86\x81\x01\x42\xf7\x81", "webm"),
+    (b"RIFF\x00\x00\x00\x00AVI ", "avi"),
+    (b"RIFF\x00\x00\x00\x00WEBP", "webp"),
+    (b"\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01", "jpeg"),
+    (PNG_HEAD, "png"),
+    (b"GIF89a\x00\x00\x00\x00\x00\x00", None),
+    (b"", None),
+])
+def test_sniff_format(head, expected):
+    assert sniff_format(head) == expected
+
+
+def test_save_upload_sniffs_across_chunks(tmp_path):
+    data = MP4_HEAD + bytes(range(256)) * 10
+    dest = tmp_path / "upload.mp4"
+    # 先頭の判定に必要なバイト数より小さいチャンクで届く
+    fmt, size, digest = asyncio.run(save_upload(chunked(data, 5), dest, len(data), VIDEO_FORMATS))
+
+    assert (fmt, size, digest) == ("mp4", len(data), hashlib.sha256(data).hexdigest())
+    assert dest.read_bytes() == data
+
+
+def test_save_upload_over_limit_removes_partial_file(tmp_path):
+    dest = tmp_path / "upload.mp4"
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(save_upload(chunked(MP4_HEAD + b"x" * 100, 16), dest, 64, VIDEO_FORMATS))
+    assert excinfo.value.status_code == 413
+    assert not dest.exists()
+
+
+def test_save_upload_rejects_wrong_format(tmp_path):
+    dest = tmp_path / "upload.mp4"
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(save_upload(chunked(PNG_HEAD + b"x" * 100, 16), dest, 1024, VIDEO_FORMATS))
+    assert excinfo.value.status_code == 415
+    assert not dest.exists()
+
+
+def test_read_upload_short_file():
+    # SNIFF_BYTES より短いファイルも最後に判定する
+    data = b"\xff\xd8\xff\xd9"
+    assert asyncio.run(read_upload(chunked(data, 2), 1024, IMAGE_FORMATS)) == ("jpeg", data)
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(read_upload(chunked(b"abc", 2), 1024, IMAGE_FORMATS))
+    assert excinfo.value.status_code == 415
@@ -0,0 +1,125 @@
+import asyncio
+import time
+from concurrent.futures import Future
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import jobs
+import main
+import segments
+from ffmpeg_pipe import probe_video
+from jobs import JobCancelled, JobManager
+
+
+def test_cancel_request_outlives_job_until_pruned(monkeypatch):
+    manager = JobManager(max_workers=1)
+    manager._cancel_requests = {"old": True, "recent": True}
+    manager._jobs = {
+        "old": {"finished_at": time.time() - jobs.JOB_RETENTION_SEC - 1},
+        "recent": {"finished_at": time.time()},
+    }
+
+    manager._prune()
+    # 終了済みでも保持期間内のジョブのキャンセル要求は、起動中のセグメントが確認できるよう残す
+    assert manager._cancel_requests == {"recent": True}
+    assert list(manager._jobs) == ["recent"]
+
+
+def test_segmented_job_runs_segments_on_job_workers(make_video, tmp_path, monkeypatch):
+    monkeypatch.setattr(segments, "MAX_SEGMENT_WORKERS", 2)
+    input_path = str(make_video(frames=240))
+    output_path = str(tmp_path / "out_output.mp4")
+    manager = JobManager(max_workers=2)
+    try:
+        manager.submit_video(
+            "job", input_path, output_path, segmented=True,
+            detector="haar", segments=2, reuse_detections=False
+        )
+        stats = manager._jobs["job"]["future"].result(timeout=300)
+        assert stats["segments"] == 2
+        # セグメントのために新しいプロセスを起動しない
+        assert len(manager._executor._processes) == 2
+        assert probe_video(output_path)["total_frames"] == 240
+    finally:
+        manager.shutdown()
+
+
+def register_job(manager: JobManager, job_id: str, tmp_path) -> Future:
+    """ワーカーを起動せずに、待機中のジョブを登録する"""
+    future = Future()
+    manager._jobs[job_id] = {
+        "job_id": job_id, "status": "queued", "created_at": time.time(), "finished_at": None,
+        "input_path": str(tmp_path / "in.mp4"), "output_path": str(tmp_path / "out.mp4"),
+        "output_format": "mp4", "cost_sec": 0.0, "stats": None, "error": None, "status_code": None,
+        "future": future, "on_done": None,
+    }
+    future.add_done_callback(lambda f: manager._on_done(job_id, f))
+    return future
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    manager = JobManager(max_workers=1)
+    monkeypatch.setattr(main, "job_manager", manager)
+    return manager
+
+
+def test_wait_for_job_cancelled_while_queued(manager, tmp_path):
+    register_job(manager, "job", tmp_path)
+
+    async def scenario():
+        waiter = asyncio.create_task(main.wait_video_job("job"))
+        await asyncio.sleep(0)
+        assert manager.cancel("job")
+        return await waiter
+
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(scenario())
+    assert excinfo.value.status_code == 409
+    assert "キャンセル" in excinfo.value.detail
+
+
+def test_wait_for_job_cancelled_while_running(manager, tmp_path):
+    future = register_job(manager, "job", tmp_path)
+    future.set_running_or_notify_cancel()
+    future.set_exception(JobCancelled())
+
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(main.wait_video_job("job"))
+    assert excinfo.value.status_code == 409
+
+
+def test_aborted_request_is_not_turned_into_409(manager, tmp_path):
+    register_job(manager, "job", tmp_path)
+
+    async def scenario():
+        waiter = asyncio.create_task(main.wait_video_job("job"))
+        await asyncio.sleep(0)
+        # クライアントの切断などでリクエストの処理自体が中断された
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        # ジョブは取り消さない
+        await asyncio.sleep(0)
+        assert manager.get("job")["status"] == "queued"
+
+    asyncio.run(scenario())
+
+
+def test_video_endpoint_returns_409_for_cancelled_job(manager, tmp_path, monkeypatch):
+    future = register_job(manager, "job", tmp_path)
+
+    async def submit(chunks, options):
+        future.set_running_or_notify_cancel()
+        future.set_exception(JobCancelled())
+        return "job", False
+
+    monkeypatch.setattr(main, "submit_video_upload", submit)
+    # 起動時の準備（lifespan）は不要なため with を使わない
+    response = TestClient(main.app).post(
+        "/api/mosaic/video", files={"file": ("in.mp4", b"data", "video/mp4")}
+    )
+    assert response.status_code == 409
+    assert response.json()["detail"] == "ジョブは処理中にキャンセルされました"
@@ -0,0 +1,49 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+import main
+
+
+class FakeJobManager:
+    def __init__(self):
+        self.stopped = False
+
+    def shutdown(self):
+        self.stopped = True
+
+
+def test_lifespan_starts_and_stops_background_tasks(monkeypatch):
+    started = []
+    job_manager = FakeJobManager()
+
+    async def evict():
+        started.append("evict")
+        await asyncio.Event().wait()
+
+    async def warm_up():
+        started.append("warm_up")
+        main.startup_state["ready"] = True
+
+    monkeypatch.setattr(main, "evict_cache_periodically", evict)
+    monkeypatch.setattr(main, "warm_up", warm_up)
+    monkeypatch.setattr(main, "job_manager", job_manager)
+    monkeypatch.setitem(main.startup_state, "ready", False)
+    monkeypatch.setitem(main.startup_state, "timings", {})
+
+    with TestClient(main.app) as client:
+        assert client.get("/ready").status_code == 200
+        assert started == ["evict", "warm_up"]
+        assert "serving_sec" in main.startup_state["timings"]
+        evictor = main.evictor_task
+        assert not evictor.done()
+
+    # 終了時にバックグラウンドの処理とワーカーを止める
+    assert evictor.cancelled()
+    assert job_manager.stopped
+
+
+def test_no_deprecated_event_handlers():
+    # on_event は非推奨のため、起動・終了の処理は lifespan にまとめる
+    assert not main.app.router.on_startup
+    assert not main.app.router.on_shutdown
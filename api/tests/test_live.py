@@ -0,0 +1,50 @@
+import cv2
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import main
+
+LIVE_URL = "/api/mosaic/live?detector=haar"
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setitem(main.startup_state, "ready", True)
+    monkeypatch.setattr(main, "live_sessions", 0)
+    # 起動時の準備（lifespan）は不要なため with を使わない
+    return TestClient(main.app)
+
+
+def frame_bytes() -> bytes:
+    ok, encoded = cv2.imencode(".jpg", np.full((120, 160, 3), 128, np.uint8))
+    assert ok
+    return encoded.tobytes()
+
+
+def test_live_rejects_before_ready(client, monkeypatch):
+    monkeypatch.setitem(main.startup_state, "ready", False)
+    with client.websocket_connect(LIVE_URL) as websocket:
+        with pytest.raises(WebSocketDisconnect) as excinfo:
+            websocket.receive_json()
+    assert excinfo.value.code == main.LIVE_TRY_AGAIN_CODE
+
+
+def test_live_rejects_over_session_limit(client, monkeypatch):
+    monkeypatch.setattr(main, "MAX_LIVE_SESSIONS", 1)
+    with client.websocket_connect(LIVE_URL) as first:
+        first.send_bytes(frame_bytes())
+        assert first.receive_json()["seq"] == 1
+        assert first.receive_bytes()
+
+        with client.websocket_connect(LIVE_URL) as second:
+            with pytest.raises(WebSocketDisconnect) as excinfo:
+                second.receive_json()
+        assert excinfo.value.code == main.LIVE_TRY_AGAIN_CODE
+        assert main.live_sessions == 1
+
+    # 切断したセッションは数えない
+    with client.websocket_connect(LIVE_URL) as third:
+        third.send_bytes(frame_bytes())
+        assert third.receive_json()["faces"] == 0
@@ -0,0 +1,103 @@
+import random
+import struct
+import subprocess
+import sys
+
+import pytest
+
+import debug_rotation
+import media_probe
+from media_probe import UnsupportedMedia, parse_mp4, probe_ffprobe, probe_media
+
+FIELDS = ("width", "height", "rotation", "frame_rate", "total_frames", "codec", "pix_fmt", "audio_codec", "keyframes")
+
+
+@pytest.fixture
+def h264_video(tmp_path):
+    """H.264 + AAC、moov が先頭（faststart）、回転メタデータ付きの MP4"""
+
+    def make(rotation: int = 0) -> bytes:
+        base = tmp_path / "base.mp4"
+        path = tmp_path / f"rot{rotation}.mp4"
+        subprocess.run([
+            'ffmpeg', '-y', '-v', 'error',
+            '-f', 'lavfi', '-i', 'testsrc=size=160x120:rate=30',
+            '-f', 'lavfi', '-i', 'sine=duration=2',
+            '-t', '2', '-c:v', 'libx264', '-g', '15', '-c:a', 'aac', str(base)
+        ], check=True)
+        subprocess.run([
+            'ffmpeg', '-y', '-v', 'error', '-display_rotation', str(rotation), '-i', str(base),
+            '-c', 'copy', '-movflags', '+faststart', str(path)
+        ], check=True)
+        return path
+
+    return make
+
+
+def moov_range(data: bytes) -> tuple:
+    pos = 0
+    while pos < len(data):
+        size, kind = struct.unpack_from(">I4s", data, pos)
+        if kind == b"moov":
+            return pos, size
+        pos += size
+    raise AssertionError("moov がありません")
+
+
+@pytest.mark.parametrize("rotation", [0, 90, 270])
+def test_parse_mp4_matches_ffprobe(h264_video, rotation):
+    path = str(h264_video(rotation))
+    parsed = parse_mp4(path)
+    expected = probe_ffprobe(path, keyframes=True)
+
+    assert {key: parsed[key] for key in FIELDS} == {key: expected[key] for key in FIELDS}
+    assert parsed["source"] == "mp4"
+
+
+def test_corrupt_moov_raises_unsupported_only(h264_video, tmp_path):
+    data = h264_video().read_bytes()
+    start, size = moov_range(data)
+    rng = random.Random(0)
+    path = tmp_path / "corrupt.mp4"
+    for i in range(300):
+        corrupt = bytearray(data)
+        if i % 4 == 0:
+            corrupt = corrupt[:start + rng.randrange(8, size)]
+        else:
+            for _ in range(rng.randint(1, 8)):
+                corrupt[start + rng.randrange(8, size)] = rng.randrange(256)
+        path.write_bytes(corrupt)
+        try:
+            parse_mp4(str(path))
+        except UnsupportedMedia:
+            pass
+
+
+def corrupt_sample_count(path) -> None:
+    """stsz のサンプル数を壊す（表がボックスに収まらない値にする）"""
+    data = bytearray(path.read_bytes())
+    offset = data.index(b"stsz") + 4
+    struct.pack_into(">I", data, offset + 8, 0xFFFFFFF0)
+    path.write_bytes(data)
+
+
+def test_probe_media_falls_back_on_corrupt_moov(h264_video, monkeypatch):
+    path = h264_video()
+    corrupt_sample_count(path)
+    monkeypatch.setattr(media_probe, "probe_ffprobe", lambda p, keyframes=False: {"source": "ffprobe", "keyframes": None})
+
+    assert probe_media(str(path))["source"] == "ffprobe"
+
+
+def test_debug_rotation_falls_back_on_corrupt_moov(h264_video, monkeypatch, capsys):
+    path = h264_video(90)
+    info = probe_ffprobe(str(path), keyframes=True)
+    corrupt_sample_count(path)
+    monkeypatch.setattr(debug_rotation, "probe_ffprobe", lambda p, keyframes=False: info)
+    monkeypatch.setattr(sys, "argv", ["debug_rotation.py", str(path)])
+
+    debug_rotation.main()
+
+    out = capsys.readouterr().out
+    assert "対応していません" in out
+    assert "回転メタデータ: 90度" in out
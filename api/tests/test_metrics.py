@@ -0,0 +1,99 @@
+import pickle
+import time
+
+from fastapi.testclient import TestClient
+
+import main
+from metrics import Histogram, MetricsRegistry, StageMetrics
+
+
+def test_histogram_buckets_are_cumulative_only_when_rendered():
+    histogram = Histogram((1.0, 2.0))
+    for value in (0.5, 1.0, 1.5, 3.0):
+        histogram.observe(value)
+
+    # 境界ちょうどの値はそのバケットに入る（Prometheus の le）
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.sum == 6.0
+    assert histogram.count == 4
+
+
+def test_stage_metrics_breakdown():
+    metrics = StageMetrics()
+    metrics.observe("detect", 0.002)
+    metrics.observe("detect", 0.004)
+    metrics.observe("write", 0.001)
+
+    assert metrics.breakdown() == {
+        "detect": {"count": 2, "total_ms": 6.0, "mean_ms": 3.0},
+        "write": {"count": 1, "total_ms": 1.0, "mean_ms": 1.0},
+    }
+
+
+def test_stage_metrics_since_records_elapsed_time():
+    metrics = StageMetrics()
+    start = time.perf_counter()
+    now = metrics.since("decode", start)
+
+    assert now >= start
+    assert metrics.stages["decode"].count == 1
+    assert metrics.stages["decode"].sum == now - start
+
+
+def test_stage_metrics_merge_across_processes():
+    segment = StageMetrics()
+    segment.observe("detect", 0.01)
+    segment.observe_faces(2)
+    merged = StageMetrics()
+    merged.observe("detect", 0.03)
+
+    # セグメントのワーカーからは state() を pickle して受け取る
+    merged.merge(pickle.loads(pickle.dumps(segment.state())))
+    assert merged.breakdown()["detect"] == {"count": 2, "total_ms": 40.0, "mean_ms": 20.0}
+    assert merged.faces.count == 1
+
+
+def test_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    registry.describe("mosaic_jobs_total", "Finished video jobs by status")
+    registry.inc("mosaic_jobs_total", status="completed")
+    registry.inc("mosaic_jobs_total", 2, status="failed")
+    registry.observe("queue_wait", 0.3)
+    worker = StageMetrics()
+    worker.observe("detect", 0.004)
+    worker.observe_faces(1)
+    registry.merge(worker.state())
+    registry.merge(None)
+
+    lines = registry.render({"mosaic_live_sessions": ("Open live mode sessions", 3)}).splitlines()
+    assert "# TYPE mosaic_stage_seconds histogram" in lines
+    assert 'mosaic_stage_seconds_bucket{le="0.0025",stage="detect"} 0' in lines
+    assert 'mosaic_stage_seconds_bucket{le="0.005",stage="detect"} 1' in lines
+    assert 'mosaic_stage_seconds_bucket{le="+Inf",stage="detect"} 1' in lines
+    assert 'mosaic_stage_seconds_sum{stage="detect"} 0.004' in lines
+    assert 'mosaic_stage_seconds_count{stage="queue_wait"} 1' in lines
+    assert 'mosaic_faces_per_frame_bucket{le="1"} 1' in lines
+    assert "# HELP mosaic_jobs_total Finished video jobs by status" in lines
+    assert "# TYPE mosaic_jobs_total counter" in lines
+    assert 'mosaic_jobs_total{status="completed"} 1' in lines
+    assert 'mosaic_jobs_total{status="failed"} 2' in lines
+    assert "# TYPE mosaic_live_sessions gauge" in lines
+    assert "mosaic_live_sessions 3" in lines
+
+
+def test_metrics_endpoint(monkeypatch):
+    registry = MetricsRegistry()
+    registry.inc("mosaic_requests_total", endpoint="image", cached="false")
+    registry.observe("decode", 0.01)
+    monkeypatch.setattr(main, "REGISTRY", registry)
+    monkeypatch.setattr(main, "live_sessions", 1)
+
+    # 起動時の準備（lifespan）は不要なため with を使わない
+    response = TestClient(main.app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = response.text.splitlines()
+    assert 'mosaic_requests_total{cached="false",endpoint="image"} 1' in lines
+    assert 'mosaic_stage_seconds_count{stage="decode"} 1' in lines
+    assert "# TYPE mosaic_cache_entries gauge" in lines
+    assert "mosaic_live_sessions 1" in lines
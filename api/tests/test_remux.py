@@ -0,0 +1,46 @@
+import numpy as np
+
+from remux import plan_remux, remux_unsupported_reason
+
+KEYFRAMES = [0, 30, 60, 90]
+
+
+def test_plan_remux_without_faces_copies_everything():
+    assert plan_remux(KEYFRAMES, 120, np.array([], dtype=np.int64), 15) == [(0, 120, False)]
+
+
+def test_plan_remux_encodes_gops_with_faces_and_merges_neighbours():
+    # 45 番目の顔の前後 14 フレーム（31〜59）は GOP 30〜60 に収まる
+    assert plan_remux(KEYFRAMES, 120, np.array([45]), 14) == [
+        (0, 30, False), (30, 60, True), (60, 120, False)
+    ]
+    # 前後の範囲が隣の GOP にかかる場合はまとめて再エンコード
+    assert plan_remux(KEYFRAMES, 120, np.array([58, 58, 59]), 5) == [
+        (0, 30, False), (30, 90, True), (90, 120, False)
+    ]
+
+
+def test_plan_remux_margin_is_clipped_to_video():
+    assert plan_remux(KEYFRAMES, 120, np.array([0, 119]), 20) == [
+        (0, 30, True), (30, 90, False), (90, 120, True)
+    ]
+    assert plan_remux(KEYFRAMES, 120, np.array([60]), 500) == [(0, 120, True)]
+
+
+def layout(**overrides):
+    return {
+        "codec": "h264", "pix_fmt": "yuv420p", "total_frames": 4, "keyframes": [0, 2],
+        "pts": [0.0, 1 / 30, 2 / 30, 3 / 30], **overrides
+    }
+
+
+INFO = {"width": 160, "height": 120, "fps": 30.0, "total_frames": 4}
+
+
+def test_remux_unsupported_reason():
+    assert remux_unsupported_reason(INFO, layout(), 0) is None
+    assert remux_unsupported_reason(INFO, layout(codec="hevc"), 0) is not None
+    assert remux_unsupported_reason(INFO, layout(), 90) == "回転メタデータ付きの動画です"
+    assert remux_unsupported_reason({**INFO, "width": 161}, layout(), 0) == "幅・高さが奇数です"
+    assert remux_unsupported_reason(INFO, layout(keyframes=[1]), 0) == "先頭がキーフレームではありません"
+    assert remux_unsupported_reason(INFO, layout(pts=[0.0, 0.1, 0.2, 0.3]), 0) == "可変フレームレートの動画です"
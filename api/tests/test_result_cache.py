@@ -0,0 +1,73 @@
+import os
+import time
+
+from result_cache import ResultCache
+
+IMAGE_AND_VIDEO = (".mp4", ".png", ".jpg", ".webp")
+
+
+def write(path, size: int, age_sec: float = 0):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x" * size)
+    mtime = time.time() - age_sec
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_evicts_jpg_and_webp_over_size_budget(tmp_path):
+    cache = ResultCache(tmp_path, max_bytes=250, max_age_sec=3600, output_extensions=IMAGE_AND_VIDEO)
+    oldest = write(tmp_path / "a_output.jpg", 100, age_sec=30)
+    older = write(tmp_path / "b_output.webp", 100, age_sec=20)
+    newest = write(tmp_path / "c_output.png", 100, age_sec=10)
+
+    assert cache.evict() == 1
+    assert not oldest.exists()
+    assert older.exists() and newest.exists()
+
+
+def test_evicts_expired_outputs_of_every_format(tmp_path):
+    cache = ResultCache(tmp_path, max_bytes=10 ** 9, max_age_sec=60, output_extensions=IMAGE_AND_VIDEO)
+    expired = [write(tmp_path / f"old_output{ext}", 10, age_sec=120) for ext in IMAGE_AND_VIDEO]
+    fresh = write(tmp_path / "new_output.jpg", 10)
+
+    cache.evict()
+    assert not any(path.exists() for path in expired)
+    assert fresh.exists()
+
+
+def test_keeps_segment_parts_and_pending_outputs(tmp_path):
+    cache = ResultCache(tmp_path, max_bytes=0, max_age_sec=3600, output_extensions=IMAGE_AND_VIDEO)
+    part = write(tmp_path / "a_output.part000.mp4", 10)
+    busy = write(tmp_path / "b_output.mp4", 10)
+    cache.begin("key", "b")
+
+    cache.evict()
+    assert part.exists()
+    assert busy.exists()
+
+
+def test_eviction_forgets_cache_entry(tmp_path):
+    cache = ResultCache(tmp_path, max_bytes=0, max_age_sec=3600, output_extensions=IMAGE_AND_VIDEO)
+    path = write(tmp_path / "a_output.webp", 10)
+    cache.put("key", "a", path, {})
+
+    cache.evict()
+    assert cache.get("key") is None
+
+
+def test_get_refreshes_lru_order(tmp_path):
+    cache = ResultCache(tmp_path, max_bytes=150, max_age_sec=3600, output_extensions=IMAGE_AND_VIDEO)
+    first = write(tmp_path / "a_output.jpg", 100, age_sec=30)
+    second = write(tmp_path / "b_output.jpg", 100, age_sec=20)
+    cache.put("a", "a", first, {})
+    cache.put("b", "b", second, {})
+
+    # 古い方を使うと、もう一方が先に削除される
+    assert cache.get("a")["file_id"] == "a"
+    cache.evict()
+    assert first.exists()
+    assert not second.exists()
+
+
+def test_make_key_ignores_param_order():
+    assert ResultCache.make_key("h", "image", a=1, b=2) == ResultCache.make_key("h", "image", b=2, a=1)
@@ -0,0 +1,137 @@
+import importlib
+import multiprocessing
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pytest
+
+import admission
+import jobs
+import segments
+from ffmpeg_pipe import probe_video
+from jobs import CancelFlag, JobCancelled
+
+FRAME_OPTIONS = {"mosaic_ratio": 0.05, "padding": 0.3}
+VF_FILTER = "pad=ceil(iw/2)*2:ceil(ih/2)*2"
+
+
+def test_plan_segments_covers_all_frames_with_overlap():
+    plan = segments.plan_segments(300, 3, overlap=15)
+
+    assert [(start, end) for _, start, end in plan] == [(0, 100), (100, 200), (200, 300)]
+    assert [read_start for read_start, _, _ in plan] == [0, 85, 185]
+
+
+def test_plan_segments_does_not_split_short_videos():
+    assert len(segments.plan_segments(segments.MIN_SEGMENT_FRAMES * 2 - 1, 8)) == 1
+
+
+def test_default_cap_allows_one_segment_per_worker(monkeypatch):
+    monkeypatch.delenv("MOSAIC_MAX_SEGMENT_WORKERS", raising=False)
+    try:
+        importlib.reload(segments)
+        # セグメントはジョブのワーカーで処理するため、既定ではワーカー数まで分割できる
+        assert segments.MAX_SEGMENT_WORKERS == jobs.MAX_WORKERS
+    finally:
+        importlib.reload(segments)
+
+
+def test_effective_segments_is_capped(monkeypatch):
+    monkeypatch.setattr(segments, "MAX_SEGMENT_WORKERS", 2)
+    assert segments.effective_segments(10_000, 8) == 2
+    assert segments.effective_segments(10_000, 1) == 1
+
+
+def test_cost_accounts_for_segments(make_video, monkeypatch):
+    monkeypatch.setattr(segments, "MAX_SEGMENT_WORKERS", 2)
+    path = str(make_video(frames=240))
+    single = admission.estimate_video_cost(path)
+    split = admission.estimate_video_cost(path, segments=4)
+
+    # 2分割（上限）でも合計の処理量は同じで、2つ目のセグメントのウォームアップ分だけ多い
+    overlap = segments.SEGMENT_OVERLAP_FRAMES / 240
+    assert split == pytest.approx(single * (1 + overlap))
+
+
+def test_cancel_flag_is_picklable_and_throttled():
+    requests = {}
+    flag = CancelFlag(requests, "job")
+    flag.check()
+    flag.set()
+    # 前回の確認から CANCEL_POLL_INTERVAL_SEC が経っていないため、まだ送出しない
+    flag.check()
+    flag._checked_at = 0.0
+    with pytest.raises(JobCancelled):
+        flag.check()
+    assert pickle.loads(pickle.dumps(flag)).is_set()
+
+
+def test_cancelled_segments_stop_and_clean_up(make_video, tmp_path, monkeypatch):
+    monkeypatch.setattr(segments, "MAX_SEGMENT_WORKERS", 2)
+    input_path = str(make_video(frames=240))
+    output_path = str(tmp_path / "out_output.mp4")
+    manager = multiprocessing.get_context("spawn").Manager()
+    try:
+        flag = CancelFlag(manager.dict(), "job")
+        flag.set()
+        start = time.monotonic()
+        with pytest.raises(JobCancelled):
+            segments.process_video_segments(
+                input_path, output_path, probe_video(input_path), VF_FILTER, 2, FRAME_OPTIONS,
+                detector="haar", cancel_flag=flag
+            )
+        assert time.monotonic() - start < 120
+    finally:
+        manager.shutdown()
+    assert not list(Path(tmp_path).glob("out_output.part*"))
+    assert not Path(output_path).exists()
+
+
+def test_segmented_processing_completes(make_video, tmp_path, monkeypatch):
+    monkeypatch.setattr(segments, "MAX_SEGMENT_WORKERS", 2)
+    input_path = str(make_video(frames=240))
+    output_path = str(tmp_path / "out_output.mp4")
+
+    stats = segments.process_video_segments(
+        input_path, output_path, probe_video(input_path), VF_FILTER, 4, FRAME_OPTIONS, detector="haar"
+    )
+    assert stats["segments"] == 2
+    assert stats["processed_frames"] == 240
+    assert probe_video(output_path)["total_frames"] == 240
+
+
+def test_clamped_segments_are_logged(make_video, tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(segments, "MAX_SEGMENT_WORKERS", 1)
+    input_path = str(make_video(frames=240))
+    output_path = str(tmp_path / "out_output.mp4")
+
+    stats = segments.process_video_segments(
+        input_path, output_path, probe_video(input_path), VF_FILTER, 4, FRAME_OPTIONS, detector="haar"
+    )
+    assert stats["segments"] == 1
+    assert "Segments limited: 4 -> 1" in capsys.readouterr().out
+
+
+def test_segments_reuse_the_given_executor(make_video, tmp_path, monkeypatch):
+    monkeypatch.setattr(segments, "MAX_SEGMENT_WORKERS", 2)
+    input_path = str(make_video(frames=240))
+    info = probe_video(input_path)
+    executor = ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        workers = None
+        for i in range(2):
+            output_path = str(tmp_path / f"out{i}_output.mp4")
+            stats = segments.process_video_segments(
+                input_path, output_path, info, VF_FILTER, 2, FRAME_OPTIONS, detector="haar", executor=executor
+            )
+            assert stats["segments"] == 2
+            assert probe_video(output_path)["total_frames"] == 240
+            # 2回目も同じワーカープロセスで処理し、プールは閉じない
+            if workers is None:
+                workers = set(executor._processes)
+            assert set(executor._processes) == workers
+        assert executor.submit(sum, [1, 2]).result() == 3
+    finally:
+        executor.shutdown()
@@ -0,0 +1,59 @@
+import numpy as np
+
+from sidecar import SIDECAR_VERSION, DetectionRecorder, DetectionReplay, load_replay, sidecar_key
+
+
+def make_recorder():
+    recorder = DetectionRecorder()
+    # セグメントの結果のように順不同で届く
+    recorder.add(5, [(50, 60, 20, 20)])
+    recorder.add(0, [(10, 20, 30, 40), (100, 100, 8, 8)])
+    recorder.add(3, [])
+    return recorder
+
+
+def test_sidecar_round_trip(tmp_path):
+    path = tmp_path / "detections" / "clip.npz"
+    make_recorder().save(path, frame_count=6)
+
+    replay = load_replay(path)
+    assert replay.frame_count == 6
+    assert replay.boxes_for(0) == [(10, 20, 30, 40), (100, 100, 8, 8)]
+    assert replay.boxes_for(3) == []
+    assert replay.boxes_for(5) == [(50, 60, 20, 20)]
+    # 一時ファイルは残らない
+    assert [p.name for p in path.parent.iterdir()] == ["clip.npz"]
+
+
+def test_replay_from_recorder_matches_saved(tmp_path):
+    path = tmp_path / "clip.npz"
+    recorder = make_recorder()
+    recorder.save(path, frame_count=6)
+
+    saved = DetectionReplay(path)
+    direct = DetectionReplay.from_recorder(recorder, frame_count=6)
+    assert direct.path is None
+    assert all(saved.boxes_for(i) == direct.boxes_for(i) for i in range(6))
+
+
+def test_extend_merges_segment_arrays():
+    merged = DetectionRecorder()
+    merged.extend(*make_recorder().arrays())
+    frames, boxes = merged.arrays()
+    assert frames.tolist() == [5, 0, 0]
+    assert boxes.shape == (3, 4)
+    assert DetectionRecorder().arrays()[1].shape == (0, 4)
+
+
+def test_load_replay_missing_or_corrupt(tmp_path):
+    assert load_replay(tmp_path / "missing.npz") is None
+    corrupt = tmp_path / "corrupt.npz"
+    corrupt.write_bytes(b"not an npz")
+    assert load_replay(corrupt) is None
+
+
+def test_sidecar_key_is_order_independent():
+    key = sidecar_key("abc", detect_stride=2, detect_size=640)
+    assert key == sidecar_key("abc", detect_size=640, detect_stride=2)
+    assert key.startswith(f"abc_v{SIDECAR_VERSION}_")
+    assert key != sidecar_key("abc", detect_stride=1, detect_size=640)
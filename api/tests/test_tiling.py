@@ -0,0 +1,77 @@
+import threading
+
+from tiling import MIN_TILE_SIZE, DetectorPool, merge_overlaps, overlap_ratio, plan_tiles
+
+
+def test_plan_tiles_covers_frame_with_overlap():
+    tiles = plan_tiles(1920, 1080, 640, 0.25)
+
+    assert tiles[0][:2] == (0, 0)
+    assert tiles[-1][2:] == (1920, 1080)
+    for x1, y1, x2, y2 in tiles:
+        assert x2 - x1 == 640 and y2 - y1 == 640
+    # 隣り合うタイルは重なる
+    xs = sorted({x1 for x1, _, _, _ in tiles})
+    assert all(b - a <= 640 * 0.75 for a, b in zip(xs, xs[1:]))
+
+
+def test_plan_tiles_small_frame_and_minimum_size():
+    assert plan_tiles(320, 240, 640, 0.2) == [(0, 0, 320, 240)]
+    tiles = plan_tiles(1000, 200, 10, 0.0)
+    assert all(x2 - x1 == MIN_TILE_SIZE for x1, _, x2, _ in tiles)
+
+
+def test_overlap_ratio_uses_smaller_area():
+    big = (0, 0, 100, 100, 0.9)
+    # タイルの境界で切れた顔の一部（大きい方の中に収まる）
+    part = (50, 0, 50, 100, 0.8)
+    assert overlap_ratio(big, part) == 1.0
+    assert overlap_ratio(big, (200, 200, 10, 10, 0.5)) == 0.0
+
+
+def test_merge_overlaps_unions_overlapping_boxes():
+    detections = [
+        (0, 0, 100, 100, 0.6),
+        (10, 10, 100, 100, 0.9),
+        (300, 300, 50, 50, 0.7),
+    ]
+    assert merge_overlaps(detections) == [(0, 0, 110, 110, 0.9), (300, 300, 50, 50, 0.7)]
+    assert merge_overlaps([]) == []
+
+
+def test_partial_box_with_higher_score_keeps_full_face_covered():
+    # タイルの境界で切れた顔: タイル側の一部だけのボックスの方がスコアが高い
+    full = (100, 100, 200, 200, 0.6)
+    partial = (200, 120, 100, 150, 0.95)
+    kept = merge_overlaps([full, partial])
+
+    assert len(kept) == 1
+    x, y, w, h, score = kept[0]
+    assert x <= full[0] and y <= full[1]
+    assert x + w >= full[0] + full[2] and y + h >= full[1] + full[3]
+    assert score == 0.95
+
+
+def test_merge_overlaps_merges_chains():
+    # 1つ目と2つ目は直接は重ならないが、3つ目とまとめたボックスを介して同じ顔になる
+    detections = [(0, 0, 40, 40, 0.9), (60, 0, 40, 40, 0.8), (20, 0, 60, 40, 0.5)]
+    assert merge_overlaps(detections) == [(0, 0, 100, 40, 0.9)]
+
+
+def test_detector_pool_lends_each_detector_to_one_thread():
+    lock = threading.Lock()
+    in_use = set()
+
+    def detect(detector, item):
+        with lock:
+            assert detector not in in_use
+            in_use.add(detector)
+        try:
+            return item * 2
+        finally:
+            with lock:
+                in_use.discard(detector)
+
+    counter = iter(range(100))
+    pool = DetectorPool(lambda: next(counter), size=3)
+    assert pool.map(detect, list(range(20))) == [i * 2 for i in range(20)]
@@ -0,0 +1,244 @@
+import cv2
+import numpy as np
+import pytest
+
+import tracking
+from tracking import FaceTracker, MotionGate, RegionDetector, expand_region, merge_regions
+
+HEIGHT, WIDTH = 240, 320
+
+
+def noise_frame(seed: int = 0, low: int = 60, high: int = 190) -> np.ndarray:
+    """明るさを変えても白飛び・黒つぶれしない範囲のノイズ画像"""
+    gray = np.random.default_rng(seed).integers(low, high, (HEIGHT, WIDTH), dtype=np.uint8)
+    return np.repeat(gray[:, :, None], 3, axis=2)
+
+
+def brighten(frame: np.ndarray, amount: int) -> np.ndarray:
+    return (frame.astype(np.int16) + amount).clip(0, 255).astype(np.uint8)
+
+
+class CountingDetector:
+    """呼ばれた回数と渡された画像のサイズを記録し、決まった顔を返す"""
+
+    def __init__(self, boxes=None):
+        self.boxes = boxes or []
+        self.shapes = []
+
+    def __call__(self, image: np.ndarray) -> list:
+        self.shapes.append(image.shape[:2])
+        return list(self.boxes)
+
+
+def face_frame(x: int, y: int, size: int = 24, background: int = 0) -> np.ndarray:
+    """無地の背景に白い正方形（顔の代わり）を置いた画像"""
+    frame = np.full((HEIGHT, WIDTH, 3), background, np.uint8)
+    frame[y:y + size, x:x + size] = 255
+    return frame
+
+
+class SquareDetector(CountingDetector):
+    """白い正方形を探す検出器（切り出した画像では切り出しの中の座標を返す）"""
+
+    def __call__(self, image: np.ndarray) -> list:
+        self.shapes.append(image.shape[:2])
+        points = cv2.findNonZero((image[:, :, 0] == 255).astype(np.uint8))
+        return [] if points is None else [cv2.boundingRect(points)]
+
+
+def test_motion_gate_needs_reference():
+    assert not MotionGate(10).is_static(noise_frame(), [])
+
+
+@pytest.mark.parametrize("boxes", [[], [(100, 80, 40, 40)]])
+def test_motion_gate_static_below_threshold(boxes):
+    gate = MotionGate(10)
+    frame = noise_frame()
+    gate.set_reference(frame)
+
+    assert gate.is_static(frame, boxes)
+    assert gate.is_static(brighten(frame, 5), boxes)
+    assert not gate.is_static(brighten(frame, 15), boxes)
+
+
+def test_motion_gate_scene_cut_overrides_threshold():
+    # しきい値がどれだけ大きくても、画面全体が SCENE_CUT_THRESHOLD 以上変われば検出する
+    gate = MotionGate(255)
+    frame = noise_frame()
+    gate.set_reference(frame)
+
+    below = int(tracking.SCENE_CUT_THRESHOLD) - 2
+    assert gate.is_static(brighten(frame, below), [])
+    assert not gate.is_static(brighten(frame, int(tracking.SCENE_CUT_THRESHOLD) + 2), [])
+    # 別のシーン（同じ明るさの別のノイズ）
+    assert not gate.is_static(noise_frame(seed=1, low=0, high=255), [])
+
+
+def test_motion_gate_sees_small_changes_without_faces():
+    gate = MotionGate(10)
+    frame = noise_frame()
+    gate.set_reference(frame)
+
+    # 画面の1区画だけに顔が入ってきた（画面全体の平均差分はしきい値より小さい）
+    changed = frame.copy()
+    changed[:HEIGHT // 8, :WIDTH // 8] = 255
+    assert not gate.is_static(changed, [])
+
+
+def test_motion_gate_only_watches_around_faces():
+    gate = MotionGate(10)
+    frame = noise_frame()
+    gate.set_reference(frame)
+
+    changed = frame.copy()
+    changed[:40, :40] = 255
+    # 顔から離れた場所の変化は無視し、顔の周囲の変化では再検出する
+    assert gate.is_static(changed, [(200, 150, 40, 40)])
+    assert not gate.is_static(changed, [(20, 20, 30, 30)])
+
+
+def test_motion_gate_frame_size_change_is_not_static():
+    gate = MotionGate(10)
+    gate.set_reference(noise_frame())
+    assert not gate.is_static(noise_frame()[:, :WIDTH // 2], [])
+
+
+def test_static_frames_reuse_detections_up_to_cap():
+    detect = CountingDetector([(100, 80, 40, 40)])
+    tracker = FaceTracker(detect_stride=1, motion_threshold=5)
+    frame = noise_frame()
+    frames = 100
+
+    for _ in range(frames):
+        assert tracker.update(frame, detect) == [(100, 80, 40, 40)]
+
+    # 変化が無くても MOTION_MAX_REUSE_FRAMES フレームごとに必ず検出する
+    expected_calls = -(-frames // (tracking.MOTION_MAX_REUSE_FRAMES + 1))
+    assert tracker.detector_calls == len(detect.shapes) == expected_calls
+    assert tracker.skipped_detections == frames - expected_calls
+
+
+def test_scene_cut_forces_detection():
+    detect = CountingDetector()
+    tracker = FaceTracker(detect_stride=1, motion_threshold=5)
+    tracker.update(noise_frame(), detect)
+    tracker.update(noise_frame(), detect)
+    assert tracker.detector_calls == 1
+
+    tracker.update(noise_frame(seed=1, low=0, high=255), detect)
+    assert tracker.detector_calls == 2
+    assert tracker.skipped_detections == 1
+
+
+def test_expand_region_adds_margin_around_face():
+    # 上下左右に顔のサイズの ROI_EXPANSION 倍ずつ広げる
+    assert expand_region((100, 80, 80, 60), WIDTH, HEIGHT) == (20, 20, 260, 200)
+
+
+def test_expand_region_has_minimum_size():
+    x1, y1, x2, y2 = expand_region((100, 100, 20, 20), WIDTH, HEIGHT)
+    assert (x2 - x1, y2 - y1) == (tracking.ROI_MIN_SIZE, tracking.ROI_MIN_SIZE)
+    assert (x1 + x2) / 2 == 110 and (y1 + y2) / 2 == 110
+
+
+def test_expand_region_is_clipped_to_frame():
+    assert expand_region((0, 0, 10, 10), WIDTH, HEIGHT) == (0, 0, 53, 53)
+    assert expand_region((WIDTH - 10, HEIGHT - 10, 10, 10), WIDTH, HEIGHT) == (267, 187, WIDTH, HEIGHT)
+
+
+def test_merge_regions_joins_overlapping_regions():
+    regions = [(0, 0, 50, 50), (40, 40, 100, 100), (90, 0, 120, 30), (200, 200, 220, 220)]
+    assert merge_regions(regions) == [(0, 0, 120, 100), (200, 200, 220, 220)]
+
+
+def test_region_detector_scans_around_previous_face():
+    regions = RegionDetector(full_scan_interval=3)
+    detect = SquareDetector()
+    boxes = []
+    for i in range(4):
+        boxes.append(regions.detect(face_frame(100 + i * 2, 80), detect))
+
+    # 画面全体 → ROI → ROI → 画面全体（full_scan_interval 回に1回）
+    x1, y1, x2, y2 = expand_region((100, 80, 24, 24), WIDTH, HEIGHT)
+    roi = (y2 - y1, x2 - x1)
+    assert roi == (tracking.ROI_MIN_SIZE, tracking.ROI_MIN_SIZE)
+    assert detect.shapes == [(HEIGHT, WIDTH), roi, roi, (HEIGHT, WIDTH)]
+    assert (regions.full_scans, regions.roi_scans) == (2, 2)
+    # ROI で検出した位置はフレーム全体の座標に戻す
+    assert boxes == [[(100 + i * 2, 80, 24, 24)] for i in range(4)]
+
+
+def test_region_detector_rescans_full_frame_when_face_is_lost():
+    regions = RegionDetector(full_scan_interval=10)
+    detect = SquareDetector()
+    regions.detect(face_frame(40, 40), detect)
+
+    # 顔が ROI の外に移った: ROI で見つからないため、同じフレームで画面全体を検出し直す
+    assert regions.detect(face_frame(260, 180), detect) == [(260, 180, 24, 24)]
+    assert detect.shapes[-1] == (HEIGHT, WIDTH)
+    assert (regions.full_scans, regions.roi_scans) == (2, 0)
+
+
+def test_region_detector_without_faces_scans_full_frame():
+    regions = RegionDetector(full_scan_interval=10)
+    detect = SquareDetector()
+    for _ in range(3):
+        assert regions.detect(face_frame(0, 0, size=0), detect) == []
+    assert detect.shapes == [(HEIGHT, WIDTH)] * 3
+
+
+def test_scene_cut_with_roi_detection_rescans_full_frame():
+    detect = SquareDetector()
+    tracker = FaceTracker(detect_stride=1, motion_threshold=5, full_scan_interval=10)
+    assert tracker.update(face_frame(40, 40), detect) == [(40, 40, 24, 24)]
+    assert tracker.update(face_frame(40, 40), detect) == [(40, 40, 24, 24)]
+    assert tracker.skipped_detections == 1
+
+    # シーンが切り替わり、顔も別の場所に移った
+    cut = face_frame(260, 180, background=128)
+    assert tracker.update(cut, detect) == [(260, 180, 24, 24)]
+    assert detect.shapes[-1] == (HEIGHT, WIDTH)
+    assert (tracker.regions.full_scans, tracker.regions.roi_scans) == (2, 0)
+
+
+def textured_face_frame(x: int, y: int, size: int = 64) -> np.ndarray:
+    """無地の背景に模様のある顔の代わりの領域を置いた画像（特徴点は顔の中だけに取れる）"""
+    texture = np.random.default_rng(7).integers(0, 256, (size // 4, size // 4), dtype=np.uint8)
+    texture = cv2.GaussianBlur(cv2.resize(texture, (size, size), interpolation=cv2.INTER_NEAREST), (5, 5), 0)
+    frame = np.full((HEIGHT, WIDTH, 3), 128, np.uint8)
+    frame[y:y + size, x:x + size] = texture[:, :, None]
+    return frame
+
+
+def test_tracker_follows_moving_face_between_detections():
+    stride = 5
+    detected_at = []
+    position = {}
+
+    def detect(image):
+        detected_at.append(position["frame"])
+        return [position["box"]]
+
+    tracker = FaceTracker(detect_stride=stride)
+    for i in range(16):
+        x, y = 40 + i * 4, 30 + i * 2
+        position.update(frame=i, box=(x, y, 64, 64))
+        (tx, ty, tw, th), = tracker.update(textured_face_frame(x, y), detect)
+        # 検出の間のフレームも、オプティカルフローで移動した顔の位置に追従する
+        assert abs(tx - x) <= 1 and abs(ty - y) <= 1
+        assert abs(tw - 64) <= 1 and abs(th - 64) <= 1
+
+    assert detected_at == [0, 5, 10, 15]
+    assert tracker.detector_calls == 4
+    assert tracker.tracked_frames == 12
+
+
+def test_tracker_redetects_when_tracking_fails():
+    detect = CountingDetector([(40, 30, 64, 64)])
+    tracker = FaceTracker(detect_stride=10)
+    tracker.update(textured_face_frame(40, 30), detect)
+
+    # 顔が消えて特徴点を追えない場合は、検出間隔を待たずに検出する
+    tracker.update(np.full((HEIGHT, WIDTH, 3), 128, np.uint8), detect)
+    assert tracker.detector_calls == 2
+    assert tracker.tracked_frames == 0
@@ -0,0 +1,81 @@
+import dataclasses
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+ENDPOINTS = ["/api/mosaic/video", "/api/mosaic/jobs/video", "/api/mosaic/jobs/video/stream"]
+
+
+@pytest.fixture
+def submitted(monkeypatch):
+    """submit_video_upload に渡されたパラメータを記録する（ジョブは投入しない）"""
+    calls = []
+
+    async def submit(chunks, options):
+        calls.append(options)
+        return "job", True
+
+    async def wait(job_id):
+        return {"processed_frames": 0}
+
+    monkeypatch.setattr(main, "submit_video_upload", submit)
+    monkeypatch.setattr(main, "wait_video_job", wait)
+    return calls
+
+
+def post(client: TestClient, endpoint: str, params: dict):
+    if endpoint.endswith("/stream"):
+        return client.post(endpoint, params=params, content=b"data")
+    return client.post(endpoint, params=params, files={"file": ("in.mp4", b"data", "video/mp4")})
+
+
+DEFAULTS = {
+    "mosaic_ratio": 0.05,
+    "padding": main.DEFAULT_PADDING,
+    "pipeline": "pipe",
+    "detector": main.DETECTOR_BACKEND,
+    "detect_stride": 1,
+    "detect_size": 0,
+    "motion_threshold": 0.0,
+    "roi_full_scan_interval": 0,
+    "tile_size": 0,
+    "tile_overlap": 0.2,
+    "segments": 1,
+    "reuse_detections": True,
+    "output_format": "mp4",
+    "smart_remux": False,
+}
+
+
+@pytest.mark.parametrize("endpoint", ENDPOINTS)
+def test_endpoints_share_video_options(endpoint, submitted):
+    # 起動時の準備（lifespan）は不要なため with を使わない
+    client = TestClient(main.app)
+
+    # 省略したパラメータは既定値（検出器はサーバーの設定）
+    assert post(client, endpoint, {}).status_code in (200, 202)
+    response = post(client, endpoint, {"segments": 4, "output_format": "fmp4", "detector": "haar"})
+    assert response.status_code in (200, 202)
+    assert submitted == [DEFAULTS, {**DEFAULTS, "segments": 4, "output_format": "fmp4", "detector": "haar"}]
+
+
+@pytest.mark.parametrize("endpoint", ENDPOINTS)
+@pytest.mark.parametrize("params", [{"segments": 0}, {"output_format": "avi"}, {"mosaic_ratio": 1.0}])
+def test_endpoints_validate_video_options(endpoint, params, submitted):
+    response = post(TestClient(main.app), endpoint, params)
+    assert response.status_code == 422
+    assert not submitted
+
+
+def test_openapi_lists_the_same_query_parameters():
+    schema = TestClient(main.app).get("/openapi.json").json()
+    names = [
+        {p["name"] for p in schema["paths"][endpoint]["post"]["parameters"] if p["in"] == "query"}
+        for endpoint in ENDPOINTS
+    ]
+    fields = {field.name for field in dataclasses.fields(main.VideoOptions)}
+    assert fields == set(DEFAULTS)
+    assert names[0] == fields | {"timings"}
+    assert names[1] == names[2] == fields
@@ -0,0 +1,131 @@
+"""
+タイル分割による顔検出
+大きなフレームを重なりのあるタイルに分けて検出し、重なった結果を外接矩形にまとめる。
+BlazeFace（short range）は近くの大きな顔向けのため、4K・広角のフレームをそのまま
+縮小して入力すると遠くの小さな顔を見逃す。タイルごとに元の解像度のまま検出することで拾えるようにする
+"""
+
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+# タイルの検出を並行に行う検出器の数（検出器はスレッドごとに1つずつ使う）
+TILE_WORKERS = int(os.environ.get("MOSAIC_TILE_WORKERS", min(4, os.cpu_count() or 1)))
+# 重なりの判定（小さい方の面積に対する重なりの割合）がこれ以上なら同じ顔とみなす
+# （タイルの境界で切れた顔の一部は IoU では小さくなるため、小さい方の面積で割る）
+MERGE_OVERLAP_THRESHOLD = 0.5
+# タイルの辺の下限（px）。極端に小さい指定でタイル数が膨れ上がらないようにする
+MIN_TILE_SIZE = 128
+
+
+def plan_tiles(width: int, height: int, tile_size: int, overlap: float) -> list:
+    """
+    フレームを重なりのあるタイルに分割
+
+    Args:
+        width, height: フレームサイズ
+        tile_size: タイルの辺（px。MIN_TILE_SIZE 未満は MIN_TILE_SIZE にする）
+        overlap: 隣り合うタイルの重なり（タイルの辺に対する割合、0〜0.5）
+
+    Returns:
+        (x1, y1, x2, y2) のリスト。端のタイルはフレームの端に揃える
+    """
+    tile_size = max(MIN_TILE_SIZE, tile_size)
+
+    def starts(length: int) -> list:
+        if length <= tile_size:
+            return [0]
+        step = max(1, int(tile_size * (1 - overlap)))
+        positions = list(range(0, length - tile_size, step))
+        positions.append(length - tile_size)
+        return positions
+
+    return [
+        (x, y, min(width, x + tile_size), min(height, y + tile_size))
+        for y in starts(height)
+        for x in starts(width)
+    ]
+
+
+def overlap_ratio(a: tuple, b: tuple) -> float:
+    """2つのボックス (x, y, w, h, ...) の重なりの面積の、小さい方の面積に対する割合"""
+    ix = min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0])
+    iy = min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1])
+    if ix <= 0 or iy <= 0:
+        return 0.0
+    return ix * iy / max(1, min(a[2] * a[3], b[2] * b[3]))
+
+
+def union_box(a: tuple, b: tuple) -> tuple:
+    """2つのボックス (x, y, w, h, score) を囲むボックス（スコアは高い方）"""
+    x1, y1 = min(a[0], b[0]), min(a[1], b[1])
+    x2, y2 = max(a[0] + a[2], b[0] + b[2]), max(a[1] + a[3], b[1] + b[3])
+    return (x1, y1, x2 - x1, y2 - y1, max(a[4], b[4]))
+
+
+def merge_overlaps(detections: list, threshold: float = MERGE_OVERLAP_THRESHOLD) -> list:
+    """
+    重なった検出結果を、両方を囲むボックスにまとめる
+
+    タイルの境界で切れた顔は、タイル側では顔の一部だけの小さなボックスになる。
+    スコアの高い方だけを残すと、それが一部だけのボックスだった場合に顔の残りにモザイクがかからないため、
+    重なったボックスは両方を囲むボックスにまとめる。
+
+    Args:
+        detections: (x, y, w, h, score) のリスト
+        threshold: 小さい方の面積に対する重なりの割合がこれ以上なら同じ顔としてまとめる
+
+    Returns:
+        まとめた (x, y, w, h, score) のリスト（スコアはまとめた中で最も高いもの。スコアの高い順）
+    """
+    kept = []
+    for det in sorted(detections, key=lambda d: d[4], reverse=True):
+        merged = det
+        # まとめて広がったボックスが別のボックスと重なる場合もまとめる
+        while True:
+            overlapping = [k for k in kept if overlap_ratio(merged, k) >= threshold]
+            if not overlapping:
+                break
+            for k in overlapping:
+                merged = union_box(merged, k)
+            kept = [k for k in kept if k not in overlapping]
+        kept.append(merged)
+    return sorted(kept, key=lambda d: d[4], reverse=True)
+
+
+class DetectorPool:
+    """
+    検出器を複数持ち、タイルの検出を並行に行う
+
+    MediaPipe の検出器はスレッドセーフではないため、検出器をキューで貸し出して
+    同時に1つのスレッドだけが使うようにする。推論中は GIL が解放されるため複数コアを使える。
+    """
+
+    def __init__(self, create_detector: Callable[[], Any], size: int = TILE_WORKERS):
+        """
+        Args:
+            create_detector: 検出器を作成する関数
+            size: 検出器の数（並行に検出するタイル数）
+        """
+        self.size = max(1, size)
+        self._detectors: queue.Queue = queue.Queue()
+        for _ in range(self.size):
+            self._detectors.put(create_detector())
+        self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="mosaic-tile")
+
+    def map(self, detect: Callable[[Any, Any], list], items: list) -> list:
+        """
+        items のそれぞれについて detect(検出器, item) を並行に実行
+
+        Returns:
+            items と同じ順の結果のリスト
+        """
+        def run(item):
+            detector = self._detectors.get()
+            try:
+                return detect(detector, item)
+            finally:
+                self._detectors.put(detector)
+
+        return list(self._executor.map(run, items))
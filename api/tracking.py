@@ -0,0 +1,372 @@
+"""
+顔のトラッキング
+Nフレームごとに顔検出を行い、その間のフレームはオプティカルフロー（Lucas-Kanade）で
+顔の位置を追従させる。差分ゲートを有効にすると、前回の検出から画像がほとんど変わっていない
+フレームでは検出を省略して前回の結果を使い回す。ROI 検出を有効にすると、前回の顔の周囲だけを
+切り出して検出し、一定間隔で画面全体を検出して新しい顔を拾う
+"""
+
+from typing import Callable, Optional
+
+import cv2
+import numpy as np
+
+# トラッキング用のグレースケール画像の長辺（これより大きいフレームは縮小して追従）
+TRACKING_MAX_SIDE = 640
+# 1つの顔あたりの特徴点の最大数
+MAX_CORNERS = 30
+# 前方・後方の追跡結果のずれ（px）がこれ以下の特徴点だけを信頼する
+MAX_FB_ERROR = 1.5
+# 信頼できる特徴点の割合がこれを下回ったら追従失敗とみなして再検出する
+MIN_TRACKED_RATIO = 0.5
+# 顔1つあたりに必要な最低限の特徴点数
+MIN_POINTS = 4
+
+# 差分ゲートで比較する縮小画像の長辺
+MOTION_GATE_SIZE = 160
+# 差分ゲートで前回の検出結果を使い回せる最大フレーム数（これを超えたら必ず検出する）
+MOTION_MAX_REUSE_FRAMES = 30
+# 画面全体の平均差分（0〜255）がこれ以上ならシーンの切り替わりとみなして必ず検出する
+SCENE_CUT_THRESHOLD = 30.0
+# 顔の周囲の差分を見る範囲（顔のサイズに対する余白の割合）
+MOTION_ROI_PADDING = 0.5
+# 顔が無い場合に画面を縦横この数に分割し、いずれかの区画の平均差分がしきい値を超えれば変化ありとする
+# （画面全体の平均だと、小さな顔が入ってきた場合の変化が薄まって見逃すため）
+MOTION_GRID = 8
+
+# ROI 検出で顔の周囲に加える余白（顔のサイズに対する割合、上下左右それぞれ）
+ROI_EXPANSION = 1.0
+# ROI 検出で切り出す領域の最小の辺（px）
+ROI_MIN_SIZE = 96
+
+
+def expand_region(box: tuple, width: int, height: int) -> tuple:
+    """
+    顔の周囲を含む切り出し領域を作成
+
+    Returns:
+        (x1, y1, x2, y2)（フレーム内に収める）
+    """
+    x, y, w, h = box
+    cx, cy = x + w / 2, y + h / 2
+    half_w = max(w * (0.5 + ROI_EXPANSION), ROI_MIN_SIZE / 2)
+    half_h = max(h * (0.5 + ROI_EXPANSION), ROI_MIN_SIZE / 2)
+    x1, y1 = max(0, int(cx - half_w)), max(0, int(cy - half_h))
+    x2, y2 = min(width, int(cx + half_w)), min(height, int(cy + half_h))
+    return x1, y1, max(x1 + 1, x2), max(y1 + 1, y2)
+
+
+def merge_regions(regions: list) -> list:
+    """重なる切り出し領域をまとめる（同じ顔を2回検出しないため）"""
+    merged = list(regions)
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(merged)):
+            for j in range(i + 1, len(merged)):
+                a, b = merged[i], merged[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    merged[i] = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+                    del merged[j]
+                    changed = True
+                    break
+            if changed:
+                break
+    return merged
+
+
+class RegionDetector:
+    """
+    前回検出した顔の周囲だけを切り出して検出する（ROI 検出）
+
+    切り出した領域で検出した座標はフレーム全体の座標に戻す。検出 full_scan_interval 回に1回と、
+    前回より顔が減った（顔を見失った）場合・前回の顔が無い場合は画面全体を検出して新しい顔を拾う。
+    高解像度で小さな顔が少ない動画では、検出器に渡す画像が大幅に小さくなる。
+    """
+
+    def __init__(self, full_scan_interval: int):
+        """
+        Args:
+            full_scan_interval: 画面全体を検出する間隔（検出の回数）
+        """
+        self.full_scan_interval = max(1, full_scan_interval)
+        self.full_scans = 0
+        self.roi_scans = 0
+        self._boxes: list = []
+        self._scans_since_full = 0
+
+    def detect(self, frame: np.ndarray, detect: Callable[[np.ndarray], list]) -> list:
+        """
+        フレームの顔を検出
+
+        Args:
+            frame: 入力フレーム (BGR)
+            detect: 画像を受け取り (x, y, w, h) のリストを返す顔検出関数
+
+        Returns:
+            顔のバウンディングボックス (x, y, w, h) のリスト（フレーム全体の座標）
+        """
+        if self._boxes and self._scans_since_full < self.full_scan_interval - 1:
+            boxes = self._detect_regions(frame, detect)
+            if boxes is not None:
+                self.roi_scans += 1
+                self._scans_since_full += 1
+                self._boxes = boxes
+                return boxes
+
+        self._boxes = detect(frame)
+        self.full_scans += 1
+        self._scans_since_full = 0
+        return self._boxes
+
+    def _detect_regions(self, frame: np.ndarray, detect: Callable[[np.ndarray], list]) -> Optional[list]:
+        """前回の顔の周囲だけを検出（前回より顔が減った場合は None）"""
+        height, width = frame.shape[:2]
+        regions = merge_regions([expand_region(box, width, height) for box in self._boxes])
+        boxes = []
+        for (x1, y1, x2, y2) in regions:
+            for (x, y, w, h) in detect(frame[y1:y2, x1:x2]):
+                boxes.append((x + x1, y + y1, w, h))
+        if len(boxes) < len(self._boxes):
+            return None
+        return boxes
+
+
+class MotionGate:
+    """
+    縮小したグレースケール画像の差分で、前回の検出からの変化の大きさを測る
+
+    前回の検出結果に顔があればその周囲、無ければ画面を区切った区画ごとの平均差分をしきい値と比べる。
+    比較の相手は直前のフレームではなく前回実際に検出したフレームのため、
+    少しずつ変化し続ける場合も差分が積み上がって再検出される。
+    """
+
+    def __init__(self, threshold: float):
+        """
+        Args:
+            threshold: 変化なしとみなす平均差分の上限（0〜255 の輝度差）
+        """
+        self.threshold = threshold
+        self._reference: Optional[np.ndarray] = None
+        self._scale = 1.0
+
+    def set_reference(self, frame: np.ndarray) -> None:
+        """検出を行ったフレームを比較の基準にする"""
+        self._reference = self._downsample(frame)
+
+    def is_static(self, frame: np.ndarray, boxes: list) -> bool:
+        """
+        基準のフレームから変化していないか
+
+        Args:
+            frame: 入力フレーム (BGR)
+            boxes: 基準のフレームでの顔の位置 (x, y, w, h) のリスト
+        """
+        if self._reference is None:
+            return False
+        small = self._downsample(frame)
+        if small.shape != self._reference.shape:
+            return False
+        diff = cv2.absdiff(small, self._reference)
+        overall = float(diff.mean())
+        if overall >= SCENE_CUT_THRESHOLD:
+            return False
+        if not boxes:
+            grid = cv2.resize(diff, (MOTION_GRID, MOTION_GRID), interpolation=cv2.INTER_AREA)
+            return float(grid.max()) < self.threshold
+
+        height, width = diff.shape
+        s = self._scale
+        for (x, y, w, h) in boxes:
+            pad_x, pad_y = w * MOTION_ROI_PADDING, h * MOTION_ROI_PADDING
+            x1 = min(width - 1, max(0, int((x - pad_x) * s)))
+            y1 = min(height - 1, max(0, int((y - pad_y) * s)))
+            x2 = max(x1 + 1, min(width, int((x + w + pad_x) * s) + 1))
+            y2 = max(y1 + 1, min(height, int((y + h + pad_y) * s) + 1))
+            if float(diff[y1:y2, x1:x2].mean()) >= self.threshold:
+                return False
+        return True
+
+    def _downsample(self, frame: np.ndarray) -> np.ndarray:
+        """差分用の縮小したグレースケール画像を作成（縮小してから色変換して軽くする）"""
+        height, width = frame.shape[:2]
+        self._scale = min(1.0, MOTION_GATE_SIZE / max(height, width))
+        if self._scale < 1.0:
+            frame = cv2.resize(
+                frame,
+                (max(1, int(width * self._scale)), max(1, int(height * self._scale))),
+                interpolation=cv2.INTER_AREA
+            )
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+
+class FaceTracker:
+    """
+    検出間隔（detect_stride）に応じて顔検出とトラッキングを切り替える
+
+    検出したフレームで顔領域の特徴点を取り、以降のフレームではその特徴点を追跡する。
+    トラッキングが崩れた（特徴点が失われた・前後方向の追跡が一致しない）場合は
+    検出間隔を待たずに再検出する。
+    motion_threshold を指定すると、検出のたびに MotionGate で前回の検出からの変化を確認し、
+    変化が小さければ検出を省略して前回の検出結果を使い回す（最大 MOTION_MAX_REUSE_FRAMES フレーム）。
+    full_scan_interval を指定すると、検出は RegionDetector で前回の顔の周囲だけに絞る。
+    """
+
+    def __init__(self, detect_stride: int = 1, motion_threshold: float = 0.0, full_scan_interval: int = 0):
+        """
+        Args:
+            detect_stride: 顔検出を行うフレーム間隔
+            motion_threshold: 差分ゲートのしきい値（0なら差分ゲートを使わない）
+            full_scan_interval: ROI 検出で画面全体を検出する間隔（検出の回数。0なら常に画面全体）
+        """
+        self.detect_stride = max(1, detect_stride)
+        self.boxes: list = []
+        self.detector_calls = 0
+        self.tracked_frames = 0
+        self.skipped_detections = 0
+        self._gate = MotionGate(motion_threshold) if motion_threshold > 0 else None
+        self.regions = RegionDetector(full_scan_interval) if full_scan_interval > 0 else None
+        self._detected_boxes: list = []
+        self._frames_since_detector = 0
+        self._prev_gray: Optional[np.ndarray] = None
+        self._points: Optional[list] = None
+        self._scale = 1.0
+        self._frames_since_detection = 0
+
+    def update(self, frame: np.ndarray, detect: Callable[[np.ndarray], list]) -> list:
+        """
+        フレームの顔の位置を取得
+
+        Args:
+            frame: 入力フレーム (BGR)
+            detect: フレームを受け取り (x, y, w, h) のリストを返す顔検出関数
+
+        Returns:
+            顔のバウンディングボックス (x, y, w, h) のリスト
+        """
+        self._frames_since_detector += 1
+        if self.detect_stride == 1:
+            self.boxes = self._detect(frame, detect)
+            return self.boxes
+
+        gray = self._to_gray(frame)
+
+        boxes = None
+        if self._points is not None and self._frames_since_detection < self.detect_stride - 1:
+            boxes = self._track(self._prev_gray, gray, frame.shape[:2])
+
+        if boxes is None:
+            boxes = self._detect(frame, detect)
+            self._frames_since_detection = 0
+            self._points = self._seed_points(gray, boxes)
+        else:
+            self.tracked_frames += 1
+            self._frames_since_detection += 1
+
+        self.boxes = boxes
+        self._prev_gray = gray
+        return boxes
+
+    def _detect(self, frame: np.ndarray, detect: Callable[[np.ndarray], list]) -> list:
+        """顔検出（差分ゲートが変化なしと判定した場合は前回の検出結果を使い回す）"""
+        if (
+            self._gate is not None
+            and self._frames_since_detector <= MOTION_MAX_REUSE_FRAMES
+            and self._gate.is_static(frame, self._detected_boxes)
+        ):
+            self.skipped_detections += 1
+            return self._detected_boxes
+
+        if self.regions is not None:
+            self._detected_boxes = self.regions.detect(frame, detect)
+        else:
+            self._detected_boxes = detect(frame)
+        self.detector_calls += 1
+        self._frames_since_detector = 0
+        if self._gate is not None:
+            self._gate.set_reference(frame)
+        return self._detected_boxes
+
+    def _to_gray(self, frame: np.ndarray) -> np.ndarray:
+        """トラッキング用に縮小したグレースケール画像を作成"""
+        height, width = frame.shape[:2]
+        self._scale = min(1.0, TRACKING_MAX_SIDE / max(height, width))
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self._scale < 1.0:
+            gray = cv2.resize(
+                gray,
+                (max(1, int(width * self._scale)), max(1, int(height * self._scale))),
+                interpolation=cv2.INTER_LINEAR
+            )
+        return gray
+
+    def _seed_points(self, gray: np.ndarray, boxes: list) -> Optional[list]:
+        """
+        検出した顔領域ごとに追跡用の特徴点を取る
+
+        Returns:
+            顔ごとの特徴点の配列のリスト。特徴点が足りない顔があれば None（次のフレームで再検出）
+        """
+        s = self._scale
+        points = []
+        for (x, y, w, h) in boxes:
+            sx, sy = max(0, int(x * s)), max(0, int(y * s))
+            sw, sh = max(1, int(w * s)), max(1, int(h * s))
+            mask = np.zeros_like(gray)
+            mask[sy:sy + sh, sx:sx + sw] = 255
+
+            p = cv2.goodFeaturesToTrack(
+                gray, maxCorners=MAX_CORNERS, qualityLevel=0.01, minDistance=3, mask=mask
+            )
+            if p is None or len(p) < MIN_POINTS:
+                return None
+            points.append(p)
+        return points
+
+    def _track(self, prev_gray: np.ndarray, gray: np.ndarray, frame_shape: tuple) -> Optional[list]:
+        """
+        前フレームの顔の位置をオプティカルフローで現在のフレームに移す
+
+        Returns:
+            追従後の (x, y, w, h) のリスト。追従に失敗した顔が1つでもあれば None
+        """
+        height, width = frame_shape
+        s = self._scale
+        tracked = []
+        next_all = []
+
+        for (x, y, w, h), points in zip(self.boxes, self._points):
+            # 前方・後方の両方向で追跡し、一致する特徴点だけを使う
+            next_points, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray, points, None)
+            back_points, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, prev_gray, next_points, None)
+            fb_error = np.linalg.norm(points - back_points, axis=2).ravel()
+            good = (status.ravel() == 1) & (back_status.ravel() == 1) & (fb_error < MAX_FB_ERROR)
+
+            if good.sum() < max(MIN_POINTS, MIN_TRACKED_RATIO * len(points)):
+                return None
+
+            old = points[good].reshape(-1, 2)
+            new = next_points[good].reshape(-1, 2)
+
+            # 移動量は中央値、拡大率は特徴点間の距離の比の中央値（Median Flow）
+            dx, dy = np.median(new - old, axis=0)
+            old_dist = np.linalg.norm(old[:, None] - old[None, :], axis=2)
+            new_dist = np.linalg.norm(new[:, None] - new[None, :], axis=2)
+            valid = old_dist > 0
+            scale = float(np.median(new_dist[valid] / old_dist[valid])) if valid.any() else 1.0
+
+            cx = x + w / 2 + dx / s
+            cy = y + h / 2 + dy / s
+            nw, nh = w * scale, h * scale
+            # 切り捨てると追従するフレームごとに左上へずれが積み重なるため四捨五入する
+            nx = round(max(0, cx - nw / 2))
+            ny = round(max(0, cy - nh / 2))
+            nw = round(min(width - nx, nw))
+            nh = round(min(height - ny, nh))
+            if nw <= 0 or nh <= 0:
+                return None
+            tracked.append((nx, ny, nw, nh))
+            next_all.append(next_points[good].reshape(-1, 1, 2))
+
+        self._points = next_all
+        return tracked